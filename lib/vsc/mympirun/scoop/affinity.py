@@ -0,0 +1,246 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Topology aware affinity algorithms for the SCOOP workers
+    the topology is read from /sys/devices/system/cpu and /sys/devices/system/node
+    (only the cpus in the current affinity mask are used, so cgroups/cpusets are respected)
+    the memory policy is bound to the NUMA nodes of the selected cpus
+
+algorithms (for worker worker_idx_host of total_workers_host workers on the host)
+    numacompact : one core (with all its hardware threads) per worker, NUMA node after NUMA node
+    socketspread : one core (with all its hardware threads) per worker, round-robin over the sockets
+    nosmt : one hardware thread per worker, only the first thread of each core is used
+    reserve : block of contiguous cores per worker, NUMA node after NUMA node
+        the number of cores is the SCOOP_CORES_PER_WORKER environment variable
+        or all cores divided over the workers (eg for mympirun --hybrid)
+if there are more workers than cores (or hardware threads for nosmt), the cores are oversubscribed
+"""
+import ctypes
+import ctypes.util
+import glob
+import os
+import platform
+import re
+from vsc.mympirun.scoop.worker_utils import get_scoop_env
+
+SYSFS_CPU = '/sys/devices/system/cpu'
+SYSFS_NODE = '/sys/devices/system/node'
+PROC_STATUS = '/proc/self/status'
+
+ALGORITHM_NUMACOMPACT = 'numacompact'
+ALGORITHM_SOCKETSPREAD = 'socketspread'
+ALGORITHM_NOSMT = 'nosmt'
+ALGORITHM_RESERVE = 'reserve'
+TOPOLOGY_ALGORITHMS = [ALGORITHM_NUMACOMPACT, ALGORITHM_SOCKETSPREAD, ALGORITHM_NOSMT, ALGORITHM_RESERVE]
+
+# set_mempolicy/get_mempolicy syscall numbers per architecture
+SYSCALL_SET_MEMPOLICY = {'x86_64': 238, 'aarch64': 237, 'ppc64': 261, 'ppc64le': 261, 'i686': 276}
+SYSCALL_GET_MEMPOLICY = {'x86_64': 239, 'aarch64': 236, 'ppc64': 260, 'ppc64le': 260, 'i686': 275}
+MPOL_BIND = 2
+MAX_NUMA_NODES = 1024
+
+_libc = None
+
+
+def _get_libc():
+    """Return the (cached) libc ctypes handle"""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    return _libc
+
+
+def parse_cpulist(txt):
+    """Parse a kernel cpu/node list (eg 0-3,8,10-11), return sorted list of ints"""
+    res = []
+    for item in txt.strip().split(','):
+        if not item:
+            continue
+        if '-' in item:
+            first, last = item.split('-')
+            res.extend(range(int(first), int(last) + 1))
+        else:
+            res.append(int(item))
+    return sorted(res)
+
+
+def format_cpulist(cpus):
+    """Format a list of ints as kernel cpu/node list (eg 0-3,8,10-11)"""
+    res = []
+    cpus = sorted(set(cpus))
+    idx = 0
+    while idx < len(cpus):
+        last = idx
+        while last + 1 < len(cpus) and cpus[last + 1] == cpus[last] + 1:
+            last += 1
+        if last == idx:
+            res.append("%s" % cpus[idx])
+        else:
+            res.append("%s-%s" % (cpus[idx], cpus[last]))
+        idx = last + 1
+    return ','.join(res)
+
+
+def _read(fn, default=None):
+    """Return stripped content of fn, default if it can't be read"""
+    try:
+        return open(fn).read().strip()
+    except IOError:
+        return default
+
+
+def get_cpus_allowed(status=PROC_STATUS):
+    """Return the list of cpus in the affinity mask of the current process"""
+    return parse_cpulist(re.search(r'^Cpus_allowed_list:\s*(\S+)', open(status).read(), re.M).group(1))
+
+
+class Topology(object):
+    """Cores, sockets and NUMA nodes of the cpus in the current affinity mask"""
+    def __init__(self, sysfs_cpu=SYSFS_CPU, sysfs_node=SYSFS_NODE, cpus=None):
+        if cpus is None:
+            cpus = get_cpus_allowed()
+        self.sysfs_cpu = sysfs_cpu
+        self.sysfs_node = sysfs_node
+
+        node_of = {}
+        for nodedir in glob.glob(os.path.join(sysfs_node, 'node[0-9]*')):
+            node = int(os.path.basename(nodedir)[len('node'):])
+            for cpu in parse_cpulist(_read(os.path.join(nodedir, 'cpulist'), '')):
+                node_of[cpu] = node
+
+        # (node, socket, core_id) -> list of hardware threads
+        cores = {}
+        for cpu in cpus:
+            topodir = os.path.join(sysfs_cpu, 'cpu%s' % cpu, 'topology')
+            socket = int(_read(os.path.join(topodir, 'physical_package_id'), 0))
+            core_id = int(_read(os.path.join(topodir, 'core_id'), cpu))
+            cores.setdefault((node_of.get(cpu, 0), socket, core_id), []).append(cpu)
+
+        self.node_of = node_of
+        # list of (node, socket, threads), in NUMA node, socket and first thread order
+        self.cores = [(key[0], key[1], sorted(threads)) for key, threads in cores.items()]
+        self.cores.sort(key=lambda x: (x[0], x[1], x[2][0]))
+
+    def subset(self, cpus):
+        """Return the Topology of the cpus (of this topology)"""
+        return Topology(sysfs_cpu=self.sysfs_cpu, sysfs_node=self.sysfs_node, cpus=cpus)
+
+    def sockets(self):
+        """Return dict socket -> list of cores (as list of threads), in compact order"""
+        res = {}
+        for _, socket, threads in self.cores:
+            res.setdefault(socket, []).append(threads)
+        return res
+
+    def nodes(self, cpus):
+        """Return the sorted list of NUMA nodes of cpus"""
+        return sorted(set([self.node_of.get(cpu, 0) for cpu in cpus]))
+
+    def select(self, algorithm, total_workers_host, worker_idx_host, cores_per_worker=None):
+        """Return the list of cpus for worker worker_idx_host of total_workers_host with algorithm"""
+        total_workers_host = max(int(total_workers_host), 1)
+        worker_idx_host = int(worker_idx_host)
+        ncores = len(self.cores)
+
+        if algorithm == ALGORITHM_NUMACOMPACT:
+            return self.cores[worker_idx_host % ncores][2]
+        elif algorithm == ALGORITHM_NOSMT:
+            threads = [x[2][0] for x in self.cores]
+            return [threads[worker_idx_host % len(threads)]]
+        elif algorithm == ALGORITHM_SOCKETSPREAD:
+            sockets = self.sockets()
+            socket_ids = sorted(sockets.keys())
+            socket_cores = sockets[socket_ids[worker_idx_host % len(socket_ids)]]
+            return socket_cores[(worker_idx_host // len(socket_ids)) % len(socket_cores)]
+        elif algorithm == ALGORITHM_RESERVE:
+            if not cores_per_worker:
+                cores_per_worker = max(ncores // total_workers_host, 1)
+            cpus = []
+            for idx in xrange(worker_idx_host * cores_per_worker, (worker_idx_host + 1) * cores_per_worker):
+                cpus.extend(self.cores[idx % ncores][2])
+            return sorted(cpus)
+        else:
+            raise ValueError("Unknown topology affinity algorithm %s (supported %s)" %
+                             (algorithm, TOPOLOGY_ALGORITHMS))
+
+
+def set_cpu_affinity(cpus):
+    """Set the affinity of the current process to the list of cpus (with sched_setaffinity)"""
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+    mask = (ctypes.c_ulong * (max(cpus) // bits + 1))()
+    for cpu in cpus:
+        mask[cpu // bits] |= 1 << (cpu % bits)
+    if _get_libc().sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        raise OSError(ctypes.get_errno(), "sched_setaffinity to %s failed" % format_cpulist(cpus))
+
+
+def set_membind(nodes):
+    """Bind the memory policy of the current process to the list of NUMA nodes (with set_mempolicy)"""
+    syscall = SYSCALL_SET_MEMPOLICY.get(platform.machine())
+    if syscall is None:
+        raise OSError(0, "set_mempolicy syscall unknown for architecture %s" % platform.machine())
+
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+    mask = (ctypes.c_ulong * (max(nodes) // bits + 1))()
+    for node in nodes:
+        mask[node // bits] |= 1 << (node % bits)
+    # the kernel expects maxnode to be one more than the number of bits in the mask
+    if _get_libc().syscall(syscall, MPOL_BIND, ctypes.byref(mask), ctypes.c_ulong(len(mask) * bits + 1)) != 0:
+        raise OSError(ctypes.get_errno(), "set_mempolicy to nodes %s failed" % format_cpulist(nodes))
+
+
+def get_membind():
+    """Return (mode, list of NUMA nodes) of the memory policy of the current process (with get_mempolicy)
+        returns None if not available
+    """
+    syscall = SYSCALL_GET_MEMPOLICY.get(platform.machine())
+    if syscall is None:
+        return None
+
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+    mode = ctypes.c_int()
+    mask = (ctypes.c_ulong * (MAX_NUMA_NODES // bits))()
+    if _get_libc().syscall(syscall, ctypes.byref(mode), ctypes.byref(mask), ctypes.c_ulong(MAX_NUMA_NODES),
+                           ctypes.c_ulong(0), ctypes.c_ulong(0)) != 0:
+        return None
+    nodes = [idx for idx in xrange(MAX_NUMA_NODES) if mask[idx // bits] & (1 << (idx % bits))]
+    return mode.value, nodes
+
+
+def set_topology_affinity(algorithm, total_workers_host, worker_idx_host, topology=None):
+    """Bind the current process to the cpus selected by algorithm, and its memory to their NUMA nodes
+        returns (cpus, nodes)
+    """
+    if topology is None:
+        topology = Topology()
+    cpus = topology.select(algorithm, total_workers_host, worker_idx_host,
+                           cores_per_worker=get_scoop_env('cores_per_worker', int))
+    nodes = topology.nodes(cpus)
+
+    set_cpu_affinity(cpus)
+    set_membind(nodes)
+
+    return cpus, nodes
@@ -0,0 +1,161 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Broker benchmark: task throughput of the broker placements of brokers.py, for a range of cores
+    runs locally with multiprocessing (no SCOOP needed): the origin sends the tasks to the broker process,
+    the broker routes them to the workers and the results back to the origin (like the SCOOP broker)
+        origin : one worker per core (numacompact), the broker and the origin are not bound (they share the cores
+            with the workers, like SCOOP does by default)
+        reserve : the cpus of brokers.reserve_broker_cpus are reserved for the broker and the origin, one worker
+            per remaining core (one worker less), laid out like myscoop does on the broker host
+    the break-even is the smallest number of cores from which reserve has the higher throughput
+    (brokers.RESERVE_MIN_WORKERS is the threshold of the auto placement)
+    e.g. python -m vsc.mympirun.scoop.benchmark.broker 20000 50 2,4,8,16
+    arg1 = number of tasks, arg2 = duration of a task in microseconds,
+    arg3 = comma-separated numbers of cores to use (default powers of 2 up to all cores)
+"""
+import sys
+import time
+from multiprocessing import Process, Queue
+from vsc.mympirun.scoop.affinity import ALGORITHM_NUMACOMPACT, Topology, get_cpus_allowed, set_cpu_affinity
+from vsc.mympirun.scoop.brokers import BROKER_ORIGIN, BROKER_RESERVE, RESERVE_MIN_WORKERS, reserve_broker_cpus
+
+NAME = 'benchmark_broker'
+
+MODES = [BROKER_ORIGIN, BROKER_RESERVE]
+
+
+def busy(duration):
+    """Keep the cpu busy for duration seconds"""
+    end = time.time() + duration
+    while time.time() < end:
+        pass
+
+
+def run_broker(cpus, broker_q, work_q, result_q, nr_workers):
+    """Route the tasks to the workers and the results to the origin, until all workers stopped"""
+    set_cpu_affinity(cpus)
+    stopped = 0
+    while stopped < nr_workers:
+        kind, msg = broker_q.get()
+        if kind == 'task':
+            work_q.put(msg)
+        elif kind == 'result':
+            result_q.put(msg)
+        elif kind == 'stopped':
+            stopped += 1
+
+
+def run_worker(cpus, work_q, broker_q, duration):
+    """Run the tasks until a None task is received"""
+    set_cpu_affinity(cpus)
+    while True:
+        task = work_q.get()
+        if task is None:
+            break
+        busy(duration)
+        broker_q.put(('result', task))
+    broker_q.put(('stopped', cpus))
+
+
+def get_layout(mode, topology):
+    """Return (cpus of the broker and the origin, list of cpus per worker) for mode on the cores of topology"""
+    if mode == BROKER_RESERVE:
+        broker_cpus, compute = reserve_broker_cpus(topology)
+        topology = topology.subset(compute)
+    else:
+        broker_cpus = sorted([cpu for _, _, threads in topology.cores for cpu in threads])
+    nr_workers = len(topology.cores)
+    return broker_cpus, [topology.select(ALGORITHM_NUMACOMPACT, nr_workers, idx) for idx in xrange(nr_workers)]
+
+
+def run_mode(mode, topology, nr_tasks, duration):
+    """Run nr_tasks tasks of duration seconds, return the number of tasks per second"""
+    broker_cpus, worker_cpus = get_layout(mode, topology)
+
+    broker_q, work_q, result_q = Queue(), Queue(), Queue()
+    broker = Process(target=run_broker, args=(broker_cpus, broker_q, work_q, result_q, len(worker_cpus)))
+    workers = [Process(target=run_worker, args=(cpus, work_q, broker_q, duration)) for cpus in worker_cpus]
+    broker.start()
+    for worker in workers:
+        worker.start()
+
+    # the origin runs next to the broker
+    orig_cpus = get_cpus_allowed()
+    set_cpu_affinity(broker_cpus)
+    s_t = time.time()
+    for idx in xrange(nr_tasks):
+        broker_q.put(('task', idx))
+    for _ in xrange(nr_tasks):
+        result_q.get()
+    delta = time.time() - s_t
+    set_cpu_affinity(orig_cpus)
+
+    for _ in workers:
+        broker_q.put(('task', None))
+    for worker in workers:
+        worker.join()
+    broker.join()
+
+    return nr_tasks / delta
+
+
+if __name__ == '__main__':
+    nr_tasks = 20000
+    duration_us = 50
+    topology = Topology()
+    ncores = len(topology.cores)
+    core_counts = [2 ** x for x in range(1, 32) if 2 ** x < ncores] + [ncores]
+    try:
+        nr_tasks = int(sys.argv[1])
+        duration_us = int(sys.argv[2])
+        core_counts = [int(x) for x in sys.argv[3].split(',')]
+    except:
+        pass
+
+    if ncores < 2:
+        print "BROKER benchmark needs at least 2 cores, %s available" % ncores
+        sys.exit(1)
+
+    breakeven = None
+    for cores in [x for x in core_counts if 2 <= x <= ncores]:
+        cores_topology = topology.subset([cpu for _, _, threads in topology.cores[:cores] for cpu in threads])
+        results = {}
+        for mode in MODES:
+            results[mode] = run_mode(mode, cores_topology, nr_tasks, duration_us * 1e-6)
+            print "BROKER %s cores %d tasks %d duration %dus tasks/sec %f" % (mode, cores, nr_tasks, duration_us,
+                                                                             results[mode])
+        ratio = results[BROKER_RESERVE] / results[BROKER_ORIGIN]
+        print "BROKER cores %d reserve/origin throughput ratio %.2f" % (cores, ratio)
+        if ratio >= 1 and breakeven is None:
+            breakeven = cores
+
+    if breakeven is None:
+        print "BROKER reserve does not pay off up to %s cores (auto reserves from %s workers)" % (max(core_counts),
+                                                                                                 RESERVE_MIN_WORKERS)
+    else:
+        print "BROKER reserve pays off from %s cores (auto reserves from %s workers)" % (breakeven,
+                                                                                        RESERVE_MIN_WORKERS)
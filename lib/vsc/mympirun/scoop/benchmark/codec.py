@@ -0,0 +1,95 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Codec benchmark: throughput of the result transport versus output size, per result codec
+    runs locally, measures encode, pickle (as SCOOP does for the transport), unpickle and decode
+    of one (ec, output) result (no SCOOP needed)
+    e.g. python -m vsc.mympirun.scoop.benchmark.codec 1024,65536,1048576,16777216 none,zlib,lz4
+    arg1 = comma-separated list of output sizes in bytes, arg2 = comma-separated list of codecs
+"""
+import cPickle
+import sys
+import time
+from vsc.mympirun.scoop.worker_utils import encode_result, decode_result, CODECS, CODEC_LZ4, has_lz4
+
+NAME = 'benchmark_codec'
+
+# total number of bytes to transport per size, so small sizes are repeated enough for a stable measurement
+TOTAL_BYTES = 64 * 1024 * 1024
+
+
+def make_output(size):
+    """Generate size bytes of typical command output (numbered lines of text and numbers)"""
+    lines = []
+    total = 0
+    idx = 0
+    while total < size:
+        line = "step %08d energy %.10f residual %.6e converged %s\n" % (idx, -1.0 / (idx + 1), 1.0 / (idx + 7),
+                                                                      idx % 3 == 0)
+        lines.append(line)
+        total += len(line)
+        idx += 1
+    return ''.join(lines)[:size]
+
+
+def run_codec(output, codec, repeat):
+    """Transport the output repeat times with codec
+        returns (duration in seconds, number of bytes on the wire per result)
+    """
+    s_t = time.time()
+    for _ in xrange(repeat):
+        wire = cPickle.dumps((0, encode_result(output, codec=codec, threshold=0)), cPickle.HIGHEST_PROTOCOL)
+        ec, out = cPickle.loads(wire)
+        out = decode_result(out)
+    delta = time.time() - s_t
+
+    if out != output:
+        raise Exception("run_codec: codec %s did not return the original output" % codec)
+
+    return delta, len(wire)
+
+
+if __name__ == '__main__':
+    sizes = [1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+    codecs = CODECS
+    try:
+        sizes = [int(x) for x in sys.argv[1].split(',')]
+        codecs = sys.argv[2].split(',')
+    except:
+        pass
+
+    for size in sizes:
+        output = make_output(size)
+        repeat = max(TOTAL_BYTES // size, 1)
+        for codec in codecs:
+            if codec == CODEC_LZ4 and not has_lz4():
+                print "CODEC %s skipped, no lz4 module" % codec
+                continue
+            delta, wire = run_codec(output, codec, repeat)
+            print "CODEC %s size %d wire %d (ratio %.2f) results/sec %f MB/sec %f" % (codec, size, wire,
+                                                                                    1.0 * size / wire,
+                                                                                    repeat / delta,
+                                                                                    repeat * size / delta / 2 ** 20)
@@ -0,0 +1,82 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Dispatch benchmark: tasks/sec for per-item versus chunked futures
+    e.g. myscoop --sched=local --scoop_module=vsc.mympirun.scoop.benchmark.dispatch 100000 1,0,100
+    arg1 = nr_tasks, arg2 = comma-separated list of chunksizes (0 is automatic)
+"""
+import sys
+import time
+from vsc.mympirun.scoop.worker_utils import get_chunksize, make_chunks, fix_freeorigin
+from scoop import futures
+
+NAME = 'benchmark_dispatch'
+
+
+def empty_task(counter):
+    """Task that does nothing"""
+    return counter
+
+
+def empty_chunk(counters):
+    """Block of tasks that do nothing"""
+    return [empty_task(counter) for counter in counters]
+
+
+def run_dispatch(nr_tasks, chunksize):
+    """Run nr_tasks empty tasks with chunksize tasks per future
+        returns (effective chunksize, duration in seconds)
+    """
+    chunksize = get_chunksize(nr_tasks, chunksize=chunksize)
+    s_t = time.time()
+    if chunksize > 1:
+        res = [x for chunk in futures.map(empty_chunk, make_chunks(0, nr_tasks, 1, chunksize)) for x in chunk]
+    else:
+        res = [x for x in futures.map(empty_task, xrange(nr_tasks))]
+    delta = time.time() - s_t
+
+    if len(res) != nr_tasks:
+        raise Exception("run_dispatch: expected %s results, got %s" % (nr_tasks, len(res)))
+
+    return chunksize, delta
+
+
+if __name__ == '__main__':
+    nr_tasks = 10000
+    chunksizes = [1, 0]
+    try:
+        nr_tasks = int(sys.argv[1])
+        chunksizes = [int(x) for x in sys.argv[2].split(',')]
+    except:
+        pass
+
+    fix_freeorigin()
+
+    for chunksize in chunksizes:
+        effective, delta = run_dispatch(nr_tasks, chunksize)
+        print "DISPATCH nr_tasks %d chunksize %d (requested %d) duration %fs tasks/sec %f" % (nr_tasks, effective,
+                                                                                             chunksize, delta,
+                                                                                             nr_tasks / delta)
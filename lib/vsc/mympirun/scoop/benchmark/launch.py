@@ -0,0 +1,73 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Launch benchmark: time to launch all hosts for sequential versus concurrent launch
+    a stub launcher (a local sleep command) stands in for ssh, so this runs locally (no SCOOP needed)
+    e.g. python -m vsc.mympirun.scoop.benchmark.launch 200 0.05 1,8,32
+    arg1 = nr_hosts, arg2 = stub launch latency in seconds, arg3 = comma-separated list of concurrencies
+"""
+import subprocess
+import sys
+import time
+from vsc.mympirun.scoop.launch import LaunchEngine
+
+NAME = 'benchmark_launch'
+
+
+def stub_launcher(latency):
+    """Stand-in for the ssh launch of a host"""
+    subprocess.call(['sleep', str(latency)])
+
+
+def run_launch(nr_hosts, latency, concurrency):
+    """Launch nr_hosts stub hosts, return (duration in seconds, LaunchEngine instance)
+        the last host is launched like the origin host (after all others)
+    """
+    s_t = time.time()
+    engine = LaunchEngine(concurrency)
+    for idx in xrange(nr_hosts - 1):
+        engine.submit("node%05d" % idx, stub_launcher, latency)
+    engine.wait()
+    engine.run("node%05d" % (nr_hosts - 1), stub_launcher, latency)
+    return time.time() - s_t, engine
+
+
+if __name__ == '__main__':
+    nr_hosts = 200
+    latency = 0.05
+    concurrencies = [1, 8, 32]
+    try:
+        nr_hosts = int(sys.argv[1])
+        latency = float(sys.argv[2])
+        concurrencies = [int(x) for x in sys.argv[3].split(',')]
+    except:
+        pass
+
+    for concurrency in concurrencies:
+        delta, engine = run_launch(nr_hosts, latency, concurrency)
+        latencies = [x[1] for x in engine.latencies]
+        print "LAUNCH nr_hosts %d concurrency %d duration %fs host latency min %fs avg %fs max %fs" % (
+              nr_hosts, concurrency, delta, min(latencies), sum(latencies) / len(latencies), max(latencies))
@@ -0,0 +1,188 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Benchmark suite runner: run the suite (see vsc.mympirun.scoop.benchmark.suite) with myscoop --sched=local
+for a range of worker counts, with freeorigin off and on, and compare results of different versions
+    python -m vsc.mympirun.scoop.benchmark.run run results.json 1,2,4,8 10000
+        arg2 = JSON output file, arg3 = comma-separated list of worker counts, arg4 = nr_tasks
+    python -m vsc.mympirun.scoop.benchmark.run compare old.json new.json 0.1
+        arg2, arg3 = JSON files of two runs, arg4 = relative change that is reported as regression
+        exits with exitcode 1 if there are regressions
+"""
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from vsc.mympirun.scoop.worker_utils import set_scoop_env
+
+NAME = 'benchmark_run'
+
+MYSCOOP = 'myscoop'
+SUITE_MODULE = 'vsc.mympirun.scoop.benchmark.suite'
+REGRESSION_THRESHOLD = 0.1
+
+
+def get_version():
+    """Return the installed vsc-mympirun-scoop version (None if unknown)"""
+    try:
+        import pkg_resources  # do the import only here
+        return pkg_resources.get_distribution('vsc-mympirun-scoop').version
+    except Exception:
+        return None
+
+
+def run_myscoop(workers, freeorigin, nr_tasks):
+    """Run the suite with myscoop for workers workers, return the results dict (None if it failed)"""
+    fd, output = tempfile.mkstemp(prefix='%s_' % NAME, suffix='.json')
+    os.close(fd)
+
+    cmd = [MYSCOOP, '--sched=local', '--hybrid=%s' % workers, '--scoop_module=%s' % SUITE_MODULE]
+    if freeorigin:
+        cmd.append('--scoop_freeorigin')
+    cmd.extend([output, str(nr_tasks)])
+
+    set_scoop_env('benchmark_start', "%f" % time.time())
+    ec = subprocess.call(cmd)
+    try:
+        results = json.load(open(output))
+    except (IOError, ValueError):
+        results = None
+    os.remove(output)
+
+    if ec != 0 or results is None:
+        print "BENCHMARK %s failed with exitcode %s" % (' '.join(cmd), ec)
+        return None
+    return results
+
+
+def run(output, worker_counts, nr_tasks):
+    """Run the suite for all worker counts, with freeorigin off and on, and write the results to output"""
+    runs = []
+    for workers in worker_counts:
+        for freeorigin in (False, True):
+            results = run_myscoop(workers, freeorigin, nr_tasks)
+            if results is not None:
+                # the requested number of workers (the suite reports the number SCOOP started)
+                results['requested_workers'] = workers
+                runs.append(results)
+
+    summary = {
+        'version': get_version(),
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'time': time.time(),
+        'runs': runs,
+    }
+    fh = open(output, 'w')
+    json.dump(summary, fh, indent=4, sort_keys=True)
+    fh.close()
+    print "BENCHMARK %s runs written to %s" % (len(runs), output)
+
+
+def flatten(summary):
+    """Return dict (workers, freeorigin, metric) -> value of the runs in summary"""
+    res = {}
+    for results in summary['runs']:
+        for metric, value in results['metrics'].items():
+            res[(results['requested_workers'], results['freeorigin'], metric)] = value
+    return res
+
+
+def is_regression(metric, old, new, threshold):
+    """Is the change from old to new of metric worse than threshold (relative)
+        metrics ending in _per_s are rates (higher is better), the others (ending in _s) are durations
+    """
+    if not old:
+        return False
+    change = (new - old) / old
+    if metric.endswith('_per_s'):
+        return change < -threshold
+    return change > threshold
+
+
+def compare(old_fn, new_fn, threshold=REGRESSION_THRESHOLD):
+    """Print the changes of all metrics between two results files, return the number of regressions"""
+    old_summary = json.load(open(old_fn))
+    new_summary = json.load(open(new_fn))
+    print "COMPARE %s (version %s) with %s (version %s)" % (old_fn, old_summary['version'],
+                                                            new_fn, new_summary['version'])
+
+    old = flatten(old_summary)
+    new = flatten(new_summary)
+    regressions = 0
+    for key in sorted(set(old.keys()) & set(new.keys())):
+        workers, freeorigin, metric = key
+        change = 0.0
+        if old[key]:
+            change = 100.0 * (new[key] - old[key]) / old[key]
+        flag = ''
+        if is_regression(metric, old[key], new[key], threshold):
+            flag = ' REGRESSION'
+            regressions += 1
+        print "  workers %s freeorigin %s %s %g -> %g (%+.1f%%)%s" % (workers, freeorigin, metric, old[key],
+                                                                     new[key], change, flag)
+    for key in sorted(set(old.keys()) ^ set(new.keys())):
+        print "  workers %s freeorigin %s %s only in one of the results" % key
+
+    print "COMPARE %s regressions (threshold %.0f%%)" % (regressions, 100 * threshold)
+    return regressions
+
+
+if __name__ == '__main__':
+    mode = None
+    try:
+        mode = sys.argv[1]
+    except IndexError:
+        pass
+
+    if mode == 'run':
+        output = 'scoop_benchmark.json'
+        worker_counts = [1, 2, 4]
+        nr_tasks = 10000
+        try:
+            output = sys.argv[2]
+            worker_counts = [int(x) for x in sys.argv[3].split(',')]
+            nr_tasks = int(sys.argv[4])
+        except:
+            pass
+        run(output, worker_counts, nr_tasks)
+    elif mode == 'compare' and len(sys.argv) >= 4:
+        threshold = REGRESSION_THRESHOLD
+        try:
+            threshold = float(sys.argv[4])
+        except:
+            pass
+        if compare(sys.argv[2], sys.argv[3], threshold=threshold):
+            sys.exit(1)
+    else:
+        print __doc__
+        sys.exit(1)
@@ -0,0 +1,75 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Shell benchmark: tasks/sec for fork-per-task versus persistent shell command execution
+    runs locally, measures the per-task overhead of a single worker (no SCOOP needed)
+    e.g. python -m vsc.mympirun.scoop.benchmark.shell 1000 'echo $SCOOP_COUNTER'
+    arg1 = nr_tasks, arg2 = command
+"""
+import sys
+import time
+from vsc.utils.run import run_simple
+from vsc.mympirun.scoop.run import run_command, run_persistent
+from vsc.mympirun.scoop.worker_utils import set_scoop_env
+
+NAME = 'benchmark_shell'
+
+
+def _run_simple(cmd):
+    """Original simple_shell execution"""
+    return run_simple(cmd, disable_log=True)
+
+
+RUN_FUNCTIONS = [
+    ('run_simple', _run_simple),
+    ('run_command', run_command),
+    ('run_persistent', run_persistent),
+]
+
+
+def run_shell(nr_tasks, cmd, run_func):
+    """Run cmd nr_tasks times with run_func, return duration in seconds"""
+    s_t = time.time()
+    for counter in xrange(nr_tasks):
+        set_scoop_env('counter', counter)
+        ec, _ = run_func(cmd)
+        if ec != 0:
+            raise Exception("run_shell: cmd %s failed with exitcode %s" % (cmd, ec))
+    return time.time() - s_t
+
+
+if __name__ == '__main__':
+    nr_tasks = 1000
+    cmd = 'echo $SCOOP_COUNTER'
+    try:
+        nr_tasks = int(sys.argv[1])
+        cmd = sys.argv[2]
+    except:
+        pass
+
+    for name, run_func in RUN_FUNCTIONS:
+        delta = run_shell(nr_tasks, cmd, run_func)
+        print "SHELL %s nr_tasks %d duration %fs tasks/sec %f" % (name, nr_tasks, delta, nr_tasks / delta)
@@ -0,0 +1,143 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Benchmark suite worker module: dispatch overhead and scaling of one myscoop run
+    e.g. myscoop --sched=local --hybrid=4 --scoop_module=vsc.mympirun.scoop.benchmark.suite results.json 10000
+    arg1 = JSON output file, arg2 = nr_tasks for the throughput and payload measurements
+    (use vsc.mympirun.scoop.benchmark.run to run it for a range of worker counts, and to compare results)
+
+metrics (names end in _s for durations in seconds, lower is better; in _per_s for rates, higher is better)
+    latency_*_s : round trip of a single empty task (submit and wait for the result)
+    throughput_tasks_per_s : empty tasks/sec with all workers busy
+    payload_<size>_tasks_per_s, payload_<size>_mb_per_s : tasks that send and return size bytes
+    startup_s : time from SCOOP_BENCHMARK_START (set by the runner before myscoop starts) to the first task result
+"""
+import socket
+import sys
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from scoop import futures
+from vsc.mympirun.scoop.worker_utils import get_scoop_env, get_scoop_env_bool, fix_freeorigin
+
+NAME = 'benchmark_suite'
+
+LATENCY_TASKS = 200
+PAYLOAD_SIZES = [1024, 64 * 1024, 1024 * 1024]
+# the payload measurement sends at most this many bytes per size
+PAYLOAD_TOTAL_BYTES = 256 * 1024 * 1024
+
+
+def empty_task(counter):
+    """Task that does nothing"""
+    return counter
+
+
+def payload_task(payload):
+    """Task that returns its payload"""
+    return payload
+
+
+def measure_startup():
+    """Time from SCOOP_BENCHMARK_START to the result of the first task, None if not set"""
+    start = get_scoop_env('benchmark_start', float)
+    futures.submit(empty_task, 0).result()
+    if start is None:
+        return None
+    return time.time() - start
+
+
+def measure_latency(nr_tasks=LATENCY_TASKS):
+    """Return (min, avg, max) round trip time of a single empty task"""
+    deltas = []
+    for counter in xrange(nr_tasks):
+        s_t = time.time()
+        futures.submit(empty_task, counter).result()
+        deltas.append(time.time() - s_t)
+    return min(deltas), sum(deltas) / len(deltas), max(deltas)
+
+
+def measure_throughput(nr_tasks):
+    """Return empty tasks/sec"""
+    s_t = time.time()
+    for _ in futures.map(empty_task, xrange(nr_tasks)):
+        pass
+    return nr_tasks / (time.time() - s_t)
+
+
+def measure_payload(nr_tasks, size):
+    """Return (tasks/sec, MB/sec) of tasks that send and return size bytes"""
+    nr_tasks = max(min(nr_tasks, PAYLOAD_TOTAL_BYTES // size), 1)
+    payload = 'x' * size
+    s_t = time.time()
+    for _ in futures.map(payload_task, [payload] * nr_tasks):
+        pass
+    delta = time.time() - s_t
+    return nr_tasks / delta, 2.0 * nr_tasks * size / delta / 2 ** 20
+
+
+def run_suite(nr_tasks):
+    """Run all measurements, return dict with the metadata and the metrics"""
+    results = {
+        'workers': get_scoop_env('size', int),
+        'freeorigin': get_scoop_env_bool('worker_freeorigin'),
+        'host': socket.gethostname(),
+        'nr_tasks': nr_tasks,
+        'time': time.time(),
+    }
+    metrics = {}
+    metrics['startup_s'] = measure_startup()
+    metrics['latency_min_s'], metrics['latency_avg_s'], metrics['latency_max_s'] = measure_latency()
+    metrics['throughput_tasks_per_s'] = measure_throughput(nr_tasks)
+    for size in PAYLOAD_SIZES:
+        tasks_per_s, mb_per_s = measure_payload(nr_tasks, size)
+        metrics['payload_%s_tasks_per_s' % size] = tasks_per_s
+        metrics['payload_%s_mb_per_s' % size] = mb_per_s
+    results['metrics'] = dict([(k, v) for k, v in metrics.items() if v is not None])
+    return results
+
+
+if __name__ == '__main__':
+    output = None
+    nr_tasks = 10000
+    try:
+        output = sys.argv[1]
+        nr_tasks = int(sys.argv[2])
+    except:
+        pass
+
+    fix_freeorigin()
+
+    results = run_suite(nr_tasks)
+    if output is None:
+        print json.dumps(results, indent=4, sort_keys=True)
+    else:
+        fh = open(output, 'w')
+        json.dump(results, fh, indent=4, sort_keys=True)
+        fh.close()
+        print "BENCHMARK results written to %s" % output
@@ -26,22 +26,45 @@
 #
 """
 Extension of the SCOOP bootstrap.__main__
+    vsc.processcontrol modules are only imported when a nice level other than 0
+    or a vsc.processcontrol affinity algorithm (eg the default basiccore) is set
+    the topology aware affinity algorithms are in vsc.mympirun.scoop.affinity
 """
-import argparse
-import functools
+import time
+_STARTUP_IMPORTS_START = time.time()
+
 import os
-import runpy
 import sys
-import vsc.processcontrol
-from distutils.version import LooseVersion
 from scoop import futures
 from scoop.bootstrap.__main__ import Bootstrap
-from vsc.mympirun.scoop.worker_utils import set_scoop_env
-from vsc.processcontrol.affinity import what_affinity
-from vsc.processcontrol.priority import what_priority
+from vsc.mympirun.scoop.worker_utils import set_scoop_env, get_scheduling, set_scheduling
+
+_STARTUP_IMPORTS_END = time.time()
+
+
+def _process_start_time():
+    """Return the start time of this process (in seconds since epoch, from /proc), None if not available"""
+    try:
+        uptime = float(open('/proc/uptime').read().split()[0])
+        # starttime is field 22, in clock ticks since boot (the command name in field 2 can contain spaces)
+        starttime = int(open('/proc/self/stat').read().rsplit(')', 1)[1].split()[19])
+        return time.time() - uptime + starttime / float(os.sysconf('SC_CLK_TCK'))
+    except (IOError, OSError, IndexError, ValueError):
+        return None
 
 
 class MyBootstrap(Bootstrap):
+    # scoop modules that can provide the ZMQCommunicator, to time the connect to the broker
+    COMMUNICATOR_MODULES = ['scoop._comm', 'scoop._comm.scoopzmq']
+    # scoop modules that can provide the FutureQueue, to tune the execution queue
+    FUTUREQUEUE_MODULES = ['scoop._types']
+
+    def __init__(self, *args, **kwargs):
+        super(MyBootstrap, self).__init__(*args, **kwargs)
+        self.startup_phases = []  # list of (phase, start, end)
+        self.startup_connect_timed = False
+        self.startup_profile_written = False
+
     def makeParser(self):
         super(MyBootstrap, self).makeParser()
 
@@ -70,14 +93,121 @@ class MyBootstrap(Bootstrap):
                                  default=None
                                  )
 
+        self.parser.add_argument('--environment',
+                                 help="Load the environment variables from this file",
+                                 action='store',
+                                 default=None
+                                 )
+
+        self.parser.add_argument('--cpuset',
+                                 help="Core set of the worker (kernel cpu list), overrides the affinity",
+                                 action='store',
+                                 default=None
+                                 )
+
+        self.parser.add_argument('--startupprofile',
+                                 help="Write the startup profile in this directory",
+                                 action='store',
+                                 default=None
+                                 )
+
     def parse(self):
-        super(MyBootstrap, self).parse()
+        self.startup_timed('parse', super(MyBootstrap, self).parse)
 
         # custom
+        self.startup_timed('environment', self.load_environment)
         self.set_freeorigin()
-        self.set_nice()
-        self.set_affinity()
+        self.startup_timed('nice', self.set_nice)
+        self.startup_timed('affinity', self.set_affinity)
         self.set_environment()
+        self.set_scheduling()
+
+        if self.args.startupprofile is not None:
+            self.set_startup_profile()
+
+    def startup_timed(self, phase, func, *args, **kwargs):
+        """Run func and record the duration as startup phase"""
+        s_t = time.time()
+        res = func(*args, **kwargs)
+        self.startup_phases.append((phase, s_t, time.time()))
+        return res
+
+    def set_startup_profile(self):
+        """Time the connect to the broker, the profile is written once connected
+            if the scoop communicator can't be found, the profile is written when the worker starts running
+        """
+        for modname in self.COMMUNICATOR_MODULES:
+            try:
+                __import__(modname)
+                communicator = getattr(sys.modules[modname], 'ZMQCommunicator')
+            except (ImportError, AttributeError):
+                continue
+
+            orig_init = communicator.__init__
+            bootstrap = self
+
+            def timed_init(comm, *args, **kwargs):
+                s_t = time.time()
+                orig_init(comm, *args, **kwargs)
+                bootstrap.startup_phases.append(('connect', s_t, time.time()))
+                bootstrap.write_startup_profile()
+
+            communicator.__init__ = timed_init
+            self.startup_connect_timed = True
+            return
+
+        self.log.debug("set_startup_profile: no communicator found in %s" % self.COMMUNICATOR_MODULES)
+
+    def write_startup_profile(self):
+        """Write the startup profile as JSON: the duration of each startup phase
+            interpreter is the time between process start and the first import of the bootstrap
+            (with the hostlauncher, the forked workers have no interpreter and imports phases)
+        """
+        if self.args.startupprofile is None or self.startup_profile_written:
+            return
+        self.startup_profile_written = True
+        try:
+            import json  # do the import only here
+        except ImportError:
+            import simplejson as json
+        from vsc.mympirun.scoop.launch import STARTUP_PROFILE_TEMPLATE
+
+        process_start = _process_start_time()
+        if process_start is None:
+            process_start = _STARTUP_IMPORTS_START
+        phases = [
+            ('interpreter', process_start, max(process_start, _STARTUP_IMPORTS_START)),
+            ('imports', max(process_start, _STARTUP_IMPORTS_START), max(process_start, _STARTUP_IMPORTS_END)),
+        ] + self.startup_phases
+
+        profile = {
+            'worker': self.args.workerName,
+            'pid': os.getpid(),
+            'origin': bool(self.args.origin),
+            'phases': dict([(phase, end - start) for phase, start, end in phases]),
+            'total': time.time() - process_start,
+        }
+        fn = os.path.join(self.args.startupprofile,
+                          STARTUP_PROFILE_TEMPLATE % {'worker': self.args.workerName, 'pid': os.getpid()})
+        try:
+            fh = open(fn, 'w')
+            fh.write(json.dumps(profile))
+            fh.close()
+        except IOError, err:
+            self.log.error("write_startup_profile: failed to write %s: %s" % (fn, err))
+
+    def load_environment(self):
+        """Load the environment file passed by the origin"""
+        if self.args.environment is None:
+            return
+
+        from vsc.mympirun.scoop.environment import load_environment  # do the import only here
+        try:
+            nr_set, nr_inherited = load_environment(self.args.environment)
+            self.log.debug("load_environment: set %s variables from %s (%s inherited)" %
+                           (nr_set, self.args.environment, nr_inherited))
+        except (IOError, ValueError), err:
+            self.log.error("load_environment: failed to load %s: %s" % (self.args.environment, err))
 
     def set_freeorigin(self):
         """Freeorigin mode
@@ -89,10 +219,13 @@ class MyBootstrap(Bootstrap):
             pass
 
     def set_nice(self):
-        """Set the nice/priority level"""
-        if self.args.nice is None:
+        """Set the nice/priority level
+            nice level 0 (the default) is not set, so vsc.processcontrol is not imported for it
+        """
+        if not self.args.nice:
             return
 
+        from vsc.processcontrol.priority import what_priority  # do the import only here
         control = what_priority(mode=self.args.processcontrol)
         if len(control) == 0:
             # do nothing?
@@ -103,12 +236,30 @@ class MyBootstrap(Bootstrap):
             c.set_priority(self.args.nice)
 
     def set_affinity(self):
-        """Set the affinity"""
+        """Set the affinity
+            with a cpuset, the worker is bound to all cores of the set (and nested processes inherit it)
+        """
+        if self.args.cpuset is not None:
+            self.set_cpuset()
+            return
+
         if self.args.affinity is None:
             return
 
         affinityargs = self.args.affinity.split(':')
         algo = affinityargs.pop(0)
+
+        from vsc.mympirun.scoop.affinity import TOPOLOGY_ALGORITHMS, set_topology_affinity, format_cpulist
+        if algo in TOPOLOGY_ALGORITHMS:
+            try:
+                cpus, nodes = set_topology_affinity(algo, *affinityargs)
+                self.log.debug("set_affinity algorithm %s cpus %s memory nodes %s" %
+                               (algo, format_cpulist(cpus), format_cpulist(nodes)))
+            except (OSError, ValueError), err:
+                self.log.error("set_affinity with algorithm %s failed: %s" % (algo, err))
+            return
+
+        from vsc.processcontrol.affinity import what_affinity  # do the import only here
         control = what_affinity(mode=self.args.processcontrol,
                                 algo=algo
                                 )
@@ -120,12 +271,54 @@ class MyBootstrap(Bootstrap):
             c = control[0]()
             c.algorithm(*affinityargs)
 
+    def set_cpuset(self):
+        """Bind the worker to its cpuset and export it as SCOOP_WORKER_CPUSET
+            I_MPI_PIN_PROCESSOR_LIST is set (unless already set) so a nested Intel MPI run pins inside the cpuset
+        """
+        from vsc.mympirun.scoop.affinity import parse_cpulist, set_cpu_affinity, set_membind, Topology
+        set_scoop_env('worker_cpuset', self.args.cpuset)
+        os.environ.setdefault('I_MPI_PIN_PROCESSOR_LIST', self.args.cpuset)
+
+        cpus = parse_cpulist(self.args.cpuset)
+        try:
+            set_cpu_affinity(cpus)
+            set_membind(Topology(cpus=cpus).nodes(cpus))
+        except OSError, err:
+            self.log.error("set_cpuset to %s failed: %s" % (self.args.cpuset, err))
+
+    def set_scheduling(self):
+        """Tune the execution queue of this worker (see worker_utils.set_scheduling)
+            the queue is created when the worker starts running, so the settings are applied when it is created
+        """
+        if not [x for x in get_scheduling().values() if x is not None]:
+            return
+
+        for modname in self.FUTUREQUEUE_MODULES:
+            try:
+                __import__(modname)
+                futurequeue = getattr(sys.modules[modname], 'FutureQueue')
+            except (ImportError, AttributeError):
+                continue
+
+            orig_init = futurequeue.__init__
+
+            def tuned_init(queue, *args, **kwargs):
+                orig_init(queue, *args, **kwargs)
+                set_scheduling(queue)
+
+            futurequeue.__init__ = tuned_init
+            return
+
+        self.log.error("set_scheduling: no FutureQueue found in %s" % self.FUTUREQUEUE_MODULES)
+
     def set_environment(self):
         """Set a number of worker environment variables"""
         set_scoop_env('worker_name', self.args.workerName)
         set_scoop_env('worker_origin', int(self.args.origin))
 
     def run(self):
+        if not self.startup_connect_timed:
+            self.write_startup_profile()
         super(MyBootstrap, self).run(globs=globals())
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Placement of the SCOOP broker
+    origin : the broker runs on the origin host, its cores are shared with the workers (the SCOOP default)
+    reserve : one core of the broker host is reserved for the broker and the (non-compute) origin,
+        the workers of that host run on the other cores (one compute worker less when all cores had one)
+    auto : reserve for runs with at least RESERVE_MIN_WORKERS workers, origin otherwise
+the broker host is the host SCOOP starts the broker on (the first local host)
+benchmark.broker measures the throughput of both placements with the same core selection (see reserve_broker_cpus)
+"""
+
+BROKER_AUTO = 'auto'
+BROKER_ORIGIN = 'origin'
+BROKER_RESERVE = 'reserve'
+BROKER_TOPOLOGIES = [BROKER_AUTO, BROKER_ORIGIN, BROKER_RESERVE]
+BROKER_DEFAULT = BROKER_AUTO
+
+# the reserved core costs (at most) 1/size of the compute workers, from RESERVE_MIN_WORKERS on that is at most 3%
+# benchmark.broker reports from how many workers on a host the reserved core pays off, to tune this threshold
+RESERVE_MIN_WORKERS = 32
+
+
+def choose_broker_topology(topology, size, ncores):
+    """Return the broker topology (BROKER_ORIGIN or BROKER_RESERVE) for size workers
+        topology is one of BROKER_TOPOLOGIES, ncores is the number of cores of the broker host
+        a core can only be reserved when the broker host has at least 2 cores
+    """
+    if not topology in BROKER_TOPOLOGIES:
+        raise ValueError("Unknown broker topology %s (supported %s)" % (topology, BROKER_TOPOLOGIES))
+
+    if topology == BROKER_AUTO:
+        if size >= RESERVE_MIN_WORKERS:
+            topology = BROKER_RESERVE
+        else:
+            topology = BROKER_ORIGIN
+    if topology == BROKER_RESERVE and ncores < 2:
+        topology = BROKER_ORIGIN
+
+    return topology
+
+
+def reserve_broker_cpus(topology):
+    """Return (reserved cpus, compute cpus) of the affinity.Topology instance
+        the last core (with all its hardware threads) is reserved for the broker and the origin, so the workers
+        that are laid out from the first core on (eg numacompact, basiccore) don't need to know about it
+    """
+    reserved = topology.cores[-1][2]
+    compute = sorted([cpu for _, _, threads in topology.cores[:-1] for cpu in threads])
+    return reserved, compute
+
+
+def get_broker_host(hosts, localhostnames):
+    """Return the host the broker runs on: the first local host (SCOOP starts the broker locally), else the first"""
+    for hostname in hosts:
+        if hostname in localhostnames:
+            return hostname
+    return hosts[0]
@@ -0,0 +1,95 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Environment of the remote workers, shipped as one serialized file instead of one shell export per variable
+    the origin writes the passed variables once per run (only readable by the user, removed at the end of the run)
+    the bootstrap loads the file and only sets the variables that differ from the inherited environment
+    the EARLY_VARIABLES are still exported on the command line: they are needed before python starts
+"""
+import os
+import pipes
+import stat
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+ENVIRONMENT_TEMPLATE = ".scoop_environment_%(run)s.json"
+EARLY_VARIABLES = ['PATH', 'LD_LIBRARY_PATH', 'PYTHONPATH', 'PYTHONHOME']
+
+
+def export_commands(variables, environ=None):
+    """Return the shell export commands (joined with &&) of variables, values are quoted"""
+    if environ is None:
+        environ = os.environ
+    cmd = []
+    for name in variables:
+        if name in environ:
+            cmd.extend(["export %s=%s" % (name, pipes.quote(environ[name])), '&&'])
+    return cmd
+
+
+def write_environment(variables, directory, run_id, environ=None):
+    """Write the values of variables (except the EARLY_VARIABLES) to the file of run_id in directory
+        directory has to be readable by all hosts, the file is only readable by the user (it can contain credentials)
+        returns the filename, remove it with remove_environment at the end of the run
+    """
+    if environ is None:
+        environ = os.environ
+    values = dict([(name, environ[name]) for name in variables if name in environ and not name in EARLY_VARIABLES])
+    filename = os.path.join(directory, ENVIRONMENT_TEMPLATE % {'run': run_id})
+    tmp = "%s.%s" % (filename, os.getpid())
+    fh = open(tmp, 'w')
+    os.chmod(tmp, stat.S_IRUSR | stat.S_IWUSR)
+    fh.write(json.dumps(values, sort_keys=True))
+    fh.close()
+    os.rename(tmp, filename)
+    return filename
+
+
+def remove_environment(filename):
+    """Remove the environment file (if it still exists)"""
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def load_environment(filename, environ=None):
+    """Set the variables of the environment file that differ from environ (default os.environ)
+        returns (number of variables set, number already inherited)
+    """
+    if environ is None:
+        environ = os.environ
+    values = json.load(open(filename))
+    nr_set = 0
+    for name, value in values.items():
+        name = name.encode('utf-8')
+        value = value.encode('utf-8')
+        if environ.get(name) != value:
+            environ[name] = value
+            nr_set += 1
+    return nr_set, len(values) - nr_set
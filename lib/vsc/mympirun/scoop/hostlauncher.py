@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Per host launcher: import the bootstrap (and thus scoop and pyzmq) and vsc.processcontrol once,
+then fork all workers of the host. The workers share the imported modules copy-on-write.
+    usage: python -m vsc.mympirun.scoop.hostlauncher <worker args> [<worker args> ...]
+        with <worker args> the bootstrap arguments of a worker, encoded with launch.encode_worker_args
+    the zmq context is only created in the forked workers (when they connect to the broker)
+    each worker runs the bootstrap as __main__ (like python -m does), so the functions the origin pickles
+    as __main__.<name> can be unpickled
+"""
+import os
+import runpy
+import sys
+import traceback
+from vsc.mympirun.scoop import bootstrap
+from vsc.mympirun.scoop.launch import decode_worker_args
+
+# modules the bootstrap imports only when a worker sets the nice level or a processcontrol affinity
+PROCESSCONTROL_MODULES = ['vsc.processcontrol.priority', 'vsc.processcontrol.affinity']
+
+
+def import_processcontrol(workers_args):
+    """Import the vsc.processcontrol modules before forking when a worker uses processcontrol"""
+    if not [x for x in workers_args if '--processcontrol' in x]:
+        return
+    for modname in PROCESSCONTROL_MODULES:
+        try:
+            __import__(modname)
+        except ImportError:
+            # the worker reports it when it needs the module
+            pass
+
+
+def fork_worker(args):
+    """Fork a worker that runs the bootstrap with args, return the pid
+        nice level and affinity are set in the worker itself (in MyBootstrap.parse)
+    """
+    pid = os.fork()
+    if pid == 0:
+        ec = 0
+        try:
+            sys.argv = [bootstrap.__file__] + args
+            # the imported modules are reused, only the bootstrap module itself is executed again
+            runpy.run_module(bootstrap.__name__, run_name='__main__', alter_sys=True)
+        except SystemExit, err:
+            if isinstance(err.code, int):
+                ec = err.code
+            elif err.code is not None:
+                ec = 1
+        except:
+            traceback.print_exc()
+            ec = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(ec)
+
+    return pid
+
+
+def main():
+    """Fork all workers, wait for them and exit with the largest exitcode"""
+    workers_args = [decode_worker_args(x) for x in sys.argv[1:]]
+    import_processcontrol(workers_args)
+    pids = [fork_worker(x) for x in workers_args]
+
+    ec = 0
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if os.WIFEXITED(status):
+            ec = max(ec, os.WEXITSTATUS(status))
+        else:
+            ec = max(ec, 1)
+
+    sys.exit(ec)
+
+
+if __name__ == "__main__":
+    main()
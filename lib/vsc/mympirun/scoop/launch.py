@@ -0,0 +1,148 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Concurrent launch of the workers on the hosts
+Encoding of the worker arguments for the per host launcher (see hostlauncher)
+Summary of the worker startup profiles
+"""
+import base64
+import glob
+import os
+import threading
+import time
+from Queue import Queue
+from vsc.utils.fancylogger import getLogger
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# number of slowest hosts to report
+LAUNCH_REPORT_SLOWEST = 5
+
+# filename of the startup profile of a worker (written by the bootstrap)
+STARTUP_PROFILE_TEMPLATE = "scoop_startup_%(worker)s_%(pid)s.json"
+STARTUP_PROFILE_PHASES = ['interpreter', 'imports', 'parse', 'environment', 'nice', 'affinity', 'connect']
+
+
+def encode_worker_args(args):
+    """Encode the list of bootstrap arguments of a worker as a single shell-safe word"""
+    return base64.b64encode(json.dumps(["%s" % x for x in args]))
+
+
+def decode_worker_args(txt):
+    """Decode the list of bootstrap arguments encoded with encode_worker_args"""
+    return [x.encode('utf-8') for x in json.loads(base64.b64decode(txt))]
+
+
+def summarize_startup_profiles(directory):
+    """Read the worker startup profiles in directory
+        returns dict with number of workers and for each phase (and the total) the (min, avg, max) duration
+    """
+    profiles = []
+    for fn in glob.glob(os.path.join(directory, STARTUP_PROFILE_TEMPLATE % {'worker': '*', 'pid': '*'})):
+        try:
+            profiles.append(json.load(open(fn)))
+        except (IOError, ValueError):
+            continue
+
+    summary = {'workers': len(profiles)}
+    for phase in STARTUP_PROFILE_PHASES + ['total']:
+        if phase == 'total':
+            values = [x['total'] for x in profiles]
+        else:
+            values = [x['phases'][phase] for x in profiles if phase in x['phases']]
+        if values:
+            summary[phase] = (min(values), sum(values) / len(values), max(values))
+    return summary
+
+
+class LaunchEngine(object):
+    """Launch hosts concurrently with a pool of concurrency threads
+        the launch latency per host is recorded
+    """
+    def __init__(self, concurrency):
+        self.log = getLogger(self.__class__.__name__)
+
+        self.concurrency = concurrency
+        self.queue = Queue()
+        self.lock = threading.Lock()
+        self.latencies = []  # list of (hostname, latency in seconds)
+        self.errors = []  # list of (hostname, exception)
+
+        self.threads = []
+        for idx in xrange(concurrency):
+            thread = threading.Thread(target=self._work, name="%s-%s" % (self.__class__.__name__, idx))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        """Launch thread main loop"""
+        while True:
+            hostname, launcher, args, kwargs = self.queue.get()
+            try:
+                self.run(hostname, launcher, *args, **kwargs)
+            except Exception, err:
+                self.log.exception("_work: launch on host %s failed" % hostname)
+                self.lock.acquire()
+                self.errors.append((hostname, err))
+                self.lock.release()
+            self.queue.task_done()
+
+    def run(self, hostname, launcher, *args, **kwargs):
+        """Run launcher(*args, **kwargs) for hostname in the current thread and record the latency"""
+        s_t = time.time()
+        res = launcher(*args, **kwargs)
+        latency = time.time() - s_t
+
+        self.lock.acquire()
+        self.latencies.append((hostname, latency))
+        self.lock.release()
+        self.log.debug("run: launched host %s in %fs" % (hostname, latency))
+
+        return res
+
+    def submit(self, hostname, launcher, *args, **kwargs):
+        """Queue the launch of hostname with launcher(*args, **kwargs)"""
+        self.queue.put((hostname, launcher, args, kwargs))
+
+    def wait(self):
+        """Wait for all queued launches"""
+        self.queue.join()
+
+    def report(self):
+        """Log the launch latency statistics"""
+        if not self.latencies:
+            return
+        latencies = sorted(self.latencies, key=lambda x: x[1], reverse=True)
+        total = sum([x[1] for x in latencies])
+        self.log.info("report: launched %s hosts with concurrency %s: latency min %fs avg %fs max %fs" %
+                      (len(latencies), self.concurrency, latencies[-1][1], total / len(latencies), latencies[0][1]))
+        self.log.info("report: slowest hosts %s" %
+                      ", ".join(["%s (%fs)" % x for x in latencies[:LAUNCH_REPORT_SLOWEST]]))
+        if self.errors:
+            self.log.error("report: launch failed on hosts %s" % [x[0] for x in self.errors])
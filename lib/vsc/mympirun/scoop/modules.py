@@ -0,0 +1,130 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Cached module load for the remote workers
+    the environment delta of loading the modules is resolved once on the origin (with a login bash and module load)
+    and cached as shell script in the cache directory, keyed by the module list, the host architecture and
+    the state of the MODULEPATH (its directories and their mtimes), cached scripts expire after MODULE_CACHE_TTL
+    the workers source the script instead of running module load (no Lmod/Environment Modules evaluation per worker)
+"""
+import hashlib
+import os
+import pipes
+import platform
+import subprocess
+import time
+
+MODULE_CACHE_DIR_DEFAULT = os.path.join(os.path.expanduser('~'), '.scoop', 'modulecache')
+MODULE_CACHE_TEMPLATE = "modules_%(key)s.sh"
+# cached scripts older than this (in seconds) are resolved again
+MODULE_CACHE_TTL = 7 * 24 * 3600
+# environment variables with the (VSC) architecture of the host, part of the cache key if set
+ARCH_VARIABLES = ['VSC_ARCH_LOCAL', 'VSC_OS_LOCAL']
+# variables that differ between shells and are never part of the delta
+IGNORE_VARIABLES = ['_', 'SHLVL', 'PWD', 'OLDPWD']
+
+BASH = ['/bin/bash', '-l', '-c']
+
+
+def get_arch():
+    """Return the architecture of this host: machine and the ARCH_VARIABLES"""
+    return ':'.join([platform.machine()] + [os.environ.get(x, '') for x in ARCH_VARIABLES])
+
+
+def get_modulepath_state(modulepath=None):
+    """Return the state of the MODULEPATH (default $MODULEPATH): the list of (directory, mtime) of its directories
+        and of their subdirectories (installing a new version of a module changes the mtime of the module directory)
+    """
+    if modulepath is None:
+        modulepath = os.environ.get('MODULEPATH', '')
+    state = []
+    for directory in [x for x in modulepath.split(os.pathsep) if x]:
+        try:
+            state.append((directory, os.stat(directory).st_mtime))
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    state.append((path, os.stat(path).st_mtime))
+        except OSError:
+            state.append((directory, None))
+    return state
+
+
+def module_cache_key(modules, arch=None, modulepath_state=None):
+    """Generate the cache key of the list of modules on arch (default the architecture of this host)
+        with the modulepath_state (default get_modulepath_state)
+    """
+    if arch is None:
+        arch = get_arch()
+    if modulepath_state is None:
+        modulepath_state = get_modulepath_state()
+    return hashlib.md5(repr((list(modules), arch, modulepath_state))).hexdigest()
+
+
+def _login_environment(script):
+    """Run script in a login bash, return the resulting environment as dict"""
+    proc = subprocess.Popen(BASH + ["%s >/dev/null 2>&1 && env -0" % script], stdout=subprocess.PIPE,
+                            stdin=open(os.devnull))
+    out, _ = proc.communicate()
+    if proc.returncode != 0:
+        raise OSError(proc.returncode, "running %s in a login shell failed" % script)
+    return dict([x.split('=', 1) for x in out.split('\0') if '=' in x])
+
+
+def module_delta(modules):
+    """Return (dict of set variables, list of unset variables) of loading the modules"""
+    before = _login_environment('true')
+    after = _login_environment("module load %s" % ' '.join([pipes.quote(x) for x in modules]))
+    set_variables = dict([(name, value) for name, value in after.items()
+                          if before.get(name) != value and not name in IGNORE_VARIABLES])
+    unset_variables = [name for name in before if not name in after and not name in IGNORE_VARIABLES]
+    return set_variables, unset_variables
+
+
+def resolve_modules(modules, cachedir=None):
+    """Return the filename of the cached shell script with the environment delta of loading the modules
+        the delta is resolved (and cached) if there is no cached script yet, or if it is older than MODULE_CACHE_TTL
+        raises OSError if the module load fails (nothing is cached)
+    """
+    if cachedir is None:
+        cachedir = MODULE_CACHE_DIR_DEFAULT
+    filename = os.path.join(cachedir, MODULE_CACHE_TEMPLATE % {'key': module_cache_key(modules)})
+    if os.path.exists(filename) and time.time() - os.path.getmtime(filename) < MODULE_CACHE_TTL:
+        return filename
+
+    set_variables, unset_variables = module_delta(modules)
+    lines = ["# environment delta of module load %s on %s" % (' '.join(modules), get_arch())]
+    lines.extend(["unset %s" % name for name in sorted(unset_variables)])
+    lines.extend(["export %s=%s" % (name, pipes.quote(value)) for name, value in sorted(set_variables.items())])
+
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    tmp = "%s.%s" % (filename, os.getpid())
+    fh = open(tmp, 'w')
+    fh.write("\n".join(lines) + "\n")
+    fh.close()
+    os.rename(tmp, filename)
+    return filename
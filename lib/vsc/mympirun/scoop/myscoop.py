@@ -28,14 +28,26 @@ SCOOP support
     http://code.google.com/p/scoop/
     based on 0.6.0  code
 """
-import itertools
 import os
+import pipes
 import sys
 from collections import namedtuple
 from distutils.version import LooseVersion
 from vsc.utils.fancylogger import getLogger
 from vsc.mympirun.mpi.mpi import MPI
 from vsc.mympirun.exceptions import WrongPythonVersionExcpetion, InitImportException
+from vsc.mympirun.scoop.launch import LaunchEngine, encode_worker_args, summarize_startup_profiles
+from vsc.mympirun.scoop.launch import STARTUP_PROFILE_PHASES
+from vsc.mympirun.scoop.affinity import TOPOLOGY_ALGORITHMS, ALGORITHM_NUMACOMPACT, ALGORITHM_RESERVE, Topology
+from vsc.mympirun.scoop.affinity import format_cpulist, get_cpus_allowed, set_cpu_affinity
+from vsc.mympirun.scoop.placement import WorkerPlan, launch_plan_cache_key, load_launch_plan, save_launch_plan
+from vsc.mympirun.scoop.brokers import BROKER_DEFAULT, BROKER_RESERVE, BROKER_TOPOLOGIES
+from vsc.mympirun.scoop.brokers import choose_broker_topology, get_broker_host, reserve_broker_cpus
+from vsc.mympirun.scoop.network import select_interface
+from vsc.mympirun.scoop.environment import EARLY_VARIABLES, export_commands, write_environment, remove_environment
+from vsc.mympirun.scoop.modules import resolve_modules
+from vsc.mympirun.scoop.worker_utils import set_scoop_env, get_run_id, RESULT_FORMATS, RESULT_FORMAT_JSONL
+from vsc.mympirun.scoop.worker_utils import CODECS, CODEC_NONE, CODEC_THRESHOLD_DEFAULT
 
 _logger = getLogger("MYSCOOP")
 
@@ -56,41 +68,103 @@ from scoop import utils
 
 class MyHost(Host):
     BOOTSTRAP_MODULE = 'vsc.mympirun.scoop.bootstrap'
+    HOSTLAUNCHER_MODULE = 'vsc.mympirun.scoop.hostlauncher'
     LAUNCHING_ARGUMENTS = namedtuple(Host.LAUNCHING_ARGUMENTS.__name__,
                                      list(Host.LAUNCHING_ARGUMENTS._fields) +
                                      ['freeorigin',
                                       'processcontrol', 'affinity',
-                                      'variables']
+                                      'variables', 'startupprofile', 'cpuset', 'environment']
                                      )
+    # set by MyScoopApp for concurrent launch of the hosts
+    LAUNCH_ENGINE = None
+    # set by MyScoopApp to start all workers of a host with one hostlauncher
+    HOSTLAUNCHER = False
+    # set by MyScoopApp: modules to load for the remote workers, and the cached environment delta of loading them
+    LOAD_MODULES = None
+    MODULE_CACHE = None
+
+    def getCommand(self):
+        """Command to start the workers on this host
+            in HOSTLAUNCHER mode, one hostlauncher process imports the bootstrap once and forks all workers
+        """
+        if not self.HOSTLAUNCHER or len(self.workersArguments) < 2:
+            return super(MyHost, self).getCommand()
+
+        first = self.workersArguments[0]
+        c = self._WorkerCommand_environment(first)
+        launcher = self._WorkerCommand_bootstrap(first)
+        launcher[launcher.index(self.BOOTSTRAP_MODULE)] = self.HOSTLAUNCHER_MODULE
+        c.extend(launcher)
+        for workerId, worker in enumerate(self.workersArguments):
+            args = self._WorkerCommand_options(worker, workerId) + self._WorkerCommand_executable_args(worker)
+            c.append(encode_worker_args(args))
+
+        self.log.debug("getCommand: hostlauncher for %s workers on host %s" % (len(self.workersArguments),
+                                                                               self.hostname))
+        return " ".join(["%s" % x for x in c])
+
+    def _WorkerCommand_executable_args(self, worker):
+        """The executable and its arguments, unquoted
+            (_WorkerCommand_executable quotes the arguments for the remote shell, but the encoded
+            hostlauncher arguments are never parsed by a shell)
+        """
+        return [worker.executable] + ["%s" % x for x in worker.args]
+
+    def launch(self, *args, **kwargs):
+        """Launch the workers on this host
+            with a LAUNCH_ENGINE, the launch is queued and this returns immediately
+            except for the host of the origin worker: it waits for all other launches, and then launches
+        """
+        if self.LAUNCH_ENGINE is None:
+            return super(MyHost, self).launch(*args, **kwargs)
+
+        if any([getattr(worker, 'origin', False) for worker in self.workersArguments]):
+            self.log.debug("launch: origin host %s, waiting for launch of other hosts" % self.hostname)
+            self.LAUNCH_ENGINE.wait()
+            res = self.LAUNCH_ENGINE.run(self.hostname, super(MyHost, self).launch, *args, **kwargs)
+            self.LAUNCH_ENGINE.report()
+            return res
+        else:
+            self.LAUNCH_ENGINE.submit(self.hostname, super(MyHost, self).launch, *args, **kwargs)
+            # the subprocesses are tracked by the host itself
+            return []
+
+    def is_local(self):
+        """Are the workers of this host started locally (they inherit the environment of the origin)"""
+        return self.hostname in utils.localHostnames
 
     def _WorkerCommand_environment(self, worker):
         c = super(MyHost, self)._WorkerCommand_environment(worker)
 
-        set_variables = self._WorkerCommand_environment_set_variables(worker.variables)
+        if self.is_local():
+            # local workers inherit the complete environment (including the loaded modules)
+            return c
+        elif worker.environment is not None:
+            # the other variables are loaded by the bootstrap from the environment file
+            set_variables = self._WorkerCommand_environment_set_variables([x for x in worker.variables
+                                                                           if x in EARLY_VARIABLES])
+        else:
+            set_variables = self._WorkerCommand_environment_set_variables(worker.variables)
         # TODO do we need the module load when we pass most variables?
 
-        return set_variables + c
+        return self._WorkerCommand_environment_load_modules() + set_variables + c
 
     def _WorkerCommand_environment_set_variables(self, variables):
         # TODO port to env when super(MyHost, self)._WorkerCommand_environment(worker) does this
-        shell_template = "export {name}='{value}'"
-
-        cmd = []
-        for name, value in [(x, os.environ.get(x)) for x in variables if x in os.environ]:
-            txt = shell_template.format(name=name, value=value)
-            cmd.extend([txt, '&&'])
-
-        return cmd
+        return export_commands(variables)
 
     def _WorkerCommand_environment_load_modules(self):
-        # TODO what is needed here? VSC-tools mympirun-scoop too.
-        load_modules = ['SCOOP']
+        """Load the LOAD_MODULES, by sourcing the cached environment delta if there is a MODULE_CACHE"""
+        if self.MODULE_CACHE is not None:
+            return ['.', pipes.quote(self.MODULE_CACHE), '&&']
+
+        load_modules = self.LOAD_MODULES
         mod_load = []
-        if load_modules is not None:
+        if load_modules:
             mod_load.extend(['module', 'load'])
             for mod_to_load in load_modules:
                 # check something first?
-                mod_load.append(mod_to_load)
+                mod_load.append(pipes.quote(mod_to_load))
             mod_load.append('&&')
 
         return mod_load
@@ -121,6 +195,16 @@ class MyHost(Host):
                 self.log.error("affinity is set, but no processcontrol")
 
 
+        if worker.startupprofile is not None:
+            c.extend(['--startupprofile', worker.startupprofile])
+
+        if worker.environment is not None and not self.is_local():
+            c.extend(['--environment', worker.environment])
+
+        if worker.cpuset is not None:
+            self.log.debug("WorkerCommand_options worker %s cpuset %s" % (worker.workerNum, worker.cpuset))
+            c.extend(['--cpuset', worker.cpuset])
+
         if worker.workerNum == 1 and worker.freeorigin:
             self.log.debug("WorkerCommand_options freeorigin set for worker %s" % worker.workerNum)
             c.append('--freeorigin')
@@ -134,12 +218,62 @@ class MyScoopApp(ScoopApp):
     def __init__(self, *args):
         args = list(args)  # args here is tuple, need to chaneg it (ie remove affintiy arg)
         # remove custom options
+        self.load_modules, self.module_cache = args.pop()
+        self.environment = args.pop()
+        self.cores_per_worker = args.pop()
+        self.startup_profile = args.pop()
+        self.hostlauncher = args.pop()
+        self.launch_concurrency = args.pop()
         self.variables_to_pass = args.pop()
         self.affinity = args.pop()
         self.processcontrol = args.pop()
-        self.freeorigin = args.pop()
+        self.plan = args.pop()
+        self.freeorigin = self.plan.freeorigin
         super(MyScoopApp, self).__init__(*args)
 
+        if self.launch_concurrency > 1:
+            self.log.debug("Concurrent launch of hosts with concurrency %s" % self.launch_concurrency)
+            self.LAUNCH_HOST_CLASS.LAUNCH_ENGINE = LaunchEngine(self.launch_concurrency)
+        self.LAUNCH_HOST_CLASS.HOSTLAUNCHER = self.hostlauncher
+        self.LAUNCH_HOST_CLASS.LOAD_MODULES = self.load_modules
+        self.LAUNCH_HOST_CLASS.MODULE_CACHE = self.module_cache
+
+        # the topology of the origin host is used for all hosts (assumes homogeneous nodes)
+        self.topology = None
+        if self.cores_per_worker is not None:
+            self.topology = Topology()
+        # the workers on the broker host don't use the cpus reserved for the broker
+        # (read before this process is bound to the reserved cpus)
+        self.broker_topology = None
+        if self.plan.broker_cpus:
+            self.broker_topology = Topology(cpus=[x for x in get_cpus_allowed() if not x in self.plan.broker_cpus])
+
+    def _get_cpuset(self, affinity, hostname):
+        """Return the cpuset (as kernel cpu list) of the worker with affinity dict on hostname
+            a block of cores_per_worker contiguous cores (0 is all cores divided over the workers on the host)
+            on the broker host with reserved cpus, the cpus of the affinity algorithm (numacompact if it is
+            no topology aware algorithm) without the reserved cpus
+            returns None when no core sets are used
+        """
+        if affinity is None:
+            return None
+        if self.broker_topology is not None and hostname == self.plan.broker_host:
+            topology = self.broker_topology
+            if self.cores_per_worker is not None:
+                algorithm = ALGORITHM_RESERVE
+            elif affinity['algorithm'] in TOPOLOGY_ALGORITHMS:
+                algorithm = affinity['algorithm']
+            else:
+                algorithm = ALGORITHM_NUMACOMPACT
+        elif self.topology is not None:
+            topology = self.topology
+            algorithm = ALGORITHM_RESERVE
+        else:
+            return None
+        cpus = topology.select(algorithm, affinity['total_workers_host'], affinity['worker_idx_host'],
+                               cores_per_worker=self.cores_per_worker)
+        return format_cpulist(cpus)
+
     def _addWorker_args(self, workerinfo):
         args, kwargs = super(MyScoopApp, self)._addWorker_args(workerinfo)
         # tuple with lots of info
@@ -147,31 +281,25 @@ class MyScoopApp(ScoopApp):
         affinity = workerinfo.copy()
         affinity['algorithm'] = self.affinity
 
-        # this is passed, but nothing is done with it
+        # the origin slot is known from the plan, the compute workers are laid out without it
+        hostname = self.hostsConn[-1].hostname
+        hostplan = self.plan.get(hostname)
         kwargs['freeorigin'] = False
-        if self.freeorigin:
-            if self.workersLeft == 1:
-                self.log.debug("_addWorker_args: freeorigin mode for origin worker")
-                # this is the origin worker
-                kwargs['freeorigin'] = True
-                # disable the affinity for origin
-                affinity = None
-
-                # TODO: clean this up somehow (eg spread some info on where the origin is)
-                # change the number of workers_on_host for other workers on this host for affinity calculations
-                newargs = []
-                for launching_args in self.hostsConn[-1].workersArguments:
-                    affinitydict = launching_args.affinity.copy()
-                    # no need to adjust 'worker_idx_host', the origin worker is the last one (ie largest idx)
-                    affinitydict['total_workers_host'] -= 1
-                    newargs.append(launching_args._replace(affinity=affinitydict,
-                                                           freeorigin=True,
-                                                           ))
-                self.hostsConn[-1].workersArguments = newargs
+        if self.freeorigin and self.workersLeft == 1:
+            self.log.debug("_addWorker_args: freeorigin mode for origin worker")
+            kwargs['freeorigin'] = True
+            # disable the affinity (and the cpuset) for origin
+            affinity = None
+        elif hostplan is not None:
+            # never more than SCOOP starts on the host (eg when SCOOP got fewer workers than planned)
+            affinity['total_workers_host'] = min(hostplan.workers, workerinfo['total_workers_host'])
 
         kwargs['processcontrol'] = self.processcontrol
         kwargs['affinity'] = affinity
         kwargs['variables'] = self.variables_to_pass
+        kwargs['startupprofile'] = self.startup_profile
+        kwargs['cpuset'] = self._get_cpuset(affinity, hostname)
+        kwargs['environment'] = self.environment
         return args, kwargs
 
 
@@ -193,12 +321,100 @@ class MYSCOOP(MPI):
                                           "routing problems and activate encryption but "
                                           "slows down communications)", None, "store_true", False),
                                 'broker':("The externally routable broker hostname / ip "
-                                          "(defaults to the local hostname)", "str", "store", None),
+                                          "(defaults to the address of the selected interface, see subnet)",
+                                          "str", "store", None),
+                                'subnet':("Preferred subnet (CIDR, e.g. 10.141.0.0/16) of the broker interface "
+                                          "(default the InfiniBand (IPoIB) interfaces are preferred)",
+                                          "str", "store", None),
+                                'nointerfaceselection':("Don't select the broker interface, use the mpdboot "
+                                                        "localhost interface", None, "store_true", False),
                                 'module':("Specifiy SCOOP worker module (to be imported or predefined in %s)" %
                                           SCOOP_WORKER_MODULE_DEFAULT_NS,
                                           "str", "store", SCOOP_WORKER_MODULE_DEFAULT),  # TODO provide list
                                 'profile':("Turn on SCOOP profiling", None, "store_true", False),
                                 'freeorigin':("Run the origin worker as an extra process", None, "store_true", False),
+                                'brokertopology':("Placement of the broker: %s (reserve: one core of the broker "
+                                                  "host for the broker and the origin; auto: reserve for large runs)" %
+                                                  ', '.join(BROKER_TOPOLOGIES), "str", "store", BROKER_DEFAULT),
+                                'chunksize':("Number of tasks per SCOOP future in simple_shell "
+                                             "(0 is automatic, based on number of tasks and workers)",
+                                             "int", "store", 1),
+                                'output':("Stream the simple_shell results to this file as they arrive "
+                                          "(instead of printing the full result list at the end)",
+                                          "str", "store", None),
+                                'outputformat':("Format of the streamed results file (%s)" % ', '.join(RESULT_FORMATS),
+                                                "str", "store", RESULT_FORMAT_JSONL),
+                                'maxoutput':("Maximum number of bytes of output kept per simple_shell command "
+                                             "(0 is unlimited)", "int", "store", 0),
+                                'spilldir':("Write the full output of simple_shell commands with more than "
+                                            "maxoutput bytes in this (node-local) directory", "str", "store", None),
+                                'persistent':("Run the simple_shell commands of each worker in one long-lived shell",
+                                              None, "store_true", False),
+                                'tasks':("Run simple_shell with one task per line of this file "
+                                         "(the line is appended to the command or replaces {args})",
+                                         "str", "store", None),
+                                'window':("Maximum number of outstanding futures while reading the tasks file "
+                                          "(0 is automatic, based on number of workers)", "int", "store", 0),
+                                'prefetch':("Number of outstanding futures per worker while reading the tasks file "
+                                            "(0 is automatic)", "int", "store", 0),
+                                'highwatermark':("Seconds of queued work above which a worker hands futures back "
+                                                 "to the broker (default SCOOP)", "float", "store", None),
+                                'lowwatermark':("Seconds of queued work below which a worker requests work "
+                                                "from the broker (default SCOOP)", "float", "store", None),
+                                'nostealing':("Workers never hand queued futures back to the broker "
+                                              "(no work-stealing by idle workers)", None, "store_true", False),
+                                'instrument':("Measure every task (queue wait, run time, cpu time, max RSS) "
+                                              "and report a summary (sanity and simple_shell)",
+                                              None, "store_true", False),
+                                'trace':("Write the measured tasks as Chrome trace (JSON) to this file "
+                                         "(implies instrument)", "str", "store", None),
+                                'logdir':("Directory of the per worker log files "
+                                          "(default $TMPDIR or /tmp; node-local is fastest)", "str", "store", None),
+                                'loglevel':("Loglevel of the worker log files (eg DEBUG, INFO, WARNING)",
+                                            "str", "store", None),
+                                'codec':("Compress simple_shell outputs larger than codec_threshold with this codec "
+                                         "(%s)" % ', '.join(CODECS), "str", "store", CODEC_NONE),
+                                'codec_threshold':("Minimum size in bytes of the outputs to compress",
+                                                   "int", "store", CODEC_THRESHOLD_DEFAULT),
+                                'resultfile_limit':("Write simple_shell outputs larger than this many bytes to a "
+                                                    "node-local file and return the path (0 is disabled)",
+                                                    "int", "store", 0),
+                                'resultfile_dir':("Directory of the result files (default $TMPDIR or /tmp)",
+                                                  "str", "store", None),
+                                'pickleprotocol':("Pickle protocol of the encoded results (default highest)",
+                                                  "int", "store", None),
+                                'broadcast_dir':("Directory to stage the broadcast data, readable by all hosts "
+                                                 "(default the current directory)", "str", "store", None),
+                                'broadcast_localdir':("Node-local directory for the per host copy of the broadcast "
+                                                      "data (default /dev/shm)", "str", "store", None),
+                                'envfile':("Pass the environment to the remote workers in one file (written in "
+                                           "the working directory) instead of one export per variable",
+                                           None, "store_true", False),
+                                'modules':("Modules to load for the remote workers", "strlist", "store", None),
+                                'modulecache':("Resolve the environment of loading the modules once and cache it, "
+                                               "the remote workers apply the cached environment (no module load)",
+                                               None, "store_true", False),
+                                'modulecache_dir':("Directory of the module cache, readable by all hosts "
+                                                   "(default ~/.scoop/modulecache)", "str", "store", None),
+                                'plancache':("Cache the launch plan (worker placement and broker) and reuse it "
+                                             "in the next runs in the same job allocation", None, "store_true", False),
+                                'plancache_dir':("Directory of the launch plan cache (default ~/.scoop/plancache)",
+                                                 "str", "store", None),
+                                'launchconcurrency':("Number of hosts to launch workers on concurrently "
+                                                     "(1 is sequential)", "int", "store", 1),
+                                'hostlauncher':("Start one launcher process per host that forks the workers "
+                                                "(imports the bootstrap only once per host)", None, "store_true", False),
+                                'startup_profile':("Write the startup profile (per phase timings) of each worker "
+                                                   "in this directory and report a summary", "str", "store", None),
+                                'affinity':("Affinity algorithm of the workers: a vsc.processcontrol algorithm "
+                                            "or a topology aware algorithm (%s)" % ', '.join(TOPOLOGY_ALGORITHMS),
+                                            "str", "store", 'basiccore'),
+                                'cores_per_worker':("Give each worker a block of this many contiguous cores, "
+                                                    "exported as SCOOP_WORKER_CPUSET (0 is all cores divided over "
+                                                    "the workers on a host; default with --hybrid)",
+                                                    "int", "store", None),
+                                'journal':("Record completed tasks in this journal file; a restarted run "
+                                           "with the same tasks skips the completed ones", "str", "store", None),
                                 },
                      'prefix':'scoop',
                      'description': ('SCOOP options', 'Advanced options specific for SCOOP'),
@@ -233,12 +449,16 @@ class MYSCOOP(MPI):
         # default broker is first of unique nodes ?
         self.scoop_broker = getattr(self.options, 'scoop_broker', None)
         self.scoop_brokerport = getattr(self.options, 'scoop_brokerport', None)
+        self.scoop_subnet = getattr(self.options, 'scoop_subnet', None)
+        self.scoop_nointerfaceselection = getattr(self.options, 'scoop_nointerfaceselection', False)
+        self.scoop_broker_interface = None
 
         self.scoop_infobroker = getattr(self.options, 'scoop_infobroker', self.scoop_broker)
         self.scoop_infoport = getattr(self.options, 'scoop_brokerport', None)
 
         self.scoop_origin = getattr(self.options, 'scoop_origin', False)
         self.scoop_freeorigin = getattr(self.options, 'scoop_freeorigin', False)
+        self.scoop_brokertopology = getattr(self.options, 'scoop_brokertopology', BROKER_DEFAULT)
         self.scoop_debug = getattr(self.options, 'scoop_debug', self.options.debug)
 
         if self.scoop_debug:
@@ -251,6 +471,48 @@ class MYSCOOP(MPI):
 
         self.scoop_profile = getattr(self.options, 'scoop_profile', False)
 
+        self.scoop_chunksize = getattr(self.options, 'scoop_chunksize', 1)
+        self.scoop_output = getattr(self.options, 'scoop_output', None)
+        self.scoop_outputformat = getattr(self.options, 'scoop_outputformat', RESULT_FORMAT_JSONL)
+        self.scoop_maxoutput = getattr(self.options, 'scoop_maxoutput', 0)
+        self.scoop_spilldir = getattr(self.options, 'scoop_spilldir', None)
+        self.scoop_persistent = getattr(self.options, 'scoop_persistent', False)
+        self.scoop_tasks = getattr(self.options, 'scoop_tasks', None)
+        self.scoop_window = getattr(self.options, 'scoop_window', 0)
+        self.scoop_journal = getattr(self.options, 'scoop_journal', None)
+        self.scoop_prefetch = getattr(self.options, 'scoop_prefetch', 0)
+        self.scoop_highwatermark = getattr(self.options, 'scoop_highwatermark', None)
+        self.scoop_lowwatermark = getattr(self.options, 'scoop_lowwatermark', None)
+        self.scoop_nostealing = getattr(self.options, 'scoop_nostealing', False)
+        self.scoop_instrument = getattr(self.options, 'scoop_instrument', False)
+        self.scoop_trace = getattr(self.options, 'scoop_trace', None)
+        self.scoop_logdir = getattr(self.options, 'scoop_logdir', None)
+        self.scoop_codec = getattr(self.options, 'scoop_codec', CODEC_NONE)
+        self.scoop_codec_threshold = getattr(self.options, 'scoop_codec_threshold', CODEC_THRESHOLD_DEFAULT)
+        self.scoop_resultfile_limit = getattr(self.options, 'scoop_resultfile_limit', 0)
+        self.scoop_resultfile_dir = getattr(self.options, 'scoop_resultfile_dir', None)
+        self.scoop_pickleprotocol = getattr(self.options, 'scoop_pickleprotocol', None)
+        self.scoop_broadcast_dir = getattr(self.options, 'scoop_broadcast_dir', None)
+        self.scoop_envfile = getattr(self.options, 'scoop_envfile', False)
+        self.scoop_modules = getattr(self.options, 'scoop_modules', None)
+        self.scoop_modulecache = getattr(self.options, 'scoop_modulecache', False)
+        self.scoop_modulecache_dir = getattr(self.options, 'scoop_modulecache_dir', None)
+        self.scoop_plancache = getattr(self.options, 'scoop_plancache', False)
+        self.scoop_plancache_dir = getattr(self.options, 'scoop_plancache_dir', None)
+        self.scoop_launch_plan_key = None
+        self.scoop_launch_plan = None
+        self.scoop_broadcast_localdir = getattr(self.options, 'scoop_broadcast_localdir', None)
+        self.scoop_loglevel = getattr(self.options, 'scoop_loglevel', None)
+        self.scoop_launchconcurrency = getattr(self.options, 'scoop_launchconcurrency', 1)
+        self.scoop_hostlauncher = getattr(self.options, 'scoop_hostlauncher', False)
+        self.scoop_startup_profile = getattr(self.options, 'scoop_startup_profile', None)
+        if self.scoop_startup_profile is not None:
+            self.scoop_startup_profile = os.path.abspath(self.scoop_startup_profile)
+        self.scoop_cores_per_worker = getattr(self.options, 'scoop_cores_per_worker', None)
+        if self.scoop_cores_per_worker is None and getattr(self.options, 'hybrid', None):
+            # hybrid SCOOP+MPI: every worker gets its share of the cores for the nested MPI run
+            self.scoop_cores_per_worker = 0
+
         self.scoop_remote = {}
         self.scoop_workers_free = None
 
@@ -306,16 +568,32 @@ class MYSCOOP(MPI):
     def scoop_prepare(self):
         """Prepare the scoop parameters and commands"""
         # self.mpinodes is the node list to use
-        if self.scoop_broker is None:
-            if self.mpdboot_localhost_interface is None:
-                self.mpdboot_set_localhost_interface()
-            self.scoop_broker = self.mpdboot_localhost_interface[0]
-
         if self.scoop_size is None:
             self.scoop_size = self.mpitotalppn * self.nruniquenodes
         if self.scoop_hosts is None:
             self.scoop_hosts = self.mpinodes
 
+        if self.scoop_plancache:
+            self.scoop_launch_plan_key = launch_plan_cache_key(self.scoop_hosts, os.uname()[1], self.scoop_size,
+                                                               self.scoop_freeorigin, self.scoop_brokertopology,
+                                                               self.scoop_broker, self.scoop_subnet,
+                                                               self.scoop_nointerfaceselection)
+            self.scoop_launch_plan = load_launch_plan(self.scoop_launch_plan_key, cachedir=self.scoop_plancache_dir)
+            self.log.debug("scoop_prepare: launch plan key %s cached %s" %
+                           (self.scoop_launch_plan_key, self.scoop_launch_plan is not None))
+
+        if self.scoop_launch_plan is not None:
+            self.scoop_broker = self.scoop_launch_plan['broker']
+            self.scoop_broker_interface = self.scoop_launch_plan['broker_interface']
+            if self.scoop_broker_interface is not None:
+                set_scoop_env('broker_interface', self.scoop_broker_interface)
+        elif self.scoop_broker is None and not self.scoop_nointerfaceselection:
+            self.scoop_select_interface()
+        if self.scoop_broker is None:
+            if self.mpdboot_localhost_interface is None:
+                self.mpdboot_set_localhost_interface()
+            self.scoop_broker = self.mpdboot_localhost_interface[0]
+
         if self.scoop_broker is None:
             # default broker is first of unique nodes ?
             self.scoop_broker = self.uniquenodes[0]
@@ -323,22 +601,160 @@ class MYSCOOP(MPI):
         if self.scoop_infobroker is None:
             self.scoop_infobroker = self.scoop_broker
 
+        self.scoop_prepare_worker_environment()
+
+    def scoop_select_interface(self):
+        """Use the address of the selected interface (see network.select_interface) as broker
+            the choice is logged and passed to the workers as SCOOP_BROKER_INTERFACE
+        """
+        localnames = [hn for hn, ip in self.get_localhosts()]
+        remote_hosts = []
+        for hostname in self.scoop_hosts:
+            if not hostname in localnames and not hostname in remote_hosts:
+                remote_hosts.append(hostname)
+        if not remote_hosts:
+            self.log.debug("scoop_select_interface: no remote hosts, using the default")
+            return
+
+        try:
+            interface, candidates = select_interface(remote_hosts, subnet=self.scoop_subnet)
+        except ValueError, err:
+            self.log.raiseException("scoop_select_interface: %s" % err)
+        self.log.debug("scoop_select_interface: candidates %s" % candidates)
+        if interface is None:
+            self.log.warning("scoop_select_interface: no interface reaches the remote hosts %s, using the default" %
+                             remote_hosts[:5])
+            return
+
+        self.log.info("scoop_select_interface: broker on interface %s address %s (rtt %s)" %
+                      (interface.name, interface.address, interface.rtt))
+        self.scoop_broker = interface.address
+        self.scoop_broker_interface = "%s:%s" % (interface.name, interface.address)
+        set_scoop_env('broker_interface', self.scoop_broker_interface)
+
+    def scoop_prepare_worker_environment(self):
+        """Pass the worker options as SCOOP environment variables
+            (they are passed to all workers via get_pass_variables)
+        """
+        set_scoop_env('size', self.scoop_size)
+        set_scoop_env('run_id', "%s.%s" % (os.uname()[1].split('.')[0], os.getpid()))
+        set_scoop_env('chunksize', self.scoop_chunksize)
+        if self.scoop_output is not None:
+            if not self.scoop_outputformat in RESULT_FORMATS:
+                self.log.raiseException("scoop_prepare_worker_environment: unknown outputformat %s (supported %s)" %
+                                        (self.scoop_outputformat, RESULT_FORMATS))
+            set_scoop_env('output', os.path.abspath(self.scoop_output))
+            set_scoop_env('outputformat', self.scoop_outputformat)
+        set_scoop_env('maxoutput', self.scoop_maxoutput)
+        if self.scoop_spilldir is not None:
+            set_scoop_env('spilldir', self.scoop_spilldir)
+        set_scoop_env('persistent', int(self.scoop_persistent))
+        if self.scoop_tasks is not None:
+            set_scoop_env('tasks', os.path.abspath(self.scoop_tasks))
+        set_scoop_env('window', self.scoop_window)
+        set_scoop_env('prefetch', self.scoop_prefetch)
+        if self.scoop_highwatermark is not None:
+            set_scoop_env('highwatermark', self.scoop_highwatermark)
+        if self.scoop_lowwatermark is not None:
+            set_scoop_env('lowwatermark', self.scoop_lowwatermark)
+        if self.scoop_nostealing:
+            set_scoop_env('stealing', 0)
+        set_scoop_env('instrument', int(self.scoop_instrument))
+        if self.scoop_trace is not None:
+            set_scoop_env('trace', os.path.abspath(self.scoop_trace))
+        if self.scoop_logdir is not None:
+            set_scoop_env('logdir', self.scoop_logdir)
+        if self.scoop_loglevel is not None:
+            set_scoop_env('loglevel', self.scoop_loglevel)
+        if not self.scoop_codec in CODECS:
+            self.log.raiseException("scoop_prepare_worker_environment: unknown codec %s (supported %s)" %
+                                    (self.scoop_codec, CODECS))
+        set_scoop_env('codec', self.scoop_codec)
+        set_scoop_env('codec_threshold', self.scoop_codec_threshold)
+        set_scoop_env('resultfile_limit', self.scoop_resultfile_limit)
+        if self.scoop_resultfile_dir is not None:
+            set_scoop_env('resultfile_dir', self.scoop_resultfile_dir)
+        if self.scoop_pickleprotocol is not None:
+            set_scoop_env('pickleprotocol', self.scoop_pickleprotocol)
+        if self.scoop_broadcast_dir is not None:
+            set_scoop_env('broadcast_dir', os.path.abspath(self.scoop_broadcast_dir))
+        if self.scoop_broadcast_localdir is not None:
+            set_scoop_env('broadcast_localdir', self.scoop_broadcast_localdir)
+        if self.scoop_journal is not None:
+            set_scoop_env('journal', os.path.abspath(self.scoop_journal))
+        if self.scoop_cores_per_worker:
+            set_scoop_env('cores_per_worker', self.scoop_cores_per_worker)
+
+    def scoop_make_plan(self):
+        """Return the worker plan and the number of compute workers
+            the plan is taken from the launch plan cache, or computed (and cached with --scoop_plancache)
+        """
+        if self.scoop_launch_plan is not None:
+            plan = WorkerPlan.from_dict(self.scoop_launch_plan['plan'])
+            size = self.scoop_launch_plan['size']
+            self.log.debug("scoop_make_plan: cached worker plan %s size %s" % (plan, size))
+            return plan, size
+
+        # the origin (the last worker started by SCOOP) is on the first host
+        plan = WorkerPlan(self.scoop_hosts, freeorigin=self.scoop_freeorigin, origin_idx=0)
+        size = self.scoop_size
+
+        # the broker is started locally, a core can only be reserved when the local host has workers
+        broker_host = get_broker_host(self.scoop_hosts, utils.localHostnames)
+        topology = None
+        ncores = 0
+        if broker_host in utils.localHostnames:
+            topology = Topology()
+            ncores = len(topology.cores)
+        try:
+            brokertopology = choose_broker_topology(self.scoop_brokertopology, size, ncores)
+        except ValueError, err:
+            self.log.raiseException("scoop_make_plan: %s" % err)
+        if brokertopology == BROKER_RESERVE:
+            reserved, _ = reserve_broker_cpus(topology)
+            size -= plan.reserve(broker_host, reserved, ncores)
+            self.log.info("scoop_make_plan: cpus %s of broker host %s reserved for the broker and the origin, "
+                          "%s compute workers" % (format_cpulist(reserved), broker_host, size))
+        self.log.debug("scoop_make_plan: broker topology %s worker plan %s" % (brokertopology, plan))
+
+        if self.scoop_launch_plan_key is not None:
+            launch_plan = {
+                'plan': plan.to_dict(),
+                'size': size,
+                'brokertopology': brokertopology,
+                'broker': self.scoop_broker,
+                'broker_interface': self.scoop_broker_interface,
+            }
+            filename = save_launch_plan(self.scoop_launch_plan_key, launch_plan, cachedir=self.scoop_plancache_dir)
+            self.log.debug("scoop_make_plan: launch plan cached in %s" % filename)
+
+        return plan, size
+
     def scoop_run(self):
         """Run the launcher"""
-        vars_to_pass = self.get_pass_variables()
         # add uniquenodes that are localhost
         localhosts = self.get_localhosts()
         utils.localHostnames.extend([hn for hn, ip in localhosts if not hn in utils.localHostnames])
 
-        # will become the last one
-        origin_idx = 0
-        if self.scoop_freeorigin:
-            # duplicate the first of the host entries
-            self.scoop_hosts.insert(origin_idx, self.scoop_hosts[origin_idx])
-            self.scoop_size += 1
+        plan, size = self.scoop_make_plan()
+        if size != self.scoop_size:
+            set_scoop_env('size', size)
 
-        scoop_app_args = [[(nodename, len(list(group))) for nodename, group in itertools.groupby(self.scoop_hosts)],
-                          self.scoop_size,
+        vars_to_pass = self.get_pass_variables()
+        environment = None
+        if self.scoop_envfile:
+            environment = write_environment(vars_to_pass, self.scoop_path, get_run_id())
+            self.log.debug("scoop_run: %s variables to pass in environment file %s" % (len(vars_to_pass), environment))
+        module_cache = None
+        if self.scoop_modules and self.scoop_modulecache:
+            try:
+                module_cache = resolve_modules(self.scoop_modules, cachedir=self.scoop_modulecache_dir)
+            except OSError, err:
+                self.log.raiseException("scoop_run: failed to resolve modules %s: %s" % (self.scoop_modules, err))
+            self.log.debug("scoop_run: modules %s cached in %s" % (self.scoop_modules, module_cache))
+
+        scoop_app_args = [plan.scoop_hosts(),
+                          size + plan.nr_origin,
                           self.scoop_verbose,
                           [self.scoop_python],
                           self.scoop_broker,
@@ -353,14 +769,26 @@ class MYSCOOP(MPI):
                           self.scoop_profile,
                           self.scoop_pythonpath[0],
                           # custom
-                          self.scoop_freeorigin,
+                          plan,
                           self.scoop_processcontrol,
                           self.scoop_affinity,
                           vars_to_pass,
+                          self.scoop_launchconcurrency,
+                          self.scoop_hostlauncher,
+                          self.scoop_startup_profile,
+                          self.scoop_cores_per_worker,
+                          environment,
+                          (self.scoop_modules, module_cache),
                           ]
         self.log.debug("scoop_run: scoop_app class %s args %s" % (self.SCOOP_APP.__name__, scoop_app_args))
 
         scoop_app = self.SCOOP_APP(*scoop_app_args)
+        if plan.broker_cpus:
+            # the broker and the local origin are started from this process and inherit the affinity
+            try:
+                set_cpu_affinity(plan.broker_cpus)
+            except OSError, err:
+                self.log.error("scoop_run: failed to bind to the reserved broker cpus: %s" % err)
         try:
             root_task_ec = scoop_app.run()
             self.log.debug("scoop_run exited with exitcode %s" % root_task_ec)
@@ -368,3 +796,16 @@ class MYSCOOP(MPI):
             self.log.exception('scoop_run: error while launching SCOOP subprocesses: {0}'.format(str(e)))
         finally:
             scoop_app.close()
+            if environment is not None:
+                remove_environment(environment)
+
+        if self.scoop_startup_profile is not None:
+            self.scoop_report_startup_profile()
+
+    def scoop_report_startup_profile(self):
+        """Report the summary of the worker startup profiles"""
+        summary = summarize_startup_profiles(self.scoop_startup_profile)
+        self.log.info("Startup profile of %s workers (min/avg/max in seconds)" % summary['workers'])
+        for phase in STARTUP_PROFILE_PHASES + ['total']:
+            if phase in summary:
+                self.log.info("  %s %f/%f/%f" % tuple([phase] + list(summary[phase])))
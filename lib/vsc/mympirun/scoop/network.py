@@ -0,0 +1,268 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Selection of the network interface for the broker traffic
+    the local interfaces are read from /sys/class/net (with their IPv4 address and netmask), no extra modules needed
+    preference: an interface in the configured subnet, then InfiniBand (IPoIB), then any other interface
+    the round-trip time to a remote host is measured over each candidate (TCP connect from the interface address)
+        the peer address is a resolved address of the host (or of <host>-ib, <host>.ib) in the subnet of the interface,
+        or the host part of a resolved address put in the subnet of the interface (the usual IPoIB numbering)
+    a candidate is only skipped when a resolved peer address in its subnet can't be reached,
+    candidates without a (reachable) peer are kept unmeasured, an interface in the configured subnet is never skipped
+"""
+import errno
+import fcntl
+import os
+import socket
+import struct
+import threading
+import time
+from vsc.utils.fancylogger import getLogger
+
+SYS_CLASS_NET = '/sys/class/net'
+
+# from linux/if_arp.h and linux/sockios.h
+ARPHRD_INFINIBAND = 32
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+
+# port to measure the round-trip time with (sshd, the workers are started over ssh)
+RTT_PORT = 22
+RTT_TIMEOUT = 1.0
+
+# only the first RESOLVE_HOSTS remote hosts are resolved (in parallel, waiting at most RESOLVE_TIMEOUT seconds)
+RESOLVE_HOSTS = 4
+RESOLVE_TIMEOUT = 2.0
+# suffixes of the hostnames on the InfiniBand network
+IB_HOSTNAME_SUFFIXES = ['-ib', '.ib']
+
+PREFERENCE_SUBNET = 0
+PREFERENCE_INFINIBAND = 1
+PREFERENCE_OTHER = 2
+
+
+def ip_to_int(ip):
+    """Convert a dotted IPv4 address to an integer"""
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def parse_subnet(subnet):
+    """Parse a subnet in CIDR notation (e.g. 10.141.0.0/16), return (network, netmask) as integers"""
+    try:
+        address, bits = subnet.split('/')
+        bits = int(bits)
+        if not 0 <= bits <= 32:
+            raise ValueError
+        netmask = (0xffffffff << (32 - bits)) & 0xffffffff
+        return ip_to_int(address) & netmask, netmask
+    except (ValueError, socket.error):
+        raise ValueError("Invalid subnet %s (expected e.g. 10.141.0.0/16)" % subnet)
+
+
+def int_to_ip(value):
+    """Convert an integer to a dotted IPv4 address"""
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def in_subnet(ip, network, netmask):
+    """Check if the IPv4 address ip is in the network with netmask (both integers)"""
+    return ip_to_int(ip) & netmask == network
+
+
+class Interface(object):
+    """A local network interface with an IPv4 address"""
+    def __init__(self, name, address, netmask, iftype=None):
+        self.name = name
+        self.address = address
+        self.netmask = netmask
+        self.iftype = iftype
+        self.rtt = None  # round-trip time in seconds to a remote host, None if not measured
+
+    @property
+    def is_infiniband(self):
+        return self.iftype == ARPHRD_INFINIBAND
+
+    def contains(self, ip):
+        """Check if ip is in the subnet of this interface"""
+        netmask = ip_to_int(self.netmask)
+        return in_subnet(ip, ip_to_int(self.address) & netmask, netmask)
+
+    def translate(self, ip):
+        """Put the host part of ip in the subnet of this interface"""
+        netmask = ip_to_int(self.netmask)
+        return int_to_ip((ip_to_int(self.address) & netmask) | (ip_to_int(ip) & ~netmask & 0xffffffff))
+
+    def __repr__(self):
+        return "%s(%s, %s/%s, type=%s, rtt=%s)" % (self.__class__.__name__, self.name, self.address, self.netmask,
+                                                   self.iftype, self.rtt)
+
+
+def _ioctl_address(sock, name, request):
+    """Return the IPv4 address for the ioctl request on interface name, None if it has none"""
+    try:
+        res = fcntl.ioctl(sock.fileno(), request, struct.pack('256s', name[:15]))
+    except IOError:
+        return None
+    return socket.inet_ntoa(res[20:24])
+
+
+def _read_int(fn):
+    try:
+        return int(open(fn).read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def get_interfaces(sysdir=SYS_CLASS_NET):
+    """Return the list of Interface instances of the local interfaces that are up and have an IPv4 address
+        the loopback interface is skipped
+    """
+    interfaces = []
+    try:
+        names = sorted(os.listdir(sysdir))
+    except OSError:
+        return interfaces
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for name in names:
+            if name == 'lo':
+                continue
+            try:
+                operstate = open(os.path.join(sysdir, name, 'operstate')).read().strip()
+            except IOError:
+                operstate = 'unknown'
+            if operstate == 'down':
+                continue
+            address = _ioctl_address(sock, name, SIOCGIFADDR)
+            if address is None:
+                continue
+            netmask = _ioctl_address(sock, name, SIOCGIFNETMASK)
+            interfaces.append(Interface(name, address, netmask, _read_int(os.path.join(sysdir, name, 'type'))))
+    finally:
+        sock.close()
+    return interfaces
+
+
+def measure_rtt(source, destination, port=RTT_PORT, timeout=RTT_TIMEOUT):
+    """Measure the round-trip time of a TCP connect from the source to the destination address
+        a refused connection also completes a round-trip
+        returns the time in seconds, None if the destination can't be reached from source
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.bind((source, 0))
+            s_t = time.time()
+            sock.connect((destination, port))
+        except socket.timeout:
+            return None
+        except socket.error, err:
+            if err.args[0] != errno.ECONNREFUSED:
+                return None
+        return time.time() - s_t
+    finally:
+        sock.close()
+
+
+def get_host_addresses(hostname):
+    """Return the list of IPv4 addresses of hostname (empty list if it can't be resolved)"""
+    try:
+        return socket.gethostbyname_ex(hostname)[2]
+    except socket.error:
+        return []
+
+
+def resolve_hosts(hostnames, timeout=RESOLVE_TIMEOUT):
+    """Resolve the hostnames in parallel, return the list of addresses of those resolved within timeout seconds"""
+    results = {}
+
+    def resolve(hostname):
+        results[hostname] = get_host_addresses(hostname)
+
+    threads = []
+    for hostname in hostnames:
+        thread = threading.Thread(target=resolve, args=(hostname,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    end = time.time() + timeout
+    for thread in threads:
+        thread.join(max(end - time.time(), 0))
+
+    addresses = []
+    for hostname in hostnames:
+        addresses.extend([x for x in results.get(hostname, []) if not x in addresses])
+    return addresses
+
+
+def preference(interface, subnet=None):
+    """Return the preference of the interface (lower is better)"""
+    if subnet is not None and in_subnet(interface.address, *subnet):
+        return PREFERENCE_SUBNET
+    elif interface.is_infiniband:
+        return PREFERENCE_INFINIBAND
+    else:
+        return PREFERENCE_OTHER
+
+
+def select_interface(remote_hosts, subnet=None, interfaces=None, port=RTT_PORT):
+    """Select the interface for the traffic with the remote hosts
+        subnet: preferred subnet in CIDR notation
+        only the first RESOLVE_HOSTS remote hosts (and their InfiniBand names) are resolved
+        returns (selected Interface instance or None, list of all candidates)
+    """
+    log = getLogger('select_interface')
+    if subnet is not None:
+        subnet = parse_subnet(subnet)
+    if interfaces is None:
+        interfaces = get_interfaces()
+
+    hostnames = remote_hosts[:RESOLVE_HOSTS]
+    addresses = resolve_hosts(hostnames + ["%s%s" % (x, y) for x in hostnames for y in IB_HOSTNAME_SUFFIXES])
+
+    candidates = []
+    for interface in interfaces:
+        resolved = [x for x in addresses if interface.contains(x)]
+        translated = [interface.translate(x) for x in addresses if not interface.contains(x)]
+        for peer in resolved[:1] + translated[:1]:
+            interface.rtt = measure_rtt(interface.address, peer, port=port)
+            if interface.rtt is not None:
+                break
+            log.debug("select_interface: %s can't reach %s" % (interface, peer))
+
+        if interface.rtt is None and resolved and preference(interface, subnet) != PREFERENCE_SUBNET:
+            log.debug("select_interface: %s can't reach the remote hosts, skipped" % interface)
+            continue
+        candidates.append(interface)
+
+    candidates.sort(key=lambda x: (preference(x, subnet), x.rtt is None, x.rtt))
+    if candidates:
+        return candidates[0], candidates
+    else:
+        return None, candidates
@@ -0,0 +1,312 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Placement of the SCOOP workers on the hosts
+    the plan is computed once, before the launch
+    in freeorigin mode the origin is an extra, non-compute slot on the origin host
+    (the compute workers on that host are laid out as if the origin isn't there)
+    with a reserved broker core (see WorkerPlan.reserve), the origin is on the broker host and shares that core
+The plan is serialised with the hosts in hostlist range notation (e.g. node[001-512]) and can be cached
+per job allocation, so repeated runs in the same allocation reuse it (see load_launch_plan)
+"""
+import hashlib
+import os
+import re
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+PLAN_CACHE_DIR_DEFAULT = os.path.join(os.path.expanduser('~'), '.scoop', 'plancache')
+PLAN_CACHE_TEMPLATE = "plan_%(allocation)s_%(key)s.json"
+# environment variables with the id of the job allocation
+ALLOCATION_VARIABLES = ['PBS_JOBID', 'SLURM_JOB_ID']
+
+HOSTLIST_RANGE_REGEX = re.compile(r'^(?P<prefix>[^\[\]]*)\[(?P<ranges>[^\]]+)\](?P<suffix>[^\[\]]*)$')
+HOSTNAME_NUMBER_REGEX = re.compile(r'^(?P<prefix>.*?)(?P<number>\d+)(?P<suffix>\D*)$')
+
+
+def _split_hostlist(txt):
+    """Split txt on the commas that are not in a range"""
+    items = []
+    depth = 0
+    start = 0
+    for idx, char in enumerate(txt):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            items.append(txt[start:idx])
+            start = idx + 1
+    items.append(txt[start:])
+    return [x for x in items if x]
+
+
+def expand_hostlist(txt):
+    """Expand a hostlist (e.g. node[001-003,007],login1) to the list of hostnames"""
+    hostnames = []
+    for item in _split_hostlist(txt):
+        match = HOSTLIST_RANGE_REGEX.match(item)
+        if match is None:
+            if '[' in item or ']' in item:
+                raise ValueError("Invalid hostlist range %s" % item)
+            hostnames.append(item)
+            continue
+        prefix, suffix = match.group('prefix'), match.group('suffix')
+        for numbers in match.group('ranges').split(','):
+            try:
+                if '-' in numbers:
+                    first, last = numbers.split('-')
+                else:
+                    first, last = numbers, numbers
+                width = len(first)
+                hostnames.extend(["%s%0*d%s" % (prefix, width, x, suffix) for x in xrange(int(first), int(last) + 1)])
+            except ValueError:
+                raise ValueError("Invalid hostlist range %s in %s" % (numbers, item))
+    return hostnames
+
+
+def _format_ranges(numbers, width):
+    """Format the list of consecutive numbers as comma-separated ranges"""
+    ranges = []
+    first = last = numbers[0]
+    for number in numbers[1:] + [None]:
+        if number is not None and number == last + 1:
+            last = number
+            continue
+        if first == last:
+            ranges.append("%0*d" % (width, first))
+        else:
+            ranges.append("%0*d-%0*d" % (width, first, width, last))
+        first = last = number
+    return ','.join(ranges)
+
+
+def compress_hostlist(hostnames):
+    """Compress the list of hostnames to a hostlist (the inverse of expand_hostlist)
+        the order is kept: only hostnames next to each other with the same prefix, suffix and number width are merged
+    """
+    groups = []  # list of (prefix, width, suffix, list of numbers), numbers is None for hostnames without number
+    for hostname in hostnames:
+        match = HOSTNAME_NUMBER_REGEX.match(hostname)
+        if match is None:
+            groups.append((hostname, None, None, None))
+            continue
+        prefix, number, suffix = match.group('prefix', 'number', 'suffix')
+        if groups and groups[-1][3] is not None and groups[-1][:3] == (prefix, len(number), suffix):
+            groups[-1][3].append(int(number))
+        else:
+            groups.append((prefix, len(number), suffix, [int(number)]))
+
+    items = []
+    for prefix, width, suffix, numbers in groups:
+        if numbers is None:
+            items.append(prefix)
+        elif len(numbers) == 1:
+            items.append("%s%0*d%s" % (prefix, width, numbers[0], suffix))
+        else:
+            items.append("%s[%s]%s" % (prefix, _format_ranges(numbers, width), suffix))
+    return ','.join(items)
+
+
+class HostPlan(object):
+    """The slots of one host: workers compute workers, plus the origin slot if origin is set
+        SCOOP starts the origin as the last worker, so the compute workers have the indices 0 .. workers-1
+    """
+    def __init__(self, hostname, workers=0, origin=False):
+        self.hostname = hostname
+        self.workers = workers
+        self.origin = origin
+
+    @property
+    def slots(self):
+        """Number of processes to start on the host"""
+        return self.workers + int(self.origin)
+
+    def __repr__(self):
+        return "%s(%s, %s, origin=%s)" % (self.__class__.__name__, self.hostname, self.workers, self.origin)
+
+
+class WorkerPlan(object):
+    """The per host worker plan
+        hosts: list of hostnames, one entry per compute worker (eg the mympirun nodes)
+        freeorigin: add a non-compute origin slot on the host of hosts[origin_idx]
+    """
+    def __init__(self, hosts, freeorigin=False, origin_idx=0):
+        self.freeorigin = freeorigin
+
+        self.hosts = []  # list of HostPlan instances, in order of first appearance
+        self._hosts = {}  # hostname -> HostPlan
+        for hostname in hosts:
+            self._add(hostname, 1)
+
+        # host and cpus reserved for the broker and the origin (see reserve)
+        self.broker_host = None
+        self.broker_cpus = None
+
+        self.origin_host = None
+        if freeorigin and hosts:
+            self.origin_host = self._hosts[hosts[origin_idx]]
+            self.origin_host.origin = True
+
+    def _add(self, hostname, workers):
+        """Add workers compute workers on hostname"""
+        if not hostname in self._hosts:
+            hostplan = HostPlan(hostname)
+            self._hosts[hostname] = hostplan
+            self.hosts.append(hostplan)
+        self._hosts[hostname].workers += workers
+
+    def reserve(self, hostname, cpus, ncores):
+        """Reserve cpus of one of the ncores cores of hostname for the broker and the non-compute origin
+            the origin is moved to hostname, which becomes the first host (SCOOP starts the origin on the first host)
+            a host with a compute worker on each core (or more) gets one compute worker less
+            returns the number of compute workers that were removed
+        """
+        hostplan = self._hosts[hostname]
+        self.hosts.remove(hostplan)
+        self.hosts.insert(0, hostplan)
+
+        removed = 0
+        if hostplan.workers >= ncores:
+            removed = 1
+            hostplan.workers -= removed
+        if self.origin_host is not None:
+            self.origin_host.origin = False
+        self.origin_host = hostplan
+        hostplan.origin = True
+        self.freeorigin = True
+
+        self.broker_host = hostname
+        self.broker_cpus = cpus
+        return removed
+
+    def get(self, hostname):
+        """Return the HostPlan of hostname (None if hostname is not in the plan)"""
+        return self._hosts.get(hostname, None)
+
+    @property
+    def workers(self):
+        """Total number of compute workers"""
+        return sum([x.workers for x in self.hosts])
+
+    @property
+    def nr_origin(self):
+        """Number of non-compute slots (1 in freeorigin mode)"""
+        return int(self.origin_host is not None)
+
+    def scoop_hosts(self):
+        """Return the list of (hostname, number of processes) for SCOOP"""
+        return [(x.hostname, x.slots) for x in self.hosts]
+
+    def to_dict(self):
+        """Return the plan as dict (JSON serialisable)
+            hosts is the list of (hostlist, workers per host), consecutive hosts with the same number of workers
+            are merged in one hostlist
+        """
+        hosts = []
+        group = []
+        for hostplan in self.hosts + [None]:
+            if group and (hostplan is None or hostplan.workers != group[-1].workers):
+                hosts.append((compress_hostlist([x.hostname for x in group]), group[-1].workers))
+                group = []
+            group.append(hostplan)
+
+        origin = None
+        if self.origin_host is not None:
+            origin = self.origin_host.hostname
+        return {'freeorigin': self.freeorigin, 'origin': origin, 'hosts': hosts,
+                'broker_host': self.broker_host, 'broker_cpus': self.broker_cpus}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create the plan from a dict made with to_dict"""
+        plan = cls([], freeorigin=data['freeorigin'])
+        for hostlist, workers in data['hosts']:
+            for hostname in expand_hostlist(hostlist):
+                plan._add(hostname, workers)
+        if data['origin'] is not None:
+            plan.origin_host = plan._hosts[data['origin']]
+            plan.origin_host.origin = True
+        plan.broker_host = data.get('broker_host')
+        plan.broker_cpus = data.get('broker_cpus')
+        return plan
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.hosts)
+
+
+def get_allocation():
+    """Return the id of the job allocation (None if not in a job)"""
+    for name in ALLOCATION_VARIABLES:
+        if os.environ.get(name):
+            return os.environ[name]
+    return None
+
+
+def launch_plan_cache_key(hosts, *options):
+    """Generate the cache key of the launch plan for the list of hosts and the options the plan depends on"""
+    digest = hashlib.md5(repr(options))
+    digest.update("\n".join(hosts))
+    return digest.hexdigest()
+
+
+def _launch_plan_filename(key, cachedir):
+    if cachedir is None:
+        cachedir = PLAN_CACHE_DIR_DEFAULT
+    allocation = re.sub(r'[^\w.-]', '_', get_allocation())
+    return os.path.join(cachedir, PLAN_CACHE_TEMPLATE % {'allocation': allocation, 'key': key})
+
+
+def load_launch_plan(key, cachedir=None):
+    """Return the cached launch plan (a dict, see save_launch_plan) for key in this allocation
+        None if there is no cached plan (or when not in a job allocation)
+    """
+    if get_allocation() is None:
+        return None
+    try:
+        return json.load(open(_launch_plan_filename(key, cachedir)))
+    except (IOError, ValueError):
+        return None
+
+
+def save_launch_plan(key, launch_plan, cachedir=None):
+    """Cache the launch plan (a JSON serialisable dict) for key in this allocation (nothing is done when not in one)
+        returns the filename of the cached plan (None when not in a job allocation)
+    """
+    if get_allocation() is None:
+        return None
+    filename = _launch_plan_filename(key, cachedir)
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    tmp = "%s.%s" % (filename, os.getpid())
+    fh = open(tmp, 'w')
+    fh.write(json.dumps(launch_plan))
+    fh.close()
+    os.rename(tmp, filename)
+    return filename
@@ -0,0 +1,245 @@
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Worker side command execution
+    stdout and stderr are read with poll into a bounded buffer, so lots of output can't cause a hang
+    commands that need no shell features are executed without /bin/sh
+    PersistentShell runs all commands of a worker in one long-lived bash coprocess
+        (without subshell for commands that need no shell features)
+"""
+import os
+import pipes
+import re
+import select
+import shlex
+import subprocess
+import uuid
+
+READ_SIZE = 64 * 1024
+
+EXITCODE_NOT_FOUND = 127
+EXITCODE_SHELL_DIED = 255
+
+# any of these characters requires the command to be run through /bin/sh
+SHELL_SPECIAL_CHARS = re.compile(r'''[|&;<>()$`\\"'*?\[\]#~=%{}!\n]''')
+
+# bash builtins and keywords (bash 4 compgen -b and -k): the persistent shell runs these in a subshell
+BASH_BUILTINS = set([
+    '.', ':', '[', 'alias', 'bg', 'bind', 'break', 'builtin', 'caller', 'cd', 'command', 'compgen', 'complete',
+    'compopt', 'continue', 'declare', 'dirs', 'disown', 'echo', 'enable', 'eval', 'exec', 'exit', 'export',
+    'false', 'fc', 'fg', 'getopts', 'hash', 'help', 'history', 'jobs', 'kill', 'let', 'local', 'logout',
+    'mapfile', 'popd', 'printf', 'pushd', 'pwd', 'read', 'readarray', 'readonly', 'return', 'set', 'shift',
+    'shopt', 'source', 'suspend', 'test', 'times', 'trap', 'true', 'type', 'typeset', 'ulimit', 'umask',
+    'unalias', 'unset', 'wait',
+    '!', '[[', ']]', 'case', 'coproc', 'do', 'done', 'elif', 'else', 'esac', 'fi', 'for', 'function', 'if',
+    'in', 'select', 'then', 'time', 'until', 'while', '{', '}',
+])
+
+TRUNCATED_TEMPLATE = "\n[output truncated at %(maxoutput)s of %(size)s bytes]"
+SPILLED_TEMPLATE = "\n[output truncated at %(maxoutput)s of %(size)s bytes, full output in %(spillfn)s]"
+
+# the persistent shell, one per worker process (see run_persistent)
+_persistent_shell = None
+
+
+def needs_shell(cmd):
+    """Check if the cmd string uses shell features (and thus has to be executed through /bin/sh)"""
+    return SHELL_SPECIAL_CHARS.search(cmd) is not None
+
+
+class OutputBuffer(object):
+    """Bounded output buffer
+        keeps at most maxoutput bytes in memory (None or 0 is unlimited)
+        the remainder of the output is discarded, or written to spillfn (together with the first part)
+    """
+    def __init__(self, maxoutput=None, spillfn=None):
+        self.maxoutput = maxoutput
+        self.spillfn = spillfn
+
+        self.out = []
+        self.size = 0
+        self.spill = None
+
+    def add(self, data):
+        """Add data to the buffer"""
+        if self.maxoutput and self.size + len(data) > self.maxoutput:
+            if self.spillfn is not None and self.spill is None:
+                self.spill = open(self.spillfn, 'wb')
+                self.spill.writelines(self.out)
+            if self.spill is not None:
+                self.spill.write(data)
+            if self.size < self.maxoutput:
+                self.out.append(data[:self.maxoutput - self.size])
+        else:
+            self.out.append(data)
+        self.size += len(data)
+
+    def value(self):
+        """Return the (possibly truncated) output, close the spill file"""
+        out = ''.join(self.out)
+        if self.spill is not None:
+            self.spill.close()
+            out += SPILLED_TEMPLATE % {'maxoutput': self.maxoutput, 'size': self.size, 'spillfn': self.spillfn}
+        elif self.maxoutput and self.size > self.maxoutput:
+            out += TRUNCATED_TEMPLATE % {'maxoutput': self.maxoutput, 'size': self.size}
+        return out
+
+
+def run_command(cmd, maxoutput=None, spillfn=None):
+    """Run cmd and return (exitcode, output) with stderr merged in stdout (like vsc.utils.run.run_simple)
+        cmd: command string, is executed without /bin/sh when it doesn't need shell features
+        maxoutput, spillfn: see OutputBuffer
+    """
+    if needs_shell(cmd):
+        args = cmd
+    else:
+        args = shlex.split(cmd)
+
+    shell = isinstance(args, basestring)
+    devnull = open(os.devnull)
+    try:
+        # the worker (eg the zmq sockets) has file descriptors open that the command shouldn't inherit
+        proc = subprocess.Popen(args, shell=shell, stdin=devnull, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, close_fds=True)
+    except OSError, err:
+        # same exitcode as /bin/sh for a command that can't be found or executed
+        if shell:
+            name = cmd
+        else:
+            name = args[0]
+        return EXITCODE_NOT_FOUND, "%s: %s\n" % (name, err.strerror)
+    finally:
+        devnull.close()
+
+    fd = proc.stdout.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR)
+
+    buf = OutputBuffer(maxoutput=maxoutput, spillfn=spillfn)
+    done = False
+    while not done:
+        for _ in poller.poll():
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                done = True
+                break
+            buf.add(data)
+
+    proc.stdout.close()
+    ec = proc.wait()
+
+    return ec, buf.value()
+
+
+class PersistentShell(object):
+    """Long-lived bash coprocess that runs the commands it is fed over a pipe
+        commands with shell features or builtins run in a subshell (so eg cd or exit don't affect the next command),
+        the other commands are executed directly by the shell (so without the fork of the subshell)
+        changes to os.environ since the previous command (eg SCOOP_COUNTER) are exported first
+    """
+    SHELL = ['/bin/bash', '--noprofile', '--norc']
+
+    def __init__(self):
+        self.marker = "__SCOOP_END_%s__" % uuid.uuid4().hex
+        # exitcode of the command follows the marker
+        self.end_regex = re.compile(r"%s (\d+)\n$" % re.escape(self.marker))
+        # never pass on the part of the output that could be the start of the marker
+        self.holdback = len(self.marker) + 8
+
+        self.environ = os.environ.copy()
+        # close_fds is slow, but only done once per worker
+        self.proc = subprocess.Popen(self.SHELL, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, close_fds=True)
+
+    def needs_subshell(self, cmd):
+        """Check if cmd has to run in a subshell: it uses shell features or it is a builtin (or empty)"""
+        if needs_shell(cmd):
+            return True
+        words = cmd.split()
+        return not words or words[0] in BASH_BUILTINS
+
+    def _environment_script(self):
+        """Generate the exports for the changes in os.environ since last command"""
+        script = []
+        for name, value in os.environ.items():
+            if self.environ.get(name) != value:
+                script.append("export %s=%s" % (name, pipes.quote(value)))
+        for name in self.environ.keys():
+            if not name in os.environ:
+                script.append("unset %s" % name)
+        self.environ = os.environ.copy()
+        return script
+
+    def run(self, cmd, maxoutput=None, spillfn=None):
+        """Run cmd and return (exitcode, output), like run_command
+            eval makes sure a syntax error in cmd doesn't kill the shell
+        """
+        script = self._environment_script()
+        if self.needs_subshell(cmd):
+            script.append("( eval %s ) </dev/null 2>&1" % pipes.quote(cmd))
+        else:
+            script.append("%s </dev/null 2>&1" % cmd)
+        script.append("printf '%%s %%d\\n' %s $?" % self.marker)
+        self.proc.stdin.write("\n".join(script) + "\n")
+        self.proc.stdin.flush()
+
+        fd = self.proc.stdout.fileno()
+        buf = OutputBuffer(maxoutput=maxoutput, spillfn=spillfn)
+        pending = ''
+        while True:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                # shell died
+                buf.add(pending)
+                self.close()
+                return EXITCODE_SHELL_DIED, buf.value()
+
+            pending += data
+            match = self.end_regex.search(pending)
+            if match:
+                buf.add(pending[:match.start()])
+                return int(match.group(1)), buf.value()
+            elif len(pending) > self.holdback:
+                buf.add(pending[:-self.holdback])
+                pending = pending[-self.holdback:]
+
+    def close(self):
+        """Stop the shell"""
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except IOError:
+                pass
+            self.proc.wait()
+            self.proc = None
+
+
+def run_persistent(cmd, maxoutput=None, spillfn=None):
+    """Run cmd in the persistent shell of this worker process (it is started on first use)"""
+    global _persistent_shell
+    if _persistent_shell is None or _persistent_shell.proc is None:
+        _persistent_shell = PersistentShell()
+    return _persistent_shell.run(cmd, maxoutput=maxoutput, spillfn=spillfn)
@@ -25,13 +25,32 @@
 ##
 """
 SCOOP piCalc exmaple module
+    arg1 = nr_batches, arg2 = batch_size, arg3 = kernel (numpy (default, if available) or python), arg4 = seed
+    each batch has its own random stream, seeded with the seed and the batch index,
+    so the same seed reproduces the result (whatever worker runs a batch)
+    reports samples/sec per worker and in aggregate (for strong/weak scaling runs)
 """
+import random as random_module
+import time
 from math import hypot
-from random import random
 from scoop import futures
+from vsc.mympirun.scoop.worker_utils import get_scoop_env
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
 
 NAME = 'SCOOP_piCalc'
 
+KERNEL_PYTHON = 'python'
+KERNEL_NUMPY = 'numpy'
+KERNELS = [KERNEL_PYTHON, KERNEL_NUMPY]
+SEED_DEFAULT = 42
+# the numpy kernel draws the samples in blocks of this size (bounded memory for large batches)
+NUMPY_BLOCK = 1024 * 1024
+
 # A range is used in this function for python3. If you are using python2,
 # an xrange might be more efficient.
 try:
@@ -39,28 +58,92 @@ try:
 except:
     range_fn = range
 
+def get_stream(kernel, seed, index):
+    """Return the random stream of batch index for kernel
+        seeded with seed and index only, so the streams of the batches are independent and reproducible
+    """
+    if kernel == KERNEL_NUMPY:
+        return numpy.random.RandomState([seed, index])
+    else:
+        return random_module.Random((seed << 32) + index)
+
+
+def test_python(tries, seed=SEED_DEFAULT, index=0):
+    """Pure Python kernel with the random stream of batch index"""
+    rnd = get_stream(KERNEL_PYTHON, seed, index).random
+    return sum(hypot(rnd(), rnd()) < 1 for i in range_fn(tries))
+
+
+def test_numpy(tries, seed=SEED_DEFAULT, index=0):
+    """NumPy vectorized kernel with the random stream of batch index"""
+    stream = get_stream(KERNEL_NUMPY, seed, index)
+    hits = 0
+    for start in range_fn(0, tries, NUMPY_BLOCK):
+        size = min(NUMPY_BLOCK, tries - start)
+        x = stream.random_sample(size)
+        y = stream.random_sample(size)
+        hits += int(numpy.count_nonzero(x * x + y * y < 1.0))
+    return hits
 
-def test(tries):
-    return sum(hypot(random(), random()) < 1 for i in range_fn(tries))
 
-# Calculates pi with a Monte-Carlo method. This function calls the function
-# test "n" times with an argument of "t". Scoop dispatches these
-# functions interactively accross the available ressources.
-def calcPi(workers, tries):
-    expr = futures.map(test, [tries] * workers)
-    piValue = 4. * sum(expr) / float(workers * tries)
-    return piValue
+KERNEL_FUNCTIONS = {
+    KERNEL_PYTHON: test_python,
+    KERNEL_NUMPY: test_numpy,
+}
+
+
+def test_batch(tries, kernel, seed, index):
+    """Run batch index with kernel, return (hits, worker, duration in seconds)"""
+    s_t = time.time()
+    hits = KERNEL_FUNCTIONS[kernel](tries, seed=seed, index=index)
+    return hits, get_scoop_env('worker_name'), time.time() - s_t
+
+
+def calcPi(nr_batches, tries, kernel, seed=SEED_DEFAULT):
+    """Calculate pi with kernel
+        returns (pi, wall time in seconds, dict worker -> (samples, busy time in seconds))
+    """
+    s_t = time.time()
+    res = list(futures.map(test_batch, [tries] * nr_batches, [kernel] * nr_batches, [seed] * nr_batches,
+                           range_fn(nr_batches)))
+    delta = time.time() - s_t
+
+    workers = {}
+    for _, worker, duration in res:
+        samples, busy = workers.get(worker, (0, 0.0))
+        workers[worker] = (samples + tries, busy + duration)
+    piValue = 4. * sum([x[0] for x in res]) / float(nr_batches * tries)
+    return piValue, delta, workers
 
 
 if __name__ == '__main__':
     import sys
     nr_batches = 3000
     batch_size = 5000
+    kernel = KERNEL_PYTHON
+    if HAS_NUMPY:
+        kernel = KERNEL_NUMPY
+    seed = SEED_DEFAULT
 
     try:
         nr_batches = int(sys.argv[1])
         batch_size = int(sys.argv[2])
+        kernel = sys.argv[3]
+        seed = int(sys.argv[4])
     except:
         pass
 
-    print "PI=%f (in nr_batches=%d,batch_size=%d)" % (calcPi(nr_batches, batch_size), nr_batches, batch_size)
+    if not kernel in KERNELS:
+        print "Unknown kernel %s (supported %s)" % (kernel, KERNELS)
+        sys.exit(1)
+    if kernel == KERNEL_NUMPY and not HAS_NUMPY:
+        print "Kernel %s requires numpy" % kernel
+        sys.exit(1)
+
+    piValue, delta, workers = calcPi(nr_batches, batch_size, kernel, seed=seed)
+    total = nr_batches * batch_size
+    print "PI=%f (in nr_batches=%d,batch_size=%d,kernel=%s)" % (piValue, nr_batches, batch_size, kernel)
+    print "AGGREGATE samples %d duration %fs samples/sec %f workers %d" % (total, delta, total / delta, len(workers))
+    for worker in sorted(workers):
+        samples, busy = workers[worker]
+        print "  Worker %s samples %d busy_time %fs samples/sec %f" % (worker, samples, busy, samples / max(busy, 1e-9))
@@ -25,11 +25,17 @@
 ##
 """
 Small test to print some execution details and statistics
+    arg1 = nr_batches, arg2 = duration of each batch in seconds (default 0)
+    the imbalance between the workers is reported to tune the scheduling (eg --scoop_prefetch, --scoop_highwatermark)
 """
+import itertools
 import os
+import socket
 import sys
 import time
-from vsc.mympirun.scoop.worker_utils import get_scoop_env, fix_freeorigin
+from vsc.mympirun.scoop.affinity import get_cpus_allowed, get_membind, format_cpulist
+from vsc.mympirun.scoop.worker_utils import get_scoop_env, fix_freeorigin, get_journal, coefficient_of_variation
+from vsc.mympirun.scoop.worker_utils import get_instrument, map_instrumented, report_instrument, TaskStats
 from scoop import futures
 
 try:
@@ -41,32 +47,56 @@ except:
 NAME = 'sanity'
 _DEBUG = True
 
-def sanity(counter):
+def sanity(counter, duration=0):
     s_t = time.time()
     worker = get_scoop_env('worker_name')
     origin = get_scoop_env('worker_origin')
     freeorigin = get_scoop_env('worker_freeorigin')
+    if duration:
+        time.sleep(duration)
     delta = time.time() - s_t
     if HAS_PSUTIL:
         affinity = psutil.Process(os.getpid()).get_cpu_affinity()
     else:
-        affinity = None
-    return counter, worker, origin, delta, affinity, freeorigin
+        affinity = get_cpus_allowed()
+    membind = get_membind()
+    return counter, worker, origin, delta, affinity, freeorigin, membind, socket.gethostname()
 
 if __name__ == '__main__':
     nr_batches = 1000
+    duration = 0
     try:
         nr_batches = int(sys.argv[1])
+        duration = float(sys.argv[2])
     except:
         pass
 
     fix_freeorigin()
 
+    journal = get_journal(NAME, nr_batches, duration)
+    counters = xrange(nr_batches)
+    if journal is not None:
+        counters = [x for x in counters if not journal.is_completed(x)]
+
     s_t = time.time()
-    res_generator = futures.map(sanity, xrange(nr_batches))
-    res = [x for x in res_generator]
+    stats = None
+    if get_instrument():
+        stats = TaskStats()
+        res_generator = map_instrumented(sanity, counters, itertools.repeat(duration), stats=stats)
+    else:
+        res_generator = futures.map(sanity, counters, itertools.repeat(duration))
+    res = []
+    for x in res_generator:
+        if journal is not None:
+            journal.record(x[0], x)
+        res.append(x)
     delta = time.time() - s_t
 
+    if journal is not None:
+        ## also report the batches of previous runs
+        res = sorted([x for _, x in journal.replay(all_records=True)])
+        journal.close()
+
     ## avg runtime
     global_total_time = sum([x[3] for x in res])
     global_avg_time = 1.0 * global_total_time / nr_batches
@@ -74,7 +104,7 @@ if __name__ == '__main__':
 
     workers = dict([(x, []) for x in set([y[1] for y in res])])
     for y in res:
-        workers[y[1]].append((y[3], y[4], "%s/%s" % (y[2], y[5])))
+        workers[y[1]].append((y[3], y[4], "%s/%s" % (y[2], y[5]), y[6], y[7]))
 
     ## TODO use scipy statistics. but you get the point
     ## TODO remove origin worker from stats
@@ -82,9 +112,35 @@ if __name__ == '__main__':
                                                                    min([len(x) for x in workers.values()]),
                                                                    max([len(x) for x in workers.values()]),
                                                                    )
+    ## imbalance: coefficient of variation over the workers
+    busy = dict([(w, sum([x[0] for x in workers[w]])) for w in workers])
+    print "IMBALANCE cv nr_batches %f cv busy_time %f (min %fs max %fs busy time per worker)" % (
+        coefficient_of_variation([len(x) for x in workers.values()]),
+        coefficient_of_variation(busy.values()),
+        min(busy.values()),
+        max(busy.values()),
+        )
     for w in workers:
-        print "  Worker %s nr_batches %s affinity %s (origin %s)" % (w,
+        print "  Worker %s nr_batches %s busy_time %fs affinity %s membind %s (origin %s)" % (w,
                                                          len(workers[w]),
+                                                         busy[w],
                                                          workers[w][0][1],
+                                                         workers[w][0][3],
                                                          workers[w][0][2],
                                                          )
+
+    ## verify that the workers on the same host don't share cpus
+    hosts = {}
+    for w in workers:
+        hosts.setdefault(workers[w][0][4], []).append((w, workers[w][0][1]))
+    for host, host_workers in hosts.items():
+        for idx, (w1, cpus1) in enumerate(host_workers):
+            for w2, cpus2 in host_workers[idx + 1:]:
+                if cpus1 is None or cpus2 is None:
+                    continue
+                overlap = sorted(set(cpus1) & set(cpus2))
+                if overlap:
+                    print "  WARNING host %s workers %s and %s share cpus %s" % (host, w1, w2, format_cpulist(overlap))
+
+    if stats is not None:
+        report_instrument(stats)
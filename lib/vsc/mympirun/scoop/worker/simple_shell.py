@@ -27,24 +27,150 @@
 SCOOP run of command and args in repeated environment
     provide environment variables so apps can benefit
 """
+import os
 import sys
-from vsc.utils.run import run_simple
-from vsc.mympirun.scoop.worker_utils import set_scoop_env, parse_worker_args, make_worker_log, fix_freeorigin
+from vsc.mympirun.scoop.run import run_command, run_persistent
+from vsc.mympirun.scoop.worker_utils import set_scoop_env, parse_worker_tasks, make_worker_log, fix_freeorigin
+from vsc.mympirun.scoop.worker_utils import get_chunksize, get_worker_command, get_scoop_env, map_stream, ResultSink
+from vsc.mympirun.scoop.worker_utils import get_scoop_env_bool, read_task_lines, count_task_lines, iter_chunks
+from vsc.mympirun.scoop.worker_utils import map_window, get_journal
+from vsc.mympirun.scoop.worker_utils import get_instrument, map_instrumented, report_instrument, TaskStats
+from vsc.mympirun.scoop.worker_utils import close_worker_log, merge_worker_logs, encode_result, decode_result
 from scoop import futures
 
 NAME = 'simple_shell'
 _DEBUG = True
 
+def worker_run_cmd(cmd, counter):
+    """Execute the cmd with SCOOP_COUNTER set to counter
+        large output is encoded for the transport (see worker_utils.encode_result), decode it with decode_result
+    """
+    set_scoop_env('counter', counter)
+
+    spillfn = None
+    spilldir = get_scoop_env('spilldir')
+    if spilldir is not None:
+        spillfn = os.path.join(spilldir, "scoop_%s_%s.out" % (NAME, counter))
+    if get_scoop_env_bool('persistent'):
+        run_func = run_persistent
+    else:
+        run_func = run_command
+    ec, out = run_func(cmd, maxoutput=get_scoop_env('maxoutput', int), spillfn=spillfn)
+
+    return  ec, encode_result(out)
+
 def worker_run_simple(counter):
     """Execute the cmd
         to be called with
     """
-    cmd_sanity = ["%s" % x for x in parse_worker_args()]  ## ready to join
-    set_scoop_env('counter', counter)
-    ec, out = run_simple(' '.join(cmd_sanity), disable_log=True)
+    ec, out = worker_run_cmd(get_worker_command().substitute(counter=counter, args=''), counter)
 
     return  ec, out  ## return 1 item
 
+def worker_run_simple_chunk(counters):
+    """Execute the cmd for a contiguous block of counters
+        returns list of (ec, out), one per counter
+    """
+    return [worker_run_simple(counter) for counter in counters]
+
+def worker_stream_simple(counter):
+    """Execute the cmd, return (counter, ec, out) so results can be streamed in any order"""
+    ec, out = worker_run_simple(counter)
+    return counter, ec, out
+
+def worker_stream_simple_chunk(counters):
+    """Execute the cmd for a contiguous block of counters
+        returns list of (counter, ec, out), one per counter
+    """
+    return [worker_stream_simple(counter) for counter in counters]
+
+def worker_run_line(task):
+    """Execute the cmd with the args from one line of the tasks file
+        task is (lineno, line), the line replaces the {args} placeholder or is appended to the cmd
+        SCOOP_COUNTER is set to the line number
+        returns (lineno, ec, out)
+    """
+    lineno, line = task
+    template = get_worker_command()
+    if 'args' in template.names:
+        cmd = template.substitute(counter=lineno, args=line)
+    else:
+        cmd = "%s %s" % (template.substitute(counter=lineno, args=''), line)
+    ec, out = worker_run_cmd(cmd, lineno)
+    return lineno, ec, out
+
+def worker_run_line_chunk(tasks):
+    """Execute the cmd for a block of lines of the tasks file
+        returns list of (lineno, ec, out), one per line
+    """
+    return [worker_run_line(task) for task in tasks]
+
+def run_counters(tasks, chunksize, journal=None):
+    """Generator that yields (counter, ec, out) for all tasks as the results arrive
+        tasks that are completed in the journal are not run again, their results are replayed from the journal first
+        new results are recorded in the journal
+    """
+    if journal is None:
+        chunks = tasks.chunks(chunksize)
+        pending = tasks
+    else:
+        for counter, (ec, out) in journal.replay():
+            yield counter, ec, out
+        pending = (counter for counter in tasks if not journal.is_completed(counter))
+        chunks = iter_chunks(pending, chunksize)
+
+    if chunksize > 1:
+        res_generator = map_stream(worker_stream_simple_chunk, chunks)
+    else:
+        res_generator = ([x] for x in map_stream(worker_stream_simple, pending))
+
+    for chunk in res_generator:
+        for counter, ec, out in chunk:
+            out = decode_result(out)
+            if journal is not None:
+                journal.record(counter, (ec, out))
+            yield counter, ec, out
+
+def run_tasks_file(taskfn, sink=None, journal=None):
+    """Run one task per line of the tasks file
+        lines are read lazily and at most SCOOP_WINDOW futures are outstanding
+        results are written to sink, or printed as they arrive
+        lines that are completed in the journal are not run again, their results are reported first
+    """
+    def report(lineno, ec, out):
+        if sink is None:
+            print (lineno, ec, out)
+        else:
+            sink.write(lineno, ec, out)
+
+    nr_tasks = None
+    if get_scoop_env('chunksize', int) == 0:
+        # automatic chunksize needs the number of tasks
+        nr_tasks = count_task_lines(taskfn)
+    chunksize = get_chunksize(nr_tasks)
+
+    count = 0
+    pending = read_task_lines(taskfn)
+    if journal is not None:
+        for lineno, (ec, out) in journal.replay():
+            report(lineno, ec, out)
+            count += 1
+        pending = (task for task in pending if not journal.is_completed(task[0]))
+
+    if chunksize > 1:
+        res_generator = map_window(worker_run_line_chunk, iter_chunks(pending, chunksize))
+    else:
+        res_generator = ([x] for x in map_window(worker_run_line, pending))
+
+    for chunk in res_generator:
+        for lineno, ec, out in chunk:
+            out = decode_result(out)
+            if journal is not None:
+                journal.record(lineno, (ec, out))
+            report(lineno, ec, out)
+            count += 1
+    return count
+
 if __name__ == '__main__':
     _log = make_worker_log(NAME, debug=_DEBUG)
 
@@ -53,16 +179,76 @@ if __name__ == '__main__':
     worker_func = worker_run_simple
 
     res = None
-    start, stop, step = parse_worker_args(False)
+    tasks = parse_worker_tasks()
+    chunksize = get_chunksize(len(tasks))
+    output = get_scoop_env('output')
+    taskfn = get_scoop_env('tasks')
+    journal = get_journal(NAME, sys.argv[1:], taskfn)
+    stats = None
     try:
-        _log.debug("main_run: going to start map")
-        res_generator = futures.map(worker_func, xrange(start, stop, step))
-        _log.debug("main_run: finished map")
-        res = [x for x in res_generator]
+        if taskfn:
+            _log.debug("main_run: going to run tasks from %s" % taskfn)
+            worker_func = worker_run_line
+            sink = None
+            if output:
+                sink = ResultSink(output, get_scoop_env('outputformat'))
+            try:
+                count = run_tasks_file(taskfn, sink=sink, journal=journal)
+            finally:
+                if sink is not None:
+                    sink.close()
+            if output:
+                res = "%s results written to %s" % (count, output)
+            else:
+                res = "%s results" % count
+        elif output:
+            _log.debug("main_run: going to stream results to %s with chunksize %s" % (output, chunksize))
+            worker_func = worker_stream_simple
+            sink = ResultSink(output, get_scoop_env('outputformat'))
+            try:
+                for counter, ec, out in run_counters(tasks, chunksize, journal=journal):
+                    sink.write(counter, ec, out)
+            finally:
+                sink.close()
+            res = "%s results written to %s" % (sink.count, output)
+        elif journal is not None:
+            _log.debug("main_run: going to start map with journal %s and chunksize %s" % (journal.filename, chunksize))
+            worker_func = worker_stream_simple
+            done = dict([(counter, (ec, out)) for counter, ec, out in run_counters(tasks, chunksize, journal=journal)])
+            res = [done[counter] for counter in tasks]
+        elif get_instrument():
+            _log.debug("main_run: going to start instrumented map with chunksize %s" % chunksize)
+            stats = TaskStats()
+            if chunksize > 1:
+                worker_func = worker_run_simple_chunk
+                res = [(ec, decode_result(out))
+                       for chunk in map_instrumented(worker_func, tasks.chunks(chunksize), stats=stats)
+                       for ec, out in chunk]
+            else:
+                res = [(ec, decode_result(out)) for ec, out in map_instrumented(worker_func, tasks, stats=stats)]
+        elif chunksize > 1:
+            _log.debug("main_run: going to start map with chunksize %s" % chunksize)
+            worker_func = worker_run_simple_chunk
+            res_generator = futures.map(worker_func, tasks.chunks(chunksize))
+            _log.debug("main_run: finished map")
+            res = [(ec, decode_result(out)) for chunk in res_generator for ec, out in chunk]
+        else:
+            _log.debug("main_run: going to start map")
+            res_generator = futures.map(worker_func, tasks)
+            _log.debug("main_run: finished map")
+            res = [(ec, decode_result(out)) for ec, out in res_generator]
         _log.debug("main_run: finished res from generator")
     except:
-        _log.exception("main_run: main failed with main_func %s with start %s stop %s" % (worker_func, start, stop))
+        _log.exception("main_run: main failed with main_func %s with %s tasks" % (worker_func, len(tasks)))
+    finally:
+        if journal is not None:
+            journal.close()
 
     print res
 
+    if stats is not None:
+        report_instrument(stats)
+
+    close_worker_log(_log)
+    merge_worker_logs(NAME)
 
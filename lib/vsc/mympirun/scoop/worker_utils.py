@@ -25,34 +25,265 @@
 #
 """
 A collection of functions and constants to use within worker modules
+    the bootstrap imports this module in every worker: the standard library modules are imported here,
+    the modules that are only needed by some functions (eg the codecs, the log merge or the broadcast)
+    are imported in those functions
 """
+import atexit
+import cPickle
+import errno
+import fcntl
+import itertools
+import logging
+import threading
+from collections import deque
 import os
+import re
+import resource
 import stat
 import sys
-from vsc.utils.fancylogger import getLogger, setLogLevelDebug, logToFile, disableDefaultHandlers
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from vsc.utils.fancylogger import getLogger, setLogLevelDebug, disableDefaultHandlers
 
 SCOOP_ENVIRONMENT_PREFIX = 'SCOOP'
 SCOOP_ENVIRONMENT_SEPARATOR = "_"
 
-def make_worker_log(name, debug=False, logfn_name=None, disable_defaulthandlers=False):
-    """Make a basic log object"""
+# id of the run (SCOOP_RUN_ID, set by myscoop), RUN_ID_DEFAULT if not set
+RUN_ID_DEFAULT = "uid%s" % os.getuid()
+
+# per worker log files, in SCOOP_LOGDIR (or $TMPDIR, or /tmp); merged in WORKER_LOG_MERGED by merge_worker_logs
+WORKER_LOG_DIR_DEFAULT = '/tmp'
+WORKER_LOG_TEMPLATE = "scoop_%(name)s_%(run)s_%(worker)s_%(pid)s.log"
+WORKER_LOG_MERGED = "scoop_%(name)s_%(run)s.log"
+# records start with the time (so the files of all workers can be merged in order)
+WORKER_LOG_FORMAT = "%%(created).6f %(worker)s %%(levelname)-8s %%(name)s %%(message)s"
+
+# output formats of the ResultSink
+RESULT_FORMAT_JSONL = 'jsonl'
+RESULT_FORMAT_PICKLE = 'pickle'
+RESULT_FORMATS = [RESULT_FORMAT_JSONL, RESULT_FORMAT_PICKLE]
+# flush the ResultSink at least every this many seconds
+RESULT_FLUSH_INTERVAL = 1
+
+# default task spec (if first arg is no task spec)
+WORKER_TASKS_DEFAULT = 10
+# placeholders in the worker command, substituted per task
+COMMAND_PLACEHOLDERS = ['counter', 'args']
+
+# per process cache of the parsed worker arguments and command
+_worker_args_cache = {}
+_worker_command_cache = {}
+
+# the journal is fsync'ed every this many records or seconds
+JOURNAL_SYNC_RECORDS = 100
+JOURNAL_SYNC_INTERVAL = 5
+JOURNAL_HEADER = 'SCOOP_JOURNAL'
+
+# automatic back-pressure window aims for this number of outstanding futures per worker
+WINDOW_PER_WORKER = 8
+
+# automatic chunksize aims for this number of chunks per worker (cfr. multiprocessing.Pool.map)
+CHUNKS_PER_WORKER = 4
+
+# result codecs (see encode_result): outputs larger than the threshold (in bytes) are compressed
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_LZ4 = 'lz4'
+CODECS = [CODEC_NONE, CODEC_ZLIB, CODEC_LZ4]
+CODEC_THRESHOLD_DEFAULT = 64 * 1024
+CODEC_ZLIB_LEVEL = 1  # fast, the goal is less bytes through the broker, not the best ratio
+# outputs over the resultfile limit are written to a node-local file, only the path is returned
+RESULTFILE_TEMPLATE = "scoop_result_%(worker)s_%(pid)s_%(idx)s.out"
+RESULTFILE_MESSAGE = "[output of %(size)s bytes in %(host)s:%(path)s]"
+
+# broadcast data: staged in SCOOP_BROADCAST_DIR (shared), copied once per host to the BROADCAST_RUNDIR of the run
+# in SCOOP_BROADCAST_LOCALDIR (removed when the worker that made the copy exits)
+BROADCAST_LOCALDIR_DEFAULT = '/dev/shm'
+BROADCAST_RUNDIR = "scoop_broadcast_%(run)s"
+BROADCAST_TEMPLATE = "scoop_broadcast_%(key)s"
+BROADCAST_PICKLE = 'pickle'
+BROADCAST_NUMPY = 'numpy'
+# per process cache of the mapped broadcast data
+_broadcast_cache = {}
+
+# per task instrumentation: the measured fields (in seconds, maxrss in kB) and the number of slowest tasks to report
+TASK_TIMINGS = ['queue_wait', 'run_time', 'cpu_time']
+TASK_REPORT_SLOWEST = 5
+
+class BackgroundFileHandler(logging.Handler):
+    """Logging handler that queues the records, a background thread writes them to the file
+        so logging never blocks the task on a slow (eg shared) filesystem
+    """
+    def __init__(self, filename):
+        logging.Handler.__init__(self)
+        self.filename = filename
+        from Queue import Queue  # do the import only here
+        self.queue = Queue()
+        self.fh = open(filename, 'a')
+        os.chmod(filename, stat.S_IRUSR | stat.S_IWUSR)
+
+        self.thread = threading.Thread(target=self._write, name="%s-%s" % (self.__class__.__name__, filename))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record):
+        """Format the record and queue it (formatting here, so the record args are not shared with the thread)"""
+        try:
+            self.queue.put(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def _write(self):
+        """Background thread: write the queued records, flush when the queue is empty"""
+        while True:
+            txt = self.queue.get()
+            if txt is None:
+                break
+            self.fh.write(txt)
+            if self.queue.empty():
+                self.fh.flush()
+        self.fh.close()
+
+    def close(self):
+        """Write the remaining records and stop the thread (called by logging.shutdown at exit)"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        logging.Handler.close(self)
+
+def get_hostname():
+    """Return the hostname (as socket.gethostname does)"""
+    return os.uname()[1]
+
+def has_lz4():
+    """Check if the lz4 module (for CODEC_LZ4) is available"""
+    try:
+        import lz4.frame  # do the import only here
+        return True
+    except ImportError:
+        return False
+
+def get_run_id():
+    """Return the id of the run (SCOOP_RUN_ID environment variable, or RUN_ID_DEFAULT)"""
+    return get_scoop_env('run_id') or RUN_ID_DEFAULT
+
+def get_worker_logdir():
+    """Determine the directory of the worker logs: SCOOP_LOGDIR, $TMPDIR or WORKER_LOG_DIR_DEFAULT"""
+    return get_scoop_env('logdir') or os.environ.get('TMPDIR') or WORKER_LOG_DIR_DEFAULT
+
+def make_worker_log(name, debug=False, logfn_name=None, disable_defaulthandlers=False, level=None):
+    """Make a basic log object
+        the log is written in the background to a per worker file (see WORKER_LOG_TEMPLATE) in get_worker_logdir
+        level (default SCOOP_LOGLEVEL environment variable, or DEBUG if debug is set) is the loglevel name
+            (an unknown name is logged as a warning and ignored)
+    """
     if logfn_name is None:
         logfn_name = name
-    logfn = '/tmp/scoop_%s.log' % logfn_name
+    worker = get_scoop_env('worker_name') or 'worker'
+    logfn = os.path.join(get_worker_logdir(), WORKER_LOG_TEMPLATE % {'name': logfn_name, 'run': get_run_id(),
+                                                                     'worker': worker, 'pid': os.getpid()})
 
     if debug:
         setLogLevelDebug()
 
-    logToFile(logfn, name=name)
-    os.chmod(logfn, stat.S_IRUSR | stat.S_IWUSR)
-
     if disable_defaulthandlers:
         disableDefaultHandlers()
 
     _log = getLogger(name=name)
 
+    if level is None:
+        level = get_scoop_env('loglevel')
+    handler = BackgroundFileHandler(logfn)
+    handler.setFormatter(logging.Formatter(WORKER_LOG_FORMAT % {'worker': worker}))
+    _log.addHandler(handler)
+    if level is not None:
+        levelno = logging.getLevelName(level.upper())
+        if isinstance(levelno, int):
+            _log.setLevel(levelno)
+        else:
+            _log.warning("make_worker_log: unknown loglevel %s, keeping the default" % level)
+
     return _log
 
+def close_worker_log(log):
+    """Write the remaining records of the worker log and close its file (eg before merge_worker_logs)"""
+    for handler in log.handlers[:]:
+        if isinstance(handler, BackgroundFileHandler):
+            log.removeHandler(handler)
+            handler.close()
+
+def _read_log_records(fh):
+    """Generator that yields (time, record) of an open worker log file, continuation lines (eg tracebacks) included
+        the file is closed at the end
+    """
+    try:
+        record = None
+        for line in fh:
+            try:
+                created = float(line.split(' ', 1)[0])
+            except ValueError:
+                created = None
+            if created is None and record is not None:
+                record[1] += line
+                continue
+            if record is not None:
+                yield tuple(record)
+            record = [created or 0.0, line]
+        if record is not None:
+            yield tuple(record)
+    finally:
+        fh.close()
+
+def merge_worker_logs(name, logdir=None, remove=True, run_id=None):
+    """Merge the per worker log files of name of this run (run_id, default get_run_id) in logdir
+        (default get_worker_logdir) in time order
+        (the origin can only merge the files it can see, eg on a shared or its node-local logdir)
+        files that can't be read or removed are skipped
+        returns the merged filename (WORKER_LOG_MERGED) or None if there are no worker logs
+    """
+    import glob  # do the import only here
+    import heapq
+    log = getLogger('merge_worker_logs')
+    if logdir is None:
+        logdir = get_worker_logdir()
+    if run_id is None:
+        run_id = get_run_id()
+    pattern = WORKER_LOG_TEMPLATE % {'name': name, 'run': run_id, 'worker': '*', 'pid': '*'}
+
+    handles = []
+    for fn in glob.glob(os.path.join(logdir, pattern)):
+        try:
+            handles.append((fn, open(fn)))
+        except IOError, err:
+            log.warning("merge_worker_logs: skipping %s: %s" % (fn, err))
+    if not handles:
+        return None
+
+    merged = os.path.join(logdir, WORKER_LOG_MERGED % {'name': name, 'run': run_id})
+    try:
+        fh = open(merged, 'w')
+        os.chmod(merged, stat.S_IRUSR | stat.S_IWUSR)
+        try:
+            for _, record in heapq.merge(*[_read_log_records(x[1]) for x in handles]):
+                fh.write(record)
+        finally:
+            fh.close()
+    except (IOError, OSError), err:
+        log.error("merge_worker_logs: failed to write %s: %s" % (merged, err))
+        return None
+
+    if remove:
+        for fn, _ in handles:
+            try:
+                os.remove(fn)
+            except OSError, err:
+                log.warning("merge_worker_logs: failed to remove %s: %s" % (fn, err))
+    return merged
+
 def _get_scoop_env_name(name):
     """Geneate the SCOOP environment name"""
     envname = "".join([SCOOP_ENVIRONMENT_PREFIX, SCOOP_ENVIRONMENT_SEPARATOR, name.upper()])
@@ -86,36 +317,934 @@ def get_scoop_env_bool(name):
     else:
         return True
 
+def _parse_range(txt):
+    """Parse [start:]stop[:step], return xrange instance (raises ValueError if txt doesn't match)"""
+    values = [int(x) for x in txt.split(':')]
+    if not 1 <= len(values) <= 3:
+        raise ValueError("Not a [start:]stop[:step] range: %s" % txt)
+    return xrange(*values)
+
+class WorkerTasks(object):
+    """The task counters of a worker task spec, a list of xrange instances
+        consecutive single counters are merged into one range
+    """
+    def __init__(self):
+        self.ranges = []
+
+    def add_range(self, counters):
+        """Add xrange instance"""
+        self.ranges.append(counters)
+
+    def add_counter(self, counter):
+        """Add single counter"""
+        if self.ranges:
+            last = self.ranges[-1]
+            if len(last) > 0 and last[-1] == counter - 1 and (len(last) == 1 or last[1] - last[0] == 1):
+                self.ranges[-1] = xrange(last[0], counter + 1)
+                return
+        self.ranges.append(xrange(counter, counter + 1))
+
+    def add_spec(self, spec):
+        """Add comma-separated list of counters and [start:]stop[:step] ranges"""
+        for item in spec.split(','):
+            item = item.strip()
+            if ':' in item:
+                self.add_range(_parse_range(item))
+            else:
+                self.add_counter(int(item))
+
+    def __iter__(self):
+        return itertools.chain(*self.ranges)
+
+    def __len__(self):
+        return sum([len(x) for x in self.ranges])
+
+    def chunks(self, chunksize):
+        """Contiguous blocks of at most chunksize counters (a block never spans multiple ranges)"""
+        res = []
+        for counters in self.ranges:
+            if len(counters) > 0:
+                step = len(counters) > 1 and counters[1] - counters[0] or 1
+                res.extend(make_chunks(counters[0], counters[-1] + step, step, chunksize))
+        return res
+
+def _parse_worker_tasks(arg1):
+    """Parse the task spec, return WorkerTasks instance or None if arg1 is no task spec
+        @filename: file with comma-separated lists of counters and ranges
+            (empty lines and lines starting with # are ignored; IOError if the file doesn't exist)
+        [start:]stop[:step]: single range (a single number is the stop value)
+        otherwise: comma-separated list of counters and [start:]stop[:step] ranges
+    """
+    tasks = WorkerTasks()
+    try:
+        if arg1.startswith('@'):
+            if not os.path.isfile(arg1[1:]):
+                raise IOError("Task spec %s: no such file %s" % (arg1, arg1[1:]))
+            for line in open(arg1[1:]):
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    tasks.add_spec(line)
+        elif ',' in arg1:
+            tasks.add_spec(arg1)
+        else:
+            tasks.add_range(_parse_range(arg1))
+    except ValueError:
+        return None
+    return tasks
+
+def _get_worker_args():
+    """Parse sys.argv once per process
+        returns (WorkerTasks instance, executable args)
+        with a tasks file (SCOOP_TASKS) there is no task spec, all args are the executable args
+    """
+    taskfn = get_scoop_env('tasks')
+    key = (tuple(sys.argv), taskfn)
+    if not key in _worker_args_cache:
+        tasks = None
+        if len(sys.argv) > 1 and not taskfn:
+            tasks = _parse_worker_tasks(sys.argv[1])
+        if tasks is not None:
+            offset = 2
+        else:
+            tasks = WorkerTasks()
+            if not taskfn:
+                tasks.add_range(xrange(WORKER_TASKS_DEFAULT))
+            offset = 1
+        _worker_args_cache.clear()
+        _worker_args_cache[key] = (tasks, sys.argv[offset:])
+
+    return _worker_args_cache[key]
+
+def parse_worker_tasks():
+    """Return the WorkerTasks instance from the task spec in first arg
+        supports [start:]stop[:step], lists and multiple ranges (eg 0:10,20:30:2,42) and @filename
+    """
+    return _get_worker_args()[0]
+
 def parse_worker_args(executable=True):
     """Parse the arguments
-        check if first arg matches [start:]stop[:step]
+        check if first arg is a task spec (see parse_worker_tasks), eg [start:]stop[:step]
+        executable: return the executable and its arguments
+        otherwise: return (start, stop, step) of the (first) range (use parse_worker_tasks for other specs)
+            an empty task spec (eg an @filename with only comments) is the empty range (0, 0, 1)
+        the result is cached per process
     """
-    offset = 1
+    tasks, args = _get_worker_args()
+    if executable:
+        return args
+    else:
+        if not tasks.ranges:
+            return 0, 0, 1
+        counters = tasks.ranges[0]
+        if len(counters) == 0:
+            return 0, 0, 1
+        step = len(counters) > 1 and counters[1] - counters[0] or 1
+        return counters[0], counters[-1] + step, step
 
-    start = 0
-    stop = 10
-    step = 1
+class CommandTemplate(object):
+    """Command with placeholders (eg {counter}) that are substituted per task
+        the command is split in literal parts and placeholders once, so substitution doesn't re-tokenize
+        braces that are no known placeholder (eg ${HOME} or awk '{print $1}') are kept as is
+    """
+    def __init__(self, cmd, placeholders=None):
+        if placeholders is None:
+            placeholders = COMMAND_PLACEHOLDERS
+        regex = re.compile(r'\{(%s)\}' % '|'.join([re.escape(x) for x in placeholders]))
+        # even indices are literal parts, odd indices are placeholder names
+        self.parts = regex.split(cmd)
+        self.names = set(self.parts[1::2])
+
+    def substitute(self, **values):
+        """Return the command with the placeholders replaced by values"""
+        if not self.names:
+            return self.parts[0]
+        res = self.parts[:]
+        for idx in xrange(1, len(res), 2):
+            res[idx] = "%s" % values[res[idx]]
+        return ''.join(res)
+
+def get_worker_command():
+    """Return the CommandTemplate of the executable and its arguments (cached per process)"""
+    key = (tuple(sys.argv), get_scoop_env('tasks'))
+    if not key in _worker_command_cache:
+        _worker_command_cache.clear()
+        _worker_command_cache[key] = CommandTemplate(' '.join(["%s" % x for x in parse_worker_args()]))
+    return _worker_command_cache[key]
+
+def get_chunksize(nr_tasks, nr_workers=None, chunksize=None):
+    """Determine the number of tasks to run per SCOOP future
+        chunksize None: use SCOOP_CHUNKSIZE environment variable (defaults to 1, ie one future per task)
+        chunksize 0: automatic, based on nr_tasks and nr_workers (defaults to SCOOP_SIZE)
+    """
+    if chunksize is None:
+        chunksize = get_scoop_env('chunksize', int)
+        if chunksize is None:
+            chunksize = 1
+
+    if chunksize == 0:
+        if nr_workers is None:
+            nr_workers = get_scoop_env('size', int)
+        if not nr_workers:
+            nr_workers = 1
+        chunksize, extra = divmod(nr_tasks, nr_workers * CHUNKS_PER_WORKER)
+        if extra:
+            chunksize += 1
 
-    arg1 = sys.argv[1]
+    return max(chunksize, 1)
+
+def make_chunks(start, stop, step, chunksize):
+    """Split the [start:]stop[:step] range in contiguous blocks of at most chunksize counters
+        returns a list of xrange instances (they pickle as start, stop, step)
+    """
+    nr_tasks = len(xrange(start, stop, step))
+    chunks = []
+    for idx in xrange(0, nr_tasks, chunksize):
+        first = start + idx * step
+        size = min(chunksize, nr_tasks - idx)
+        chunks.append(xrange(first, first + size * step, step))
+    return chunks
+
+def read_task_lines(filename):
+    """Generator that lazily yields (lineno, line) of the tasks file
+        empty lines and lines starting with # are skipped
+    """
+    fh = open(filename)
     try:
-        arg1 = arg1.split(':')
-        if len(arg1) == 1:
-            stop = int(arg1[0])
-        elif len(arg1) == 2:
-            start = int(arg1[0])
-            stop = int(arg1[1])
-        elif len(arg1) == 3:
-            start = int(arg1[0])
-            stop = int(arg1[1])
-            step = int(arg1[2])
-        offset += 1
-    except:
-        pass
+        for lineno, line in enumerate(fh, 1):
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield lineno, line
+    finally:
+        fh.close()
 
-    if executable:
-        return sys.argv[offset:]
+def count_task_lines(filename):
+    """Count the tasks in the tasks file (without keeping them in memory)"""
+    nr_tasks = 0
+    for _ in read_task_lines(filename):
+        nr_tasks += 1
+    return nr_tasks
+
+def iter_chunks(iterable, chunksize):
+    """Generator that lazily yields lists of at most chunksize items of iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            break
+        yield chunk
+
+def get_prefetch():
+    """Determine the prefetch depth: the number of outstanding futures per worker
+        uses SCOOP_PREFETCH environment variable, 0 or unset is WINDOW_PER_WORKER
+    """
+    return get_scoop_env('prefetch', int) or WINDOW_PER_WORKER
+
+def get_window(nr_workers=None):
+    """Determine the maximum number of outstanding futures for map_window
+        uses SCOOP_WINDOW environment variable, 0 or unset is automatic (based on nr_workers, defaults to SCOOP_SIZE)
+    """
+    window = get_scoop_env('window', int)
+    if not window:
+        if nr_workers is None:
+            nr_workers = get_scoop_env('size', int)
+        window = max(nr_workers or 1, 1) * get_prefetch()
+    return window
+
+def map_window(func, iterable, window=None):
+    """Generator that yields the results of func over iterable in order
+        at most window futures are submitted but not returned yet, and iterable is consumed lazily,
+        so the origin never holds all tasks or results (back-pressure)
+    """
+    from scoop import futures  # do the import only here
+    if window is None:
+        window = get_window()
+
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(futures.submit(func, item))
+
+    while pending:
+        yield pending.popleft().result()
+
+def map_stream(func, iterable):
+    """Generator that yields the results as soon as they arrive
+        uses futures.map_as_completed (unordered) when available, ordered futures.map otherwise
+    """
+    from scoop import futures  # do the import only here
+    mapper = getattr(futures, 'map_as_completed', futures.map)
+    for res in mapper(func, iterable):
+        yield res
+
+class ResultSink(object):
+    """Write (counter, ec, out) results to file as soon as they arrive
+        jsonl: one JSON dict per line
+        pickle: stream of pickled tuples (compact binary format)
+    """
+    def __init__(self, filename, fmt=None):
+        if fmt is None:
+            fmt = RESULT_FORMAT_JSONL
+        if not fmt in RESULT_FORMATS:
+            raise ValueError("Unknown result format %s (supported %s)" % (fmt, RESULT_FORMATS))
+
+        self.filename = filename
+        self.fmt = fmt
+        self.count = 0
+        self.fh = open(filename, 'wb')
+        self.last_flush = time.time()
+
+    def write(self, counter, ec, out):
+        """Write one result, flush every RESULT_FLUSH_INTERVAL seconds"""
+        if self.fmt == RESULT_FORMAT_JSONL:
+            if isinstance(out, str):
+                out = out.decode('utf8', 'replace')
+            self.fh.write(json.dumps({'counter': counter, 'ec': ec, 'out': out}) + "\n")
+        else:
+            cPickle.dump((counter, ec, out), self.fh, cPickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+        now = time.time()
+        if now - self.last_flush > RESULT_FLUSH_INTERVAL:
+            self.fh.flush()
+            self.last_flush = now
+
+    def close(self):
+        """Close the file"""
+        self.fh.close()
+
+def read_results(filename, fmt=None):
+    """Generator that yields the (counter, ec, out) tuples written by a ResultSink"""
+    if fmt is None:
+        fmt = RESULT_FORMAT_JSONL
+
+    fh = open(filename, 'rb')
+    try:
+        if fmt == RESULT_FORMAT_JSONL:
+            for line in fh:
+                res = json.loads(line)
+                yield res['counter'], res['ec'], res['out']
+        else:
+            while True:
+                try:
+                    yield cPickle.load(fh)
+                except EOFError:
+                    break
+    finally:
+        fh.close()
+
+def journal_key(*items):
+    """Generate the journal key of a task spec from items (eg the worker arguments)"""
+    import hashlib  # do the import only here
+    return hashlib.md5(repr(items)).hexdigest()
+
+class Journal(object):
+    """Append-only journal of completed tasks and their results, written by the origin as results arrive
+        a restarted run with the same key (see journal_key) reads the completed tasks, so it can skip them
+        only the ids of the completed tasks are kept in memory, the results are replayed from the file (see replay)
+        the journal is a stream of pickled (task id, result) tuples, after a (JOURNAL_HEADER, key) header
+        records are fsync'ed in batches (every JOURNAL_SYNC_RECORDS records or JOURNAL_SYNC_INTERVAL seconds)
+    """
+    def __init__(self, filename, key):
+        self.filename = filename
+        self.key = key
+        self.completed = set()
+        self.loaded_end = 0  # end of the records of the previous runs
+        self.header = cPickle.dumps((JOURNAL_HEADER, key), cPickle.HIGHEST_PROTOCOL)
+
+        exists = os.path.exists(filename) and os.path.getsize(filename) > 0
+        if exists and self._partial_header():
+            # eg the run was killed while creating the journal
+            open(filename, 'wb').close()
+            exists = False
+        if exists:
+            self._load()
+
+        self.fh = open(filename, 'ab')
+        if not exists:
+            self.fh.write(self.header)
+            self.sync()
+
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def _partial_header(self):
+        """Check if the journal file only has a part of the header"""
+        fh = open(self.filename, 'rb')
+        data = fh.read(len(self.header))
+        fh.close()
+        return len(data) < len(self.header) and self.header.startswith(data)
+
+    def _load(self):
+        """Read the completed tasks from the existing journal
+            a partial record at the end (eg when the run was killed while writing) is ignored
+        """
+        fh = open(self.filename, 'rb')
+        try:
+            try:
+                header = cPickle.load(fh)
+            except (EOFError, cPickle.UnpicklingError, ValueError, TypeError):
+                raise ValueError("Journal %s has no valid header (not a journal?)" % self.filename)
+            if header != (JOURNAL_HEADER, self.key):
+                raise ValueError("Journal %s has header %s, expected key %s (different task spec?)" %
+                                 (self.filename, header, self.key))
+            while True:
+                pos = fh.tell()
+                try:
+                    task_id, result = cPickle.load(fh)
+                except (EOFError, cPickle.UnpicklingError, ValueError, TypeError):
+                    break
+                self.completed.add(task_id)
+        finally:
+            fh.close()
+        self.loaded_end = pos
+
+        # drop the partial record, so new records are appended after the last complete one
+        if pos < os.path.getsize(self.filename):
+            fh = open(self.filename, 'r+b')
+            fh.truncate(pos)
+            fh.close()
+
+    def replay(self, all_records=False):
+        """Generator that yields the (task id, result) records of the previous runs from the journal file
+            all_records: also the records of this run
+        """
+        if all_records:
+            self.sync()
+            end = os.path.getsize(self.filename)
+        else:
+            end = self.loaded_end
+
+        fh = open(self.filename, 'rb')
+        try:
+            cPickle.load(fh)  # header
+            while fh.tell() < end:
+                yield cPickle.load(fh)
+        finally:
+            fh.close()
+
+    def is_completed(self, task_id):
+        """Check if task_id is completed in a previous run (or this one)"""
+        return task_id in self.completed
+
+    def record(self, task_id, result):
+        """Add the result of a completed task"""
+        cPickle.dump((task_id, result), self.fh, cPickle.HIGHEST_PROTOCOL)
+        self.completed.add(task_id)
+        self.unsynced += 1
+
+        if self.unsynced >= JOURNAL_SYNC_RECORDS or time.time() - self.last_sync > JOURNAL_SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        """Flush and fsync the journal"""
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        """Sync and close the journal"""
+        self.sync()
+        self.fh.close()
+
+def get_journal(*items):
+    """Return the Journal for the task spec items (see journal_key) from SCOOP_JOURNAL environment variable
+        returns None if no journal is configured
+    """
+    filename = get_scoop_env('journal')
+    if not filename:
+        return None
+    return Journal(filename, journal_key(*items))
+
+def get_worker_cpuset():
+    """Return the list of cpus of the core set of this worker (SCOOP_WORKER_CPUSET), None if not set
+        (eg to pin the processes of a nested MPI run)
+    """
+    cpuset = get_scoop_env('worker_cpuset')
+    if not cpuset:
+        return None
+    from vsc.mympirun.scoop.affinity import parse_cpulist  # do the import only here
+    return parse_cpulist(cpuset)
+
+def get_scheduling():
+    """Return dict with the execution queue settings of the SCOOP_HIGHWATERMARK, SCOOP_LOWWATERMARK
+        and SCOOP_STEALING environment variables (None if not set)
+    """
+    stealing = None
+    if get_scoop_env('stealing') is not None:
+        stealing = get_scoop_env_bool('stealing')
+    return {
+        'highwatermark': get_scoop_env('highwatermark', float),
+        'lowwatermark': get_scoop_env('lowwatermark', float),
+        'stealing': stealing,
+    }
+
+def set_scheduling(queue=None, highwatermark=None, lowwatermark=None, stealing=None):
+    """Tune the SCOOP execution queue (default the queue of this worker)
+        the watermarks are the (estimated) seconds of queued work
+            above highwatermark, queued futures are handed back to the broker, so idle workers can take them
+            below lowwatermark, the worker requests work from the broker
+        stealing False: never hand back queued futures (an infinite highwatermark)
+        values that are None are taken from get_scheduling, and left unchanged if not set there either
+    """
+    if queue is None:
+        from scoop import _control  # do the import only here
+        queue = _control.execQueue
+
+    settings = get_scheduling()
+    if highwatermark is None:
+        highwatermark = settings['highwatermark']
+    if lowwatermark is None:
+        lowwatermark = settings['lowwatermark']
+    if stealing is None:
+        stealing = settings['stealing']
+
+    if stealing is False:
+        highwatermark = float('inf')
+    if highwatermark is not None:
+        queue.highwatermark = highwatermark
+    if lowwatermark is not None:
+        queue.lowwatermark = lowwatermark
+
+def coefficient_of_variation(values):
+    """Return the coefficient of variation (standard deviation / mean) of values, 0.0 if the mean is 0"""
+    if not values:
+        return 0.0
+    mean = 1.0 * sum(values) / len(values)
+    if mean == 0:
+        return 0.0
+    variance = sum([(x - mean) ** 2 for x in values]) / len(values)
+    return variance ** 0.5 / mean
+
+class EncodedResult(object):
+    """Compressed result, made by encode_result (the value is pickled first if it isn't a str)
+        decode() returns the original value
+    """
+    def __init__(self, codec, data, size, pickled=False):
+        self.codec = codec
+        self.data = data
+        self.size = size
+        self.pickled = pickled
+
+    def decode(self):
+        """Return the original value"""
+        if self.codec == CODEC_ZLIB:
+            import zlib  # do the import only here
+            data = zlib.decompress(self.data)
+        elif self.codec == CODEC_LZ4:
+            import lz4.frame  # do the import only here
+            data = lz4.frame.decompress(self.data)
+        else:
+            data = self.data
+        if self.pickled:
+            return cPickle.loads(data)
+        return data
+
+class ResultFile(object):
+    """Result that was written to a node-local file by encode_result
+        decode() returns the content if the file can be read (eg on the same node), a message with the path otherwise
+    """
+    def __init__(self, host, path, size, pickled=False):
+        self.host = host
+        self.path = path
+        self.size = size
+        self.pickled = pickled
+
+    def decode(self):
+        """Return the original value or a message with the location of the file"""
+        if self.host == get_hostname() and os.path.exists(self.path):
+            data = open(self.path, 'rb').read()
+            if self.pickled:
+                return cPickle.loads(data)
+            return data
+        return RESULTFILE_MESSAGE % {'size': self.size, 'host': self.host, 'path': self.path}
+
+_resultfile_counter = itertools.count()
+
+def get_codec():
+    """Return dict with the codec settings from the environment
+        codec (SCOOP_CODEC, default none), threshold (SCOOP_CODEC_THRESHOLD, default CODEC_THRESHOLD_DEFAULT),
+        resultfile_limit (SCOOP_RESULTFILE_LIMIT, 0 or unset is disabled),
+        resultfile_dir (SCOOP_RESULTFILE_DIR, default get_worker_logdir) and
+        protocol (SCOOP_PICKLEPROTOCOL, default highest)
+    """
+    protocol = get_scoop_env('pickleprotocol', int)
+    if protocol is None:
+        protocol = cPickle.HIGHEST_PROTOCOL
+    threshold = get_scoop_env('codec_threshold', int)
+    if threshold is None:
+        threshold = CODEC_THRESHOLD_DEFAULT
+    return {
+        'codec': get_scoop_env('codec') or CODEC_NONE,
+        'threshold': threshold,
+        'resultfile_limit': get_scoop_env('resultfile_limit', int) or 0,
+        'resultfile_dir': get_scoop_env('resultfile_dir') or get_worker_logdir(),
+        'protocol': protocol,
+    }
+
+def encode_result(value, **kwargs):
+    """Encode a large task result for the transport through the broker (opt-in, default settings from get_codec)
+        values of at most threshold bytes are returned unchanged
+        values over resultfile_limit bytes are written to a file in resultfile_dir, a ResultFile is returned
+        other values are compressed with codec, an EncodedResult is returned (unless compression doesn't help)
+        values that are not a str are pickled first with protocol (so they can be compressed too)
+        decode with decode_result
+    """
+    settings = get_codec()
+    settings.update(kwargs)
+    if settings['codec'] == CODEC_NONE and not settings['resultfile_limit']:
+        return value
+
+    pickled = not isinstance(value, str)
+    if pickled:
+        data = cPickle.dumps(value, settings['protocol'])
     else:
-        return start, stop, step
+        data = value
+    size = len(data)
+    if size <= settings['threshold']:
+        return value
+
+    if settings['resultfile_limit'] and size > settings['resultfile_limit']:
+        path = os.path.join(settings['resultfile_dir'],
+                            RESULTFILE_TEMPLATE % {'worker': get_scoop_env('worker_name') or 'worker',
+                                                   'pid': os.getpid(), 'idx': _resultfile_counter.next()})
+        fh = open(path, 'wb')
+        try:
+            fh.write(data)
+        finally:
+            fh.close()
+        return ResultFile(get_hostname(), path, size, pickled=pickled)
+
+    if settings['codec'] == CODEC_ZLIB:
+        import zlib  # do the import only here
+        compressed = zlib.compress(data, CODEC_ZLIB_LEVEL)
+    elif settings['codec'] == CODEC_LZ4:
+        if not has_lz4():
+            raise ValueError("encode_result: codec %s requires the lz4 module" % CODEC_LZ4)
+        import lz4.frame  # do the import only here
+        compressed = lz4.frame.compress(data)
+    elif settings['codec'] == CODEC_NONE:
+        return value
+    else:
+        raise ValueError("encode_result: unknown codec %s (supported %s)" % (settings['codec'], CODECS))
+
+    if len(compressed) >= size:
+        return value
+    return EncodedResult(settings['codec'], compressed, size, pickled=pickled)
+
+def decode_result(value):
+    """Return the original value of a result made by encode_result (other values are returned unchanged)"""
+    if isinstance(value, (EncodedResult, ResultFile)):
+        return value.decode()
+    return value
+
+class BroadcastHandle(object):
+    """Lightweight handle of broadcast data, pass it to the tasks instead of the data (see broadcast)
+        get() returns the data: a read-only numpy.memmap for NumPy arrays (zero-copy, shared by the workers
+        on the host through the page cache), the unpickled object otherwise (once per worker process)
+    """
+    def __init__(self, key, host, source, kind, size, dtype=None, shape=None):
+        self.key = key
+        self.host = host
+        self.source = source
+        self.kind = kind
+        self.size = size
+        self.dtype = dtype
+        self.shape = shape
+
+    def _load(self, path):
+        """Load the data from path"""
+        if self.kind == BROADCAST_NUMPY:
+            import numpy  # do the import only here
+            return numpy.memmap(path, dtype=numpy.dtype(self.dtype), mode='r', shape=self.shape)
+        fh = open(path, 'rb')
+        try:
+            return cPickle.load(fh)
+        finally:
+            fh.close()
+
+    def _load_local(self):
+        """Load the data from the node-local copy of the run, make the copy first if needed
+            (one worker per host copies, the others wait for it)
+            the copy is loaded while holding the lock, so it can't be removed in the meantime by the worker
+            that made it (when that worker exits, the other workers keep their open mappings)
+        """
+        localdir = get_scoop_env('broadcast_localdir') or BROADCAST_LOCALDIR_DEFAULT
+        rundir = os.path.join(localdir, BROADCAST_RUNDIR % {'run': get_run_id()})
+        path = os.path.join(rundir, BROADCAST_TEMPLATE % {'key': self.key})
+        lockfn = "%s.lock" % path
+
+        lock = _lock_broadcast_copy(rundir, lockfn)
+        try:
+            if not os.path.exists(path):
+                tmp = "%s.%s" % (path, os.getpid())
+                import shutil  # do the import only here
+                shutil.copyfile(self.source, tmp)
+                os.rename(tmp, path)
+                atexit.register(_remove_broadcast_copy, rundir, path, lockfn)
+            return self._load(path)
+        finally:
+            lock.close()
+
+    def get(self):
+        """Return the broadcast data (cached per process)"""
+        if not self.key in _broadcast_cache:
+            if self.host == get_hostname():
+                data = self._load(self.source)
+            else:
+                data = self._load_local()
+            _broadcast_cache[self.key] = data
+        return _broadcast_cache[self.key]
+
+    def release(self):
+        """Remove the staged data (on the origin, when all tasks are done)
+            the node-local copies are removed by the workers that made them, when they exit
+        """
+        _broadcast_cache.pop(self.key, None)
+        if os.path.exists(self.source):
+            os.remove(self.source)
+
+    def __repr__(self):
+        return "%s(%s, %s bytes)" % (self.__class__.__name__, self.key, self.size)
+
+def _lock_broadcast_copy(rundir, lockfn):
+    """Return the open lock file of a node-local copy, locked exclusively
+        (the lock file is removed together with the copy, so retry when it was removed while waiting for the lock)
+    """
+    while True:
+        try:
+            os.mkdir(rundir, stat.S_IRWXU)
+        except OSError, err:
+            if err.errno != errno.EEXIST:
+                raise
+        try:
+            lock = open(lockfn, 'a')
+        except IOError, err:
+            if err.errno == errno.ENOENT:
+                continue  # the run directory was removed in the meantime
+            raise
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.fstat(lock.fileno()).st_ino == os.stat(lockfn).st_ino:
+                return lock
+        except OSError:
+            pass
+        lock.close()
+
+def _remove_broadcast_copy(rundir, path, lockfn):
+    """Remove the node-local copy of broadcast data and its lock file (while holding the lock),
+        and the directory of the run once empty
+    """
+    try:
+        lock = _lock_broadcast_copy(rundir, lockfn)
+    except (IOError, OSError):
+        return  # eg the node-local directory is gone
+    try:
+        for fn in [path, lockfn]:
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+    finally:
+        lock.close()
+    try:
+        os.rmdir(rundir)
+    except OSError:
+        pass  # not empty, other copies are still in use
+
+def broadcast(obj, directory=None):
+    """Stage read-only data once, return a BroadcastHandle to pass to the tasks instead of obj
+        the data is written to directory (default SCOOP_BROADCAST_DIR or the current directory,
+        it has to be readable by all hosts); each host copies it once to its node-local directory
+        NumPy arrays are written as raw data, so the workers can map them zero-copy; other objects are pickled
+    """
+    if directory is None:
+        directory = get_scoop_env('broadcast_dir') or os.getcwd()
+    import uuid  # do the import only here
+    key = uuid.uuid4().hex
+    source = os.path.join(directory, BROADCAST_TEMPLATE % {'key': key})
+
+    fh = open(source, 'wb')
+    try:
+        if type(obj).__module__ == 'numpy' and type(obj).__name__ in ('ndarray', 'memmap'):
+            import numpy  # do the import only here
+            obj = numpy.ascontiguousarray(obj)
+            obj.tofile(fh)
+            handle = BroadcastHandle(key, get_hostname(), source, BROADCAST_NUMPY, obj.nbytes,
+                                     dtype=obj.dtype.str, shape=obj.shape)
+        else:
+            cPickle.dump(obj, fh, cPickle.HIGHEST_PROTOCOL)
+            handle = BroadcastHandle(key, get_hostname(), source, BROADCAST_PICKLE, fh.tell())
+    finally:
+        fh.close()
+
+    return handle
+
+def get_instrument():
+    """Is per task instrumentation enabled (SCOOP_INSTRUMENT or SCOOP_TRACE environment variable)"""
+    return get_scoop_env_bool('instrument') or bool(get_scoop_env('trace'))
+
+class TaskTimer(object):
+    """Context manager that measures a task on the worker
+        with TaskTimer(task, submitted=submit_time) as timer:
+            ...
+        timer.record is a dict with task, worker, host, start, end, queue_wait, run_time,
+        cpu_time (user and system, including child processes, eg shell commands) and maxrss (in kB)
+        queue_wait is start - submitted: the origin and worker clocks have to be in sync for remote workers
+    """
+    def __init__(self, task=None, submitted=None):
+        self.task = task
+        self.submitted = submitted
+        self.record = None
+
+    def _cpu_time(self):
+        """User and system time of this process and its children"""
+        total = 0.0
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+            usage = resource.getrusage(who)
+            total += usage.ru_utime + usage.ru_stime
+        return total
+
+    def __enter__(self):
+        self.start_cpu = self._cpu_time()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+        queue_wait = None
+        if self.submitted is not None:
+            queue_wait = max(self.start - self.submitted, 0.0)
+        self.record = {
+            'task': self.task,
+            'worker': get_scoop_env('worker_name'),
+            'host': get_hostname(),
+            'start': self.start,
+            'end': end,
+            'queue_wait': queue_wait,
+            'run_time': end - self.start,
+            'cpu_time': self._cpu_time() - self.start_cpu,
+            'maxrss': max([resource.getrusage(x).ru_maxrss for x in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]),
+        }
+        return False
+
+class InstrumentedTask(object):
+    """Wrap func so every call is measured with a TaskTimer
+        the wrapped function is called as (submitted, *args) and returns (result, record)
+        (use map_instrumented to run it; the first argument is the task id in the record)
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, submitted, *args):
+        task = None
+        if args:
+            task = args[0]
+        with TaskTimer(task, submitted=submitted) as timer:
+            res = self.func(*args)
+        return res, timer.record
+
+class TaskStats(object):
+    """Aggregate the TaskTimer records at the origin
+        summary per measured field, per worker and the slowest tasks; write_trace writes a Chrome trace
+    """
+    def __init__(self):
+        self.records = []
+
+    def add(self, record):
+        """Add one TaskTimer record"""
+        self.records.append(record)
+
+    def summary(self):
+        """Return dict with number of tasks, (min, avg, max) per TASK_TIMINGS field, the max maxrss,
+            per worker (nr_tasks, busy time) and the TASK_REPORT_SLOWEST slowest records
+        """
+        summary = {'tasks': len(self.records)}
+        for field in TASK_TIMINGS:
+            values = [x[field] for x in self.records if x[field] is not None]
+            if values:
+                summary[field] = (min(values), sum(values) / len(values), max(values))
+        summary['maxrss'] = max([x['maxrss'] for x in self.records] or [0])
+
+        workers = {}
+        for record in self.records:
+            nr_tasks, busy = workers.get(record['worker'], (0, 0.0))
+            workers[record['worker']] = (nr_tasks + 1, busy + record['run_time'])
+        summary['workers'] = workers
+        summary['slowest'] = sorted(self.records, key=lambda x: x['run_time'], reverse=True)[:TASK_REPORT_SLOWEST]
+        return summary
+
+    def report(self):
+        """Return the summary as list of lines"""
+        summary = self.summary()
+        lines = ["TASKSTATS tasks %s workers %s maxrss %skB" % (summary['tasks'], len(summary['workers']),
+                                                                summary['maxrss'])]
+        for field in TASK_TIMINGS:
+            if field in summary:
+                lines.append("  %s min %fs avg %fs max %fs" % tuple([field] + list(summary[field])))
+        busy = [x[1] for x in summary['workers'].values()]
+        lines.append("  busy time per worker cv %f" % coefficient_of_variation(busy))
+        for record in summary['slowest']:
+            lines.append("  slow task %s on worker %s run_time %fs cpu_time %fs" % (record['task'], record['worker'],
+                                                                                   record['run_time'],
+                                                                                   record['cpu_time']))
+        return lines
+
+    def write_trace(self, filename):
+        """Write the records as Chrome trace (JSON, open in chrome://tracing or Perfetto)
+            one process per host and one thread per worker
+        """
+        if not self.records:
+            return
+        t0 = min([x['start'] for x in self.records])
+        pids = {}
+        tids = {}
+        events = []
+        for record in self.records:
+            if not record['host'] in pids:
+                pids[record['host']] = len(pids) + 1
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': pids[record['host']],
+                               'args': {'name': record['host']}})
+            worker = (record['host'], record['worker'])
+            if not worker in tids:
+                tids[worker] = len(tids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pids[record['host']], 'tid': tids[worker],
+                               'args': {'name': "%s" % record['worker']}})
+            events.append({
+                'name': "task %s" % record['task'],
+                'ph': 'X',
+                'ts': int((record['start'] - t0) * 1e6),
+                'dur': int(record['run_time'] * 1e6),
+                'pid': pids[record['host']],
+                'tid': tids[worker],
+                'args': dict([(x, record[x]) for x in TASK_TIMINGS + ['maxrss']]),
+            })
+        fh = open(filename, 'w')
+        try:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fh)
+        finally:
+            fh.close()
+
+def map_instrumented(func, *iterables, **kwargs):
+    """Generator that yields the results of futures.map(func, *iterables), every task is measured
+        the records are added to the TaskStats instance stats (keyword argument)
+    """
+    from scoop import futures  # do the import only here
+    stats = kwargs['stats']
+    submitted = itertools.repeat(time.time())
+    for res, record in futures.map(InstrumentedTask(func), submitted, *iterables):
+        stats.add(record)
+        yield res
+
+def report_instrument(stats):
+    """Print the TaskStats summary and write the trace file (SCOOP_TRACE), if any"""
+    for line in stats.report():
+        print line
+    trace = get_scoop_env('trace')
+    if trace:
+        stats.write_trace(trace)
+        print "TASKSTATS trace written to %s" % trace
 
 def fix_freeorigin():
     """Temporary solution to freeorigin mode
@@ -123,6 +1252,5 @@ def fix_freeorigin():
     """
     free_origin = get_scoop_env_bool('worker_freeorigin')
     if free_origin:
-        from scoop import _control  # do the import only here
-        _control.execQueue.highwatermark = -1
-        _control.execQueue.lowwatermark = -1
+        # hand back all futures and never request any
+        set_scheduling(highwatermark=-1, lowwatermark=-1, stealing=True)
@@ -47,7 +47,8 @@ PACKAGE = {
     'version': VERSION,
     'author': [sdw],
     'maintainer': [sdw],
-    'packages': ['vsc.mympirun.scoop', 'vsc.mympirun.scoop.worker', 'vsc.mympirun', 'vsc'],
+    'packages': ['vsc.mympirun.scoop', 'vsc.mympirun.scoop.worker', 'vsc.mympirun.scoop.benchmark',
+                 'vsc.mympirun', 'vsc'],
     # 'scripts':['bin/mympirun.py'], ## is installed with vsc-mympirun, including myscoop
 
 }
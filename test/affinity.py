@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.affinity
+    the topology is read from a fake sysfs: 2 sockets (each its own NUMA node) with 4 cores of 2 hardware threads
+"""
+import os
+from unittest import TestLoader, TestSuite
+from vsc.mympirun.scoop.affinity import ALGORITHM_NOSMT, ALGORITHM_NUMACOMPACT, ALGORITHM_RESERVE
+from vsc.mympirun.scoop.affinity import ALGORITHM_SOCKETSPREAD, Topology
+from vsc.mympirun.scoop.affinity import format_cpulist, get_cpus_allowed, parse_cpulist, set_cpu_affinity
+from test.worker_utils import TmpdirTestCase
+
+NR_CPUS = 16
+
+
+def make_topology(tmpdir):
+    """Return the Topology of a fake sysfs in tmpdir"""
+    sysfs_cpu = os.path.join(tmpdir, 'cpu')
+    sysfs_node = os.path.join(tmpdir, 'node')
+    # cpu 0-7 are the first hardware threads of the cores, 8-15 the second
+    for cpu in range(NR_CPUS):
+        core = cpu % 8
+        topodir = os.path.join(sysfs_cpu, 'cpu%s' % cpu, 'topology')
+        os.makedirs(topodir)
+        open(os.path.join(topodir, 'physical_package_id'), 'w').write("%s\n" % (core // 4))
+        open(os.path.join(topodir, 'core_id'), 'w').write("%s\n" % (core % 4))
+    for node in range(2):
+        os.makedirs(os.path.join(sysfs_node, 'node%s' % node))
+        cpus = [x for x in range(NR_CPUS) if (x % 8) // 4 == node]
+        open(os.path.join(sysfs_node, 'node%s' % node, 'cpulist'), 'w').write(format_cpulist(cpus))
+
+    return Topology(sysfs_cpu=sysfs_cpu, sysfs_node=sysfs_node, cpus=range(NR_CPUS))
+
+
+class CpulistTest(TmpdirTestCase):
+    """Tests for the kernel cpu lists"""
+
+    def test_parse(self):
+        """Ranges and single cpus, sorted"""
+        self.assertEqual(parse_cpulist('0-3,8,10-11'), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpulist('8,0-1\n'), [0, 1, 8])
+        self.assertEqual(parse_cpulist(''), [])
+
+    def test_format(self):
+        """Consecutive cpus are merged in ranges"""
+        self.assertEqual(format_cpulist([11, 0, 1, 2, 3, 8, 10]), '0-3,8,10-11')
+        self.assertEqual(format_cpulist([5]), '5')
+        self.assertEqual(format_cpulist([]), '')
+
+    def test_roundtrip(self):
+        """parse_cpulist is the inverse of format_cpulist"""
+        cpus = [0, 2, 3, 4, 7, 9, 10, 63, 64]
+        self.assertEqual(parse_cpulist(format_cpulist(cpus)), cpus)
+
+    def test_cpus_allowed(self):
+        """The cpus of the affinity mask are read from the status file"""
+        fn = os.path.join(self.tmpdir, 'status')
+        open(fn, 'w').write("Name:\tpython\nCpus_allowed:\tff\nCpus_allowed_list:\t0-5,7\n")
+        self.assertEqual(get_cpus_allowed(status=fn), [0, 1, 2, 3, 4, 5, 7])
+
+    def test_set_cpu_affinity(self):
+        """The affinity can be set to the current mask"""
+        cpus = get_cpus_allowed()
+        set_cpu_affinity(cpus)
+        self.assertEqual(get_cpus_allowed(), cpus)
+
+
+class TopologyTest(TmpdirTestCase):
+    """Tests for Topology and the affinity algorithms"""
+
+    def setUp(self):
+        super(TopologyTest, self).setUp()
+        self.topology = make_topology(self.tmpdir)
+
+    def test_topology(self):
+        """Cores with their hardware threads, in NUMA node order"""
+        self.assertEqual(len(self.topology.cores), 8)
+        self.assertEqual(self.topology.cores[0], (0, 0, [0, 8]))
+        self.assertEqual(self.topology.cores[4], (1, 1, [4, 12]))
+        self.assertEqual(self.topology.nodes([0, 8]), [0])
+        self.assertEqual(self.topology.nodes([1, 13]), [0, 1])
+        self.assertEqual(sorted(self.topology.sockets().keys()), [0, 1])
+
+    def test_numacompact(self):
+        """One core per worker, NUMA node after NUMA node, oversubscribed when there are more workers"""
+        self.assertEqual(self.topology.select(ALGORITHM_NUMACOMPACT, 8, 0), [0, 8])
+        self.assertEqual(self.topology.select(ALGORITHM_NUMACOMPACT, 8, 5), [5, 13])
+        self.assertEqual(self.topology.select(ALGORITHM_NUMACOMPACT, 10, 9), [1, 9])
+
+    def test_socketspread(self):
+        """One core per worker, round-robin over the sockets"""
+        selected = [self.topology.select(ALGORITHM_SOCKETSPREAD, 4, x) for x in range(4)]
+        self.assertEqual(selected, [[0, 8], [4, 12], [1, 9], [5, 13]])
+
+    def test_nosmt(self):
+        """One hardware thread per worker, only the first thread of the cores"""
+        selected = [self.topology.select(ALGORITHM_NOSMT, 16, x) for x in range(10)]
+        self.assertEqual(selected, [[x % 8] for x in range(10)])
+
+    def test_reserve(self):
+        """Blocks of contiguous cores per worker"""
+        self.assertEqual(self.topology.select(ALGORITHM_RESERVE, 4, 1), [2, 3, 10, 11])
+        self.assertEqual(self.topology.select(ALGORITHM_RESERVE, 2, 1), [4, 5, 6, 7, 12, 13, 14, 15])
+        self.assertEqual(self.topology.select(ALGORITHM_RESERVE, 4, 0, cores_per_worker=3), [0, 1, 2, 8, 9, 10])
+        # more workers than cores
+        self.assertEqual(self.topology.select(ALGORITHM_RESERVE, 16, 9), [1, 9])
+
+    def test_unknown(self):
+        """Unknown algorithms raise ValueError"""
+        self.assertRaises(ValueError, self.topology.select, 'basiccore', 4, 0)
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [CpulistTest, TopologyTest]])
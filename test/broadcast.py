@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of the broadcast of vsc.mympirun.scoop.worker_utils
+"""
+import os
+from unittest import TestLoader, TestSuite
+from vsc.mympirun.scoop.worker_utils import BroadcastHandle, broadcast, _broadcast_cache, _remove_broadcast_copy
+from test.worker_utils import TmpdirTestCase
+
+
+class BroadcastTest(TmpdirTestCase):
+    """Tests for broadcast and BroadcastHandle"""
+
+    def setUp(self):
+        super(BroadcastTest, self).setUp()
+        self.orig_environ = os.environ.copy()
+        self.localdir = os.path.join(self.tmpdir, 'local')
+        os.mkdir(self.localdir)
+        os.environ['SCOOP_BROADCAST_LOCALDIR'] = self.localdir
+        os.environ['SCOOP_RUN_ID'] = 'test.1'
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.orig_environ)
+        _broadcast_cache.clear()
+        super(BroadcastTest, self).tearDown()
+
+    def remote_handle(self, obj):
+        """Broadcast obj and return a handle as seen from another host"""
+        handle = broadcast(obj, directory=self.tmpdir)
+        return BroadcastHandle(handle.key, 'otherhost', handle.source, handle.kind, handle.size)
+
+    def test_origin_host(self):
+        """On the host that staged the data, it is read from the source"""
+        handle = broadcast({'a': 1}, directory=self.tmpdir)
+        self.assertEqual(handle.get(), {'a': 1})
+        self.assertEqual(os.listdir(self.localdir), [])
+        handle.release()
+        self.assertFalse(os.path.exists(handle.source))
+
+    def test_local_copy(self):
+        """Other hosts copy the data once to the directory of the run, the copy is removed with its lock file"""
+        handle = self.remote_handle(range(10))
+        self.assertEqual(handle.get(), range(10))
+        rundir = os.path.join(self.localdir, 'scoop_broadcast_test.1')
+        path = os.path.join(rundir, "scoop_broadcast_%s" % handle.key)
+        self.assertEqual(sorted(os.listdir(rundir)), [os.path.basename(x) for x in [path, "%s.lock" % path]])
+
+        _remove_broadcast_copy(rundir, path, "%s.lock" % path)
+        self.assertEqual(os.listdir(self.localdir), [])
+
+        # a worker that loads the data after the removal makes a new copy
+        _broadcast_cache.clear()
+        self.assertEqual(handle.get(), range(10))
+        self.assertTrue(os.path.exists(path))
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [BroadcastTest]])
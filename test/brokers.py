@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.brokers
+"""
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.benchmark.broker import get_layout
+from vsc.mympirun.scoop.brokers import BROKER_AUTO, BROKER_ORIGIN, BROKER_RESERVE, RESERVE_MIN_WORKERS
+from vsc.mympirun.scoop.brokers import choose_broker_topology, get_broker_host, reserve_broker_cpus
+from test.affinity import make_topology
+from test.worker_utils import TmpdirTestCase
+
+
+class BrokerTopologyTest(TestCase):
+    """Tests for choose_broker_topology and get_broker_host"""
+
+    def test_auto(self):
+        """auto reserves a core for large runs"""
+        self.assertEqual(choose_broker_topology(BROKER_AUTO, RESERVE_MIN_WORKERS - 1, 16), BROKER_ORIGIN)
+        self.assertEqual(choose_broker_topology(BROKER_AUTO, RESERVE_MIN_WORKERS, 16), BROKER_RESERVE)
+
+    def test_cores(self):
+        """A core is only reserved when the broker host has at least 2 cores"""
+        self.assertEqual(choose_broker_topology(BROKER_RESERVE, 4, 2), BROKER_RESERVE)
+        self.assertEqual(choose_broker_topology(BROKER_RESERVE, 4, 1), BROKER_ORIGIN)
+        self.assertEqual(choose_broker_topology(BROKER_AUTO, 1024, 0), BROKER_ORIGIN)
+        self.assertEqual(choose_broker_topology(BROKER_ORIGIN, 1024, 16), BROKER_ORIGIN)
+
+    def test_unknown(self):
+        """Unknown topologies raise ValueError"""
+        self.assertRaises(ValueError, choose_broker_topology, 'dedicated', 4, 2)
+
+    def test_broker_host(self):
+        """The first local host, else the first host"""
+        self.assertEqual(get_broker_host(['a', 'b', 'c'], ['localhost', 'b']), 'b')
+        self.assertEqual(get_broker_host(['a', 'b', 'c'], ['localhost']), 'a')
+
+
+class ReserveTest(TmpdirTestCase):
+    """Tests for the reserved broker cpus, and the layout of the broker benchmark"""
+
+    def setUp(self):
+        super(ReserveTest, self).setUp()
+        self.topology = make_topology(self.tmpdir)
+
+    def test_reserve_broker_cpus(self):
+        """The last core with its hardware threads is reserved"""
+        reserved, compute = reserve_broker_cpus(self.topology)
+        self.assertEqual(reserved, [7, 15])
+        self.assertEqual(compute, [0, 1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12, 13, 14])
+
+    def test_layout(self):
+        """The benchmark lays out the workers like myscoop on the broker host"""
+        broker_cpus, worker_cpus = get_layout(BROKER_ORIGIN, self.topology)
+        self.assertEqual(broker_cpus, range(16))
+        self.assertEqual(worker_cpus, [[x, x + 8] for x in range(8)])
+
+        broker_cpus, worker_cpus = get_layout(BROKER_RESERVE, self.topology)
+        self.assertEqual(broker_cpus, [7, 15])
+        self.assertEqual(worker_cpus, [[x, x + 8] for x in range(7)])
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [BrokerTopologyTest, ReserveTest]])
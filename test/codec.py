@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of the result codecs of vsc.mympirun.scoop.worker_utils
+"""
+import cPickle
+import os
+from unittest import TestLoader, TestSuite
+from vsc.mympirun.scoop.worker_utils import EncodedResult, ResultFile, encode_result, decode_result
+from vsc.mympirun.scoop.worker_utils import CODEC_NONE, CODEC_ZLIB
+from test.worker_utils import TmpdirTestCase
+
+
+class CodecTest(TmpdirTestCase):
+    """Tests for encode_result and decode_result"""
+
+    def test_none(self):
+        """Without codec and resultfile limit, the value is returned unchanged"""
+        value = 'x' * 1000
+        self.assertTrue(encode_result(value, codec=CODEC_NONE, resultfile_limit=0) is value)
+
+    def test_threshold(self):
+        """Small values are not encoded"""
+        self.assertEqual(encode_result('small', codec=CODEC_ZLIB, threshold=100), 'small')
+
+    def test_zlib(self):
+        """Compressed str and pickled values are decoded to the original"""
+        for value in ['line of output\n' * 10000, {'out': range(10000)}]:
+            encoded = encode_result(value, codec=CODEC_ZLIB, threshold=0)
+            self.assertTrue(isinstance(encoded, EncodedResult))
+            self.assertEqual(decode_result(cPickle.loads(cPickle.dumps(encoded))), value)
+
+    def test_incompressible(self):
+        """Values that don't compress are returned unchanged"""
+        value = os.urandom(10000)
+        self.assertEqual(encode_result(value, codec=CODEC_ZLIB, threshold=0), value)
+
+    def test_resultfile(self):
+        """Values over the resultfile limit are written to a file"""
+        value = 'y' * 5000
+        encoded = encode_result(value, codec=CODEC_NONE, threshold=0, resultfile_limit=1000,
+                                resultfile_dir=self.tmpdir)
+        self.assertTrue(isinstance(encoded, ResultFile))
+        self.assertEqual(decode_result(encoded), value)
+        encoded.host = 'otherhost'
+        self.assertTrue(encoded.path in decode_result(encoded))
+
+    def test_decode_plain(self):
+        """Values that were not encoded are decoded unchanged"""
+        self.assertEqual(decode_result((0, 'out')), (0, 'out'))
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [CodecTest]])
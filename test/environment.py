@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.environment
+"""
+import os
+import stat
+import subprocess
+from unittest import TestLoader, TestSuite
+from vsc.mympirun.scoop.environment import export_commands, load_environment, remove_environment
+from vsc.mympirun.scoop.environment import write_environment
+from test.worker_utils import TmpdirTestCase
+
+ENVIRON = {
+    'SCOOP_A': 'plain',
+    'SCOOP_B': "it's \"quoted\" $HOME `cmd` \\ ;|&",
+    'SCOOP_C': "multi\nline",
+    'SCOOP_D': '\xc3\xa9t\xc3\xa9',
+    'PATH': '/usr/bin:/bin',
+}
+
+
+class EnvironmentTest(TmpdirTestCase):
+    """Tests for the serialized environment of the workers"""
+
+    def test_roundtrip(self):
+        """The values are restored exactly, the early variables are not in the file"""
+        fn = write_environment(ENVIRON.keys() + ['SCOOP_MISSING'], self.tmpdir, 'node1.123', environ=ENVIRON)
+        self.assertEqual(os.path.basename(fn), '.scoop_environment_node1.123.json')
+        self.assertEqual(stat.S_IMODE(os.stat(fn).st_mode), stat.S_IRUSR | stat.S_IWUSR)
+
+        environ = {'SCOOP_A': 'plain', 'SCOOP_C': 'other'}
+        self.assertEqual(load_environment(fn, environ=environ), (3, 1))
+        expected = dict([(x, y) for x, y in ENVIRON.items() if x != 'PATH'])
+        self.assertEqual(environ, expected)
+        self.assertTrue(all([isinstance(x, str) for x in environ.keys() + environ.values()]))
+
+    def test_remove(self):
+        """The file is removed, removing it again is no error"""
+        fn = write_environment(['SCOOP_A'], self.tmpdir, 'run', environ=ENVIRON)
+        remove_environment(fn)
+        self.assertFalse(os.path.exists(fn))
+        remove_environment(fn)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_export_commands(self):
+        """The quoted exports reproduce the values in a shell"""
+        names = ['SCOOP_B', 'SCOOP_C', 'SCOOP_MISSING']
+        cmd = export_commands(names, environ=ENVIRON)
+        self.assertEqual(len(cmd), 4)
+        script = ' '.join(cmd + ['printf "%s|%s" "$SCOOP_B" "$SCOOP_C"'])
+        out = subprocess.Popen(['/bin/sh', '-c', script], stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual(out, "%s|%s" % (ENVIRON['SCOOP_B'], ENVIRON['SCOOP_C']))
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [EnvironmentTest]])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of the hostlist notation and the launch plan cache of vsc.mympirun.scoop.placement
+"""
+import os
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.placement import WorkerPlan, compress_hostlist, expand_hostlist
+from vsc.mympirun.scoop.placement import launch_plan_cache_key, load_launch_plan, save_launch_plan
+from test.worker_utils import TmpdirTestCase
+
+
+class HostlistTest(TestCase):
+    """Tests for the hostlist notation"""
+
+    def test_expand(self):
+        """Expand ranges, lists, padding and plain hostnames"""
+        self.assertEqual(expand_hostlist('node[001-003,007]'), ['node001', 'node002', 'node003', 'node007'])
+        self.assertEqual(expand_hostlist('r1n[8-10].ib,login1'), ['r1n8.ib', 'r1n9.ib', 'r1n10.ib', 'login1'])
+        self.assertEqual(expand_hostlist('node5'), ['node5'])
+        self.assertEqual(expand_hostlist(''), [])
+
+    def test_expand_invalid(self):
+        """Invalid ranges raise ValueError"""
+        self.assertRaises(ValueError, expand_hostlist, 'node[1-x]')
+        self.assertRaises(ValueError, expand_hostlist, 'node[1-2')
+
+    def test_compress(self):
+        """Compress keeps the order, only merges neighbours with the same prefix, suffix and width"""
+        hostnames = ['node%03d' % x for x in range(1, 513)]
+        self.assertEqual(compress_hostlist(hostnames), 'node[001-512]')
+        self.assertEqual(compress_hostlist(['a5', 'a3', 'a4', 'a7']), 'a[5,3-4,7]')
+        self.assertEqual(compress_hostlist(['node9', 'node10', 'login']), 'node9,node10,login')
+        self.assertEqual(compress_hostlist([]), '')
+
+    def test_roundtrip(self):
+        """expand_hostlist is the inverse of compress_hostlist"""
+        hostnames = ['node%03d' % x for x in range(1, 100)] + ['login1', 'node600', 'r1n05.ib', 'r1n06.ib', 'x']
+        self.assertEqual(expand_hostlist(compress_hostlist(hostnames)), hostnames)
+
+
+class LaunchPlanTest(TmpdirTestCase):
+    """Tests for the serialisation and the cache of the launch plan"""
+
+    def setUp(self):
+        super(LaunchPlanTest, self).setUp()
+        self.orig_environ = os.environ.copy()
+        for name in ['PBS_JOBID', 'SLURM_JOB_ID']:
+            os.environ.pop(name, None)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.orig_environ)
+        super(LaunchPlanTest, self).tearDown()
+
+    def test_dict_roundtrip(self):
+        """to_dict compresses the hosts, from_dict restores the plan"""
+        hosts = [x for x in ['node%03d' % y for y in range(1, 513)] for _ in range(16)] + ['node001'] * 4
+        plan = WorkerPlan(hosts, freeorigin=True)
+        data = plan.to_dict()
+        self.assertEqual(data['hosts'], [('node001', 20), ('node[002-512]', 16)])
+        self.assertEqual(data['origin'], 'node001')
+
+        restored = WorkerPlan.from_dict(data)
+        self.assertEqual(restored.scoop_hosts(), plan.scoop_hosts())
+        self.assertEqual(restored.workers, plan.workers)
+        self.assertEqual(restored.nr_origin, 1)
+
+        plan.reserve('node002', [15], 16)
+        restored = WorkerPlan.from_dict(plan.to_dict())
+        self.assertEqual(restored.scoop_hosts(), plan.scoop_hosts())
+        self.assertEqual((restored.broker_host, restored.broker_cpus), ('node002', [15]))
+
+    def test_cache_key(self):
+        """The key depends on the hosts and the options"""
+        hosts = ['node001', 'node002']
+        self.assertEqual(launch_plan_cache_key(hosts, True, 'auto'), launch_plan_cache_key(hosts, True, 'auto'))
+        self.assertNotEqual(launch_plan_cache_key(hosts, True, 'auto'), launch_plan_cache_key(hosts, False, 'auto'))
+        self.assertNotEqual(launch_plan_cache_key(hosts, True), launch_plan_cache_key(hosts[::-1], True))
+
+    def test_cache(self):
+        """The plan is cached per allocation"""
+        launch_plan = {'plan': WorkerPlan(['a', 'a', 'b']).to_dict(), 'broker': '10.0.0.1'}
+        self.assertEqual(save_launch_plan('key', launch_plan, cachedir=self.tmpdir), None)
+        self.assertEqual(load_launch_plan('key', cachedir=self.tmpdir), None)
+
+        os.environ['SLURM_JOB_ID'] = '123/4'
+        filename = save_launch_plan('key', launch_plan, cachedir=self.tmpdir)
+        self.assertEqual(os.path.basename(filename), 'plan_123_4_key.json')
+        cached = load_launch_plan('key', cachedir=self.tmpdir)
+        self.assertEqual(cached['broker'], '10.0.0.1')
+        self.assertEqual(WorkerPlan.from_dict(cached['plan']).scoop_hosts(), [('a', 2), ('b', 1)])
+        self.assertEqual(load_launch_plan('otherkey', cachedir=self.tmpdir), None)
+
+        os.environ['SLURM_JOB_ID'] = '124'
+        self.assertEqual(load_launch_plan('key', cachedir=self.tmpdir), None)
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [HostlistTest, LaunchPlanTest]])
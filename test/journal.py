@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.worker_utils.Journal
+"""
+import cPickle
+import os
+from unittest import TestLoader, TestSuite
+from vsc.mympirun.scoop.worker_utils import Journal, journal_key
+from test.worker_utils import TmpdirTestCase
+
+
+class JournalTest(TmpdirTestCase):
+    """Tests for Journal"""
+
+    def test_resume(self):
+        """Completed tasks are known after a restart, their results are replayed from the file"""
+        fn = os.path.join(self.tmpdir, 'journal')
+        key = journal_key('test', ['0:10'])
+        journal = Journal(fn, key)
+        for task_id in [0, 2, 4]:
+            journal.record(task_id, (0, 'out%s' % task_id))
+        journal.close()
+
+        journal = Journal(fn, key)
+        self.assertEqual(journal.completed, set([0, 2, 4]))
+        self.assertTrue(journal.is_completed(2))
+        self.assertFalse(journal.is_completed(1))
+        journal.record(1, (1, 'new'))
+        self.assertEqual(list(journal.replay()), [(0, (0, 'out0')), (2, (0, 'out2')), (4, (0, 'out4'))])
+        self.assertEqual(list(journal.replay(all_records=True))[-1], (1, (1, 'new')))
+        journal.close()
+
+    def test_partial_record(self):
+        """A partial record at the end is dropped"""
+        fn = os.path.join(self.tmpdir, 'journal')
+        journal = Journal(fn, 'key')
+        journal.record(0, 'done')
+        journal.close()
+        record = cPickle.dumps((1, 'partial'), cPickle.HIGHEST_PROTOCOL)
+        open(fn, 'ab').write(record[:len(record) // 2])
+
+        journal = Journal(fn, 'key')
+        self.assertEqual(journal.completed, set([0]))
+        journal.record(2, 'next')
+        journal.close()
+        self.assertEqual(Journal(fn, 'key').completed, set([0, 2]))
+
+    def test_wrong_key(self):
+        """A journal of another task spec is refused"""
+        fn = os.path.join(self.tmpdir, 'journal')
+        Journal(fn, 'key').close()
+        self.assertRaises(ValueError, Journal, fn, 'otherkey')
+
+    def test_partial_header(self):
+        """A journal with a partial header (killed while it was created) is an empty journal"""
+        fn = os.path.join(self.tmpdir, 'journal')
+        header = cPickle.dumps(('SCOOP_JOURNAL', 'key'), cPickle.HIGHEST_PROTOCOL)
+        open(fn, 'wb').write(header[:len(header) // 2])
+
+        journal = Journal(fn, 'key')
+        self.assertEqual(journal.completed, set())
+        journal.record(0, 'done')
+        journal.close()
+        self.assertEqual(Journal(fn, 'key').completed, set([0]))
+
+    def test_not_a_journal(self):
+        """Another file is refused (and not overwritten)"""
+        fn = os.path.join(self.tmpdir, 'journal')
+        open(fn, 'w').write("some data\n")
+        self.assertRaises(ValueError, Journal, fn, 'key')
+        self.assertEqual(open(fn).read(), "some data\n")
+
+    def test_key(self):
+        """The key depends on all items"""
+        self.assertEqual(journal_key('sanity', 10, 0.1), journal_key('sanity', 10, 0.1))
+        self.assertNotEqual(journal_key('sanity', 10, 0.1), journal_key('sanity', 10, 0.2))
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [JournalTest]])
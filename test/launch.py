@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.launch
+"""
+import re
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.launch import decode_worker_args, encode_worker_args
+
+
+class WorkerArgsTest(TestCase):
+    """Tests for the encoded worker arguments of the hostlauncher"""
+
+    def test_roundtrip(self):
+        """The arguments are restored as str, also with shell special characters and non-ASCII"""
+        args = ['--workerName', 'worker3', '--nice', 5, '--affinity', 'basiccore:16:3', 'echo', "a b'c\"$d\n",
+                '\xc3\xa9t\xc3\xa9', '']
+        decoded = decode_worker_args(encode_worker_args(args))
+        self.assertEqual(decoded, ["%s" % x for x in args])
+        self.assertTrue(all([isinstance(x, str) for x in decoded]))
+
+    def test_shell_safe(self):
+        """The encoded arguments are a single word without shell special characters"""
+        encoded = encode_worker_args(['echo', '$(rm -rf /)', '`x`;|&<>'])
+        self.assertTrue(re.match(r'^[A-Za-z0-9+/=]+$', encoded))
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [WorkerArgsTest]])
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.network
+    select_interface is tested with fake interfaces and a listening socket on the loopback address
+"""
+import socket
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.network import ARPHRD_INFINIBAND, PREFERENCE_INFINIBAND, PREFERENCE_OTHER, PREFERENCE_SUBNET
+from vsc.mympirun.scoop.network import Interface, in_subnet, parse_subnet, preference, select_interface
+
+
+class SubnetTest(TestCase):
+    """Tests for the subnets and Interface"""
+
+    def test_parse_subnet(self):
+        """CIDR notation, the host part of the address is ignored"""
+        self.assertEqual(parse_subnet('10.141.0.0/16'), (0x0a8d0000, 0xffff0000))
+        self.assertEqual(parse_subnet('10.141.3.4/16'), (0x0a8d0000, 0xffff0000))
+        self.assertEqual(parse_subnet('0.0.0.0/0'), (0, 0))
+        for subnet in ['10.141.0.0', '10.141.0.0/33', 'ten/8', '10.141.0.0/x']:
+            self.assertRaises(ValueError, parse_subnet, subnet)
+
+    def test_in_subnet(self):
+        """Addresses in and outside the subnet"""
+        subnet = parse_subnet('10.141.0.0/16')
+        self.assertTrue(in_subnet('10.141.255.1', *subnet))
+        self.assertFalse(in_subnet('10.142.0.1', *subnet))
+
+    def test_interface(self):
+        """contains checks the subnet of the interface, translate puts the host part in it"""
+        interface = Interface('ib0', '10.143.1.5', '255.255.0.0', ARPHRD_INFINIBAND)
+        self.assertTrue(interface.is_infiniband)
+        self.assertTrue(interface.contains('10.143.7.8'))
+        self.assertFalse(interface.contains('10.141.7.8'))
+        self.assertEqual(interface.translate('10.141.7.8'), '10.143.7.8')
+
+    def test_preference(self):
+        """The configured subnet first, then InfiniBand, then any other interface"""
+        eth = Interface('eth0', '10.141.1.5', '255.255.0.0')
+        ib = Interface('ib0', '10.143.1.5', '255.255.0.0', ARPHRD_INFINIBAND)
+        self.assertEqual(preference(eth), PREFERENCE_OTHER)
+        self.assertEqual(preference(ib), PREFERENCE_INFINIBAND)
+        self.assertEqual(preference(eth, parse_subnet('10.141.0.0/16')), PREFERENCE_SUBNET)
+
+
+class SelectInterfaceTest(TestCase):
+    """Tests for select_interface"""
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_measured(self):
+        """The round-trip time is measured over the interface in the subnet of the remote host"""
+        loopback = Interface('lo1', '127.0.0.1', '255.0.0.0')
+        selected, candidates = select_interface(['127.0.0.1'], interfaces=[loopback], port=self.port)
+        self.assertTrue(selected is loopback)
+        self.assertTrue(loopback.rtt is not None)
+        self.assertEqual(candidates, [loopback])
+
+    def test_infiniband(self):
+        """InfiniBand is preferred, also when no peer in its subnet could be measured"""
+        loopback = Interface('lo1', '127.0.0.1', '255.0.0.0')
+        ib = Interface('ib0', '192.0.2.1', '255.255.255.0', ARPHRD_INFINIBAND)
+        selected, candidates = select_interface(['127.0.0.1'], interfaces=[loopback, ib], port=self.port)
+        self.assertTrue(selected is ib)
+        self.assertEqual(ib.rtt, None)
+        self.assertEqual(candidates, [ib, loopback])
+
+    def test_unreachable(self):
+        """An interface that can't reach a resolved peer in its subnet is skipped, unless it is in the subnet"""
+        loopback = Interface('lo1', '127.0.0.1', '255.0.0.0')
+        ib = Interface('ib0', '192.0.2.1', '255.255.255.0', ARPHRD_INFINIBAND)
+        remote_hosts = ['127.0.0.1', '192.0.2.7']
+        selected, candidates = select_interface(remote_hosts, interfaces=[loopback, ib], port=self.port)
+        self.assertTrue(selected is loopback)
+        self.assertEqual(candidates, [loopback])
+
+        selected, candidates = select_interface(remote_hosts, subnet='192.0.2.0/24', interfaces=[loopback, ib],
+                                                port=self.port)
+        self.assertTrue(selected is ib)
+        self.assertEqual(candidates, [ib, loopback])
+
+    def test_no_interfaces(self):
+        """Without interfaces nothing is selected"""
+        self.assertEqual(select_interface(['127.0.0.1'], interfaces=[], port=self.port), (None, []))
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [SubnetTest, SelectInterfaceTest]])
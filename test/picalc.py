@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.worker.picalc
+"""
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.worker.picalc import KERNEL_PYTHON, test_batch, test_python
+
+
+class PicalcTest(TestCase):
+    """Tests for the picalc kernels"""
+
+    def test_reproducible(self):
+        """The hits of a batch only depend on the seed and the batch index"""
+        self.assertEqual(test_python(10000, seed=1, index=3), test_python(10000, seed=1, index=3))
+        hits = set([test_python(10000, seed=1, index=x) for x in range(5)])
+        self.assertTrue(len(hits) > 1)
+
+    def test_batch(self):
+        """A batch estimates pi"""
+        hits, _, duration = test_batch(100000, KERNEL_PYTHON, 42, 0)
+        self.assertTrue(abs(4. * hits / 100000 - 3.1416) < 0.05)
+        self.assertTrue(duration >= 0)
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [PicalcTest]])
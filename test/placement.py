@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.placement
+"""
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.placement import WorkerPlan
+
+
+class WorkerPlanTest(TestCase):
+    """Tests for WorkerPlan"""
+
+    def test_plan(self):
+        """Non-adjacent duplicates are merged, in order of first appearance"""
+        plan = WorkerPlan(['a', 'b', 'a', 'c', 'b', 'a'])
+        self.assertEqual(plan.scoop_hosts(), [('a', 3), ('b', 2), ('c', 1)])
+        self.assertEqual(plan.workers, 6)
+        self.assertEqual(plan.nr_origin, 0)
+
+    def test_freeorigin(self):
+        """The origin is an extra slot on the origin host"""
+        plan = WorkerPlan(['a', 'a', 'b'], freeorigin=True)
+        self.assertEqual(plan.scoop_hosts(), [('a', 3), ('b', 1)])
+        self.assertEqual(plan.workers, 3)
+        self.assertEqual(plan.nr_origin, 1)
+        self.assertEqual(plan.get('a').workers, 2)
+
+    def test_origin_idx(self):
+        """The origin slot is added on the host of hosts[origin_idx], the compute workers are not changed"""
+        plan = WorkerPlan(['a', 'b', 'b'], freeorigin=True, origin_idx=1)
+        self.assertEqual(plan.scoop_hosts(), [('a', 1), ('b', 3)])
+        self.assertTrue(plan.get('b').origin)
+        self.assertFalse(plan.get('a').origin)
+        self.assertEqual([x.workers for x in plan.hosts], [1, 2])
+        self.assertEqual(plan.get('c'), None)
+
+    def test_empty(self):
+        """An empty plan has no origin"""
+        plan = WorkerPlan([], freeorigin=True)
+        self.assertEqual(plan.scoop_hosts(), [])
+        self.assertEqual(plan.nr_origin, 0)
+
+    def test_reserve(self):
+        """The broker host comes first with the origin, one compute worker less when each core had one"""
+        plan = WorkerPlan(['a', 'a', 'b', 'b', 'c'])
+        self.assertEqual(plan.reserve('b', [7, 15], 2), 1)
+        self.assertEqual(plan.scoop_hosts(), [('b', 2), ('a', 2), ('c', 1)])
+        self.assertEqual(plan.workers, 4)
+        self.assertTrue(plan.freeorigin)
+        self.assertEqual((plan.broker_host, plan.broker_cpus), ('b', [7, 15]))
+
+    def test_reserve_freeorigin(self):
+        """The origin moves to the broker host, a host with a free core keeps its workers"""
+        plan = WorkerPlan(['a', 'a', 'b', 'b'], freeorigin=True)
+        self.assertEqual(plan.reserve('b', [7], 8), 0)
+        self.assertEqual(plan.scoop_hosts(), [('b', 3), ('a', 2)])
+        self.assertFalse(plan.get('a').origin)
+        self.assertEqual(plan.nr_origin, 1)
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [WorkerPlanTest]])
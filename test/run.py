@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.run
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.run import EXITCODE_NOT_FOUND, EXITCODE_SHELL_DIED, PersistentShell, needs_shell, run_command
+
+
+class RunCommandTest(TestCase):
+    """Tests for run_command"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_needs_shell(self):
+        """Only commands with shell features need /bin/sh"""
+        self.assertFalse(needs_shell('echo hello world'))
+        self.assertFalse(needs_shell('/bin/ls -l /tmp'))
+        self.assertTrue(needs_shell('echo $HOME'))
+        self.assertTrue(needs_shell('ls | wc -l'))
+        self.assertTrue(needs_shell('FOO=bar env'))
+
+    def test_output(self):
+        """Exitcode and output, with stderr merged in stdout"""
+        self.assertEqual(run_command('echo hello world'), (0, "hello world\n"))
+        self.assertEqual(run_command('echo out; echo err >&2; exit 3'), (3, "out\nerr\n"))
+
+    def test_large_output(self):
+        """Output larger than the pipe buffer doesn't hang"""
+        ec, out = run_command("head -c 1000000 /dev/zero")
+        self.assertEqual(ec, 0)
+        self.assertEqual(len(out), 1000000)
+
+    def test_truncate(self):
+        """Output beyond maxoutput is discarded"""
+        ec, out = run_command("seq 1 1000", maxoutput=10)
+        self.assertEqual(ec, 0)
+        self.assertTrue(out.startswith("1\n2\n3\n4\n5\n"))
+        self.assertTrue("output truncated at 10 of 3893 bytes" in out)
+
+    def test_spill(self):
+        """The full output is written to the spill file"""
+        spillfn = os.path.join(self.tmpdir, 'spill')
+        ec, out = run_command("seq 1 1000", maxoutput=10, spillfn=spillfn)
+        self.assertEqual(ec, 0)
+        self.assertTrue(spillfn in out)
+        self.assertEqual(open(spillfn).read(), ''.join(["%s\n" % x for x in range(1, 1001)]))
+
+    def test_not_found(self):
+        """A command that can't be found has exitcode 127, like with /bin/sh"""
+        ec, out = run_command('/nonexistent/command -x')
+        self.assertEqual(ec, EXITCODE_NOT_FOUND)
+        self.assertTrue(out.startswith("/nonexistent/command: "))
+
+    def test_no_inherited_fds(self):
+        """The command doesn't inherit the file descriptors of the worker"""
+        fd = os.open(os.path.join(self.tmpdir, 'open'), os.O_WRONLY | os.O_CREAT)
+        os.dup2(fd, 63)
+        os.close(fd)
+        try:
+            ec, out = run_command("ls /proc/self/fd")
+        finally:
+            os.close(63)
+        self.assertEqual(ec, 0)
+        self.assertFalse('63' in out.split())
+
+
+class PersistentShellTest(TestCase):
+    """Tests for PersistentShell"""
+
+    def setUp(self):
+        self.shell = PersistentShell()
+        self.orig_environ = os.environ.copy()
+
+    def tearDown(self):
+        self.shell.close()
+        os.environ.clear()
+        os.environ.update(self.orig_environ)
+
+    def test_run(self):
+        """Exitcode and output of consecutive commands"""
+        self.assertEqual(self.shell.run('echo hello world'), (0, "hello world\n"))
+        self.assertEqual(self.shell.run('echo out; echo err >&2; exit 3'), (3, "out\nerr\n"))
+        self.assertEqual(self.shell.run('cat /nonexistent')[0], 1)
+        self.assertEqual(self.shell.run('echo still alive'), (0, "still alive\n"))
+
+    def test_subshell(self):
+        """Only builtins and commands with shell features run in a subshell"""
+        self.assertFalse(self.shell.needs_subshell('/bin/echo hello'))
+        self.assertTrue(self.shell.needs_subshell('cd /tmp'))
+        self.assertTrue(self.shell.needs_subshell('exit 3'))
+        self.assertTrue(self.shell.needs_subshell('echo $HOME'))
+        self.assertTrue(self.shell.needs_subshell(''))
+
+    def test_builtins(self):
+        """cd, exit and syntax errors don't affect the next command"""
+        cwd = self.shell.run('pwd')[1]
+        self.assertEqual(self.shell.run('cd /'), (0, ''))
+        self.assertEqual(self.shell.run('exit 4'), (4, ''))
+        self.assertEqual(self.shell.run('if then fi')[0], 2)
+        self.assertEqual(self.shell.run('pwd'), (0, cwd))
+
+    def test_environment(self):
+        """Changes of os.environ are passed to the next command"""
+        os.environ['SCOOP_TEST_PERSISTENT'] = 'a b'
+        self.assertEqual(self.shell.run('printenv SCOOP_TEST_PERSISTENT'), (0, "a b\n"))
+        del os.environ['SCOOP_TEST_PERSISTENT']
+        self.assertEqual(self.shell.run('printenv SCOOP_TEST_PERSISTENT'), (1, ''))
+
+    def test_truncate(self):
+        """Output beyond maxoutput is discarded, the end marker is still found"""
+        ec, out = self.shell.run('seq 1 1000', maxoutput=10)
+        self.assertEqual(ec, 0)
+        self.assertTrue("output truncated at 10 of 3893 bytes" in out)
+        self.assertEqual(self.shell.run('echo next'), (0, "next\n"))
+
+    def test_shell_died(self):
+        """A command that kills the shell is reported"""
+        self.assertEqual(self.shell.run('kill -9 $$')[0], EXITCODE_SHELL_DIED)
+        self.assertEqual(self.shell.proc, None)
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in [RunCommandTest, PersistentShellTest]])
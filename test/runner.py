@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Run all unit tests
+    e.g. python test/runner.py (from the root of the repository)
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test.affinity as a
+import test.broadcast as b
+import test.brokers as br
+import test.codec as c
+import test.environment as e
+import test.hostlist as h
+import test.journal as j
+import test.launch as l
+import test.network as n
+import test.picalc as pi
+import test.placement as p
+import test.run as r
+import test.worker_utils as w
+
+suite = unittest.TestSuite([x.suite() for x in [a, b, br, c, e, h, j, l, n, pi, p, r, w]])
+
+if __name__ == '__main__':
+    res = unittest.TextTestRunner().run(suite)
+    sys.exit(not res.wasSuccessful())
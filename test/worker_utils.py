@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+# Copyright 2013 Ghent University
+# Copyright 2013 Stijn De Weirdt
+#
+# This file is part of VSC-tools,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://vscentrum.be/nl/en),
+# the Hercules foundation (http://www.herculesstichting.be/in_English)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/VSC-tools
+#
+# VSC-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# VSC-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with VSC-tools. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests of vsc.mympirun.scoop.worker_utils
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase, TestLoader, TestSuite
+from vsc.mympirun.scoop.worker_utils import WorkerTasks, CommandTemplate
+from vsc.mympirun.scoop.worker_utils import _parse_worker_tasks, parse_worker_args, parse_worker_tasks
+from vsc.mympirun.scoop.worker_utils import make_worker_log, close_worker_log
+
+
+class TmpdirTestCase(TestCase):
+    """TestCase with a temporary directory"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_argv = sys.argv[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        sys.argv = self.orig_argv
+
+
+class WorkerTasksTest(TmpdirTestCase):
+    """Tests for WorkerTasks and the task spec parsing"""
+
+    def test_spec(self):
+        """Lists of counters and ranges"""
+        tasks = WorkerTasks()
+        tasks.add_spec('0:3, 10:16:2,42')
+        self.assertEqual(list(tasks), [0, 1, 2, 10, 12, 14, 42])
+        self.assertEqual(len(tasks), 7)
+
+    def test_add_counter(self):
+        """Consecutive counters are merged in one range"""
+        tasks = WorkerTasks()
+        for counter in [1, 2, 3, 5, 6]:
+            tasks.add_counter(counter)
+        self.assertEqual([list(x) for x in tasks.ranges], [[1, 2, 3], [5, 6]])
+
+    def test_chunks(self):
+        """Chunks keep the step and never span ranges"""
+        tasks = WorkerTasks()
+        tasks.add_spec('0:1000:2,2000:2005')
+        chunks = tasks.chunks(10)
+        self.assertEqual(len(chunks), 51)
+        self.assertEqual(list(chunks[0]), range(0, 20, 2))
+        self.assertEqual(list(chunks[-1]), range(2000, 2005))
+        self.assertEqual([x for chunk in chunks for x in chunk], list(tasks))
+
+    def test_parse(self):
+        """Single ranges, lists and no task spec"""
+        self.assertEqual(list(_parse_worker_tasks('5')), range(5))
+        self.assertEqual(list(_parse_worker_tasks('2:8:3')), [2, 5])
+        self.assertEqual(list(_parse_worker_tasks('1,3')), [1, 3])
+        self.assertEqual(_parse_worker_tasks('echo'), None)
+        self.assertEqual(_parse_worker_tasks('1:2:3:4'), None)
+
+    def test_parse_file(self):
+        """@filename with comments and empty lines"""
+        fn = os.path.join(self.tmpdir, 'tasks')
+        open(fn, 'w').write("# tasks\n0:3\n\n7,9\n")
+        self.assertEqual(list(_parse_worker_tasks('@%s' % fn)), [0, 1, 2, 7, 9])
+
+    def test_parse_file_missing(self):
+        """A missing @filename is an error"""
+        self.assertRaises(IOError, _parse_worker_tasks, '@%s' % os.path.join(self.tmpdir, 'missing'))
+
+    def test_parse_worker_args_tasks_file(self):
+        """With a tasks file, a numeric first arg is part of the command"""
+        sys.argv = ['worker', '5', 'echo']
+        os.environ['SCOOP_TASKS'] = os.path.join(self.tmpdir, 'tasks')
+        try:
+            self.assertEqual(parse_worker_args(), ['5', 'echo'])
+            self.assertEqual(len(parse_worker_tasks()), 0)
+        finally:
+            del os.environ['SCOOP_TASKS']
+        self.assertEqual(parse_worker_args(), ['echo'])
+
+    def test_parse_worker_args(self):
+        """Executable args and the (start, stop, step) of the first range"""
+        sys.argv = ['worker', '2:20:3', 'echo', '{counter}']
+        self.assertEqual(parse_worker_args(), ['echo', '{counter}'])
+        self.assertEqual(parse_worker_args(False), (2, 20, 3))
+
+        sys.argv = ['worker', 'echo']
+        self.assertEqual(parse_worker_args(), ['echo'])
+        self.assertEqual(parse_worker_args(False), (0, 10, 1))
+
+    def test_parse_worker_args_empty_file(self):
+        """An @filename with only comments is the empty range"""
+        fn = os.path.join(self.tmpdir, 'tasks')
+        open(fn, 'w').write("# nothing to do\n")
+        sys.argv = ['worker', '@%s' % fn, 'echo']
+        self.assertEqual(len(parse_worker_tasks()), 0)
+        self.assertEqual(parse_worker_args(False), (0, 0, 1))
+
+
+class CommandTemplateTest(TestCase):
+    """Tests for CommandTemplate"""
+
+    def test_substitute(self):
+        """Known placeholders are substituted, other braces are kept"""
+        template = CommandTemplate("echo {counter} {args} ${HOME} | awk '{print $1}'")
+        self.assertEqual(template.names, set(['counter', 'args']))
+        self.assertEqual(template.substitute(counter=3, args='a b'), "echo 3 a b ${HOME} | awk '{print $1}'")
+
+    def test_no_placeholders(self):
+        """A command without placeholders is returned as is"""
+        self.assertEqual(CommandTemplate("hostname").substitute(counter=1), "hostname")
+
+
+class WorkerLogTest(TmpdirTestCase):
+    """Tests for make_worker_log"""
+
+    def setUp(self):
+        super(WorkerLogTest, self).setUp()
+        self.orig_environ = os.environ.copy()
+        os.environ['SCOOP_LOGDIR'] = self.tmpdir
+        os.environ['SCOOP_RUN_ID'] = 'test.1'
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.orig_environ)
+        super(WorkerLogTest, self).tearDown()
+
+    def test_level(self):
+        """The level is set by name, an unknown name is logged and ignored"""
+        log = make_worker_log('test_level', level='info')
+        self.assertEqual(log.level, logging.INFO)
+        close_worker_log(log)
+
+        log = make_worker_log('test_level', level='verbose')
+        self.assertEqual(log.level, logging.INFO)
+        close_worker_log(log)
+        logs = [open(os.path.join(self.tmpdir, x)).read() for x in os.listdir(self.tmpdir)]
+        self.assertTrue([x for x in logs if 'unknown loglevel verbose' in x])
+
+
+def suite():
+    """ returns all the testcases in this module """
+    return TestSuite([TestLoader().loadTestsFromTestCase(x) for x in
+                      [WorkerTasksTest, CommandTemplateTest, WorkerLogTest]])